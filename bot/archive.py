@@ -0,0 +1,55 @@
+import json
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Sequence, Tuple
+
+from models import ChatMessage
+
+ARCHIVE_FORMAT_VERSION = 1
+ARCHIVE_COMPRESSION_LEVEL = 9
+
+
+@dataclass
+class ArchiveStats:
+    blocks: int = 0
+    messages: int = 0
+    raw_bytes: int = 0
+    compressed_bytes: int = 0
+    # Reads since startup: every block touched by a range query is decompressed in full
+    blocks_read: int = 0
+    bytes_decompressed: int = 0
+
+    @property
+    def compression_ratio(self) -> float:
+        return self.raw_bytes / self.compressed_bytes if self.compressed_bytes else 0.0
+
+
+def archive_day(ts: datetime) -> datetime:
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def encode_block(day: datetime, messages: Sequence[ChatMessage]) -> Tuple[bytes, int]:
+    """
+    Compress the messages of one chat and day, returns the payload and its raw size.
+
+    Rows are stored as [user_id, username, seconds since the day started, text];
+    chat_id and the day itself live in the block row.
+    """
+    rows = [
+        [msg.user_id, msg.username, round((msg.timestamp - day).total_seconds(), 6), msg.message_text]
+        for msg in messages
+    ]
+    raw = json.dumps({'v': ARCHIVE_FORMAT_VERSION, 'rows': rows}, ensure_ascii=False, separators=(',', ':')).encode()
+    return zlib.compress(raw, ARCHIVE_COMPRESSION_LEVEL), len(raw)
+
+
+def decode_block(chat_id: int, day: datetime, payload: bytes) -> List[ChatMessage]:
+    data = json.loads(zlib.decompress(payload))
+    if data.get('v') != ARCHIVE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported archive block version: {data.get('v')}")
+
+    return [
+        ChatMessage(user_id, message_text, day + timedelta(seconds=offset), username, chat_id)
+        for user_id, username, offset, message_text in data['rows']
+    ]
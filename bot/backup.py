@@ -0,0 +1,309 @@
+import gzip
+import hashlib
+import json
+import logging
+import shutil
+import sqlite3
+import struct
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BACKUP_PAGES_PER_STEP = 1000
+BACKUP_STEP_PAUSE_SECONDS = 0.01
+MANIFEST_SUFFIX = '.pages.json'
+PAGE_RECORD = struct.Struct('>I')
+
+
+@dataclass
+class BackupResult:
+    path: Path
+    kind: str  # "full" or "incremental"
+    base: Optional[str] = None
+    page_count: int = 0
+    pages_written: int = 0
+    bytes_written: int = 0
+    steps: int = 0
+    elapsed_ms: float = 0.0
+
+
+def _open(path: Path, mode: str) -> BinaryIO:
+    return gzip.open(path, mode) if path.suffix == '.gz' else open(path, mode)
+
+
+def _page_hash(page: bytes) -> str:
+    return hashlib.blake2b(page, digest_size=8).hexdigest()
+
+
+def online_copy(
+    db_path: str,
+    dest_path: Path,
+    pages_per_step: int = BACKUP_PAGES_PER_STEP,
+    pause: float = BACKUP_STEP_PAUSE_SECONDS
+) -> int:
+    """
+    Copy a live database with the SQLite online backup API, returns the number of steps.
+
+    The copy advances `pages_per_step` pages at a time and sleeps between
+    steps. In WAL mode a read transaction is held for the whole copy: writers
+    keep committing to the WAL, the copy stays one consistent snapshot and is
+    never restarted by their commits.
+    """
+    source = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, isolation_level=None)
+    dest = sqlite3.connect(str(dest_path))
+    steps = 0
+
+    def progress(status, remaining, total):
+        nonlocal steps
+        steps += 1
+        if remaining and pause:
+            time.sleep(pause)
+
+    try:
+        wal = source.execute("PRAGMA journal_mode").fetchone()[0].lower() == 'wal'
+        if wal:
+            source.execute("BEGIN")
+            source.execute("SELECT count(*) FROM sqlite_master").fetchone()
+
+        source.backup(dest, pages=pages_per_step, progress=progress)
+
+        if wal:
+            source.execute("COMMIT")
+        # A single self-contained file, no -wal next to the backup
+        dest.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        dest.close()
+        source.close()
+
+    return steps
+
+
+def integrity_check(db_path: Path) -> bool:
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        result = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    finally:
+        conn.close()
+
+    if result != ['ok']:
+        logger.error(f"Integrity check of {db_path} failed: {'; '.join(result[:5])}")
+        return False
+    return True
+
+
+def page_hashes(db_path: Path) -> Dict:
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    finally:
+        conn.close()
+
+    hashes = []
+    with open(db_path, 'rb') as f:
+        while True:
+            page = f.read(page_size)
+            if not page:
+                break
+            hashes.append(_page_hash(page))
+
+    return {'page_size': page_size, 'page_count': len(hashes), 'hashes': hashes}
+
+
+def backup_name(db_path: str, kind: str, compress: bool, now: Optional[datetime] = None) -> str:
+    db_file = Path(db_path)
+    stamp = (now or datetime.now()).strftime('%Y%m%d_%H%M%S')
+    suffix = db_file.suffix if kind == 'full' else '.incr'
+    return f"{db_file.stem}_backup_{stamp}{suffix}" + ('.gz' if compress else '')
+
+
+def _unused_path(path: Path) -> Path:
+    # Two backups within the same second get a counter instead of overwriting each other
+    counter = 1
+    candidate = path
+    while candidate.exists():
+        name, _, suffix = path.name.partition('.')
+        candidate = path.with_name(f"{name}_{counter}.{suffix}")
+        counter += 1
+    return candidate
+
+
+def list_backup_files(backup_dir: Path, db_path: str) -> List[Path]:
+    """Backups of one database, oldest first."""
+    stem = Path(db_path).stem
+    files = [path for path in backup_dir.glob(f"{stem}_backup_*") if not path.name.endswith(MANIFEST_SUFFIX)]
+    return sorted(files, key=lambda path: path.name)
+
+
+def latest_full_backup(backup_dir: Path, db_path: str) -> Optional[Path]:
+    # Only full backups with a page manifest can be the base of an incremental one
+    fulls = [path for path in list_backup_files(backup_dir, db_path)
+             if '.incr' not in path.suffixes and Path(f"{path}{MANIFEST_SUFFIX}").exists()]
+    return fulls[-1] if fulls else None
+
+
+def create_backup(
+    db_path: str,
+    backup_dir: str = 'backups',
+    incremental: bool = False,
+    compress: bool = True,
+    pages_per_step: int = BACKUP_PAGES_PER_STEP,
+    pause: float = BACKUP_STEP_PAUSE_SECONDS
+) -> Optional[BackupResult]:
+    """
+    Back up a live database into backup_dir, returns None when it failed.
+
+    A full backup is the verified snapshot itself (gzip-compressed if asked)
+    plus a manifest of page hashes. An incremental backup only stores the
+    pages that differ from the latest full backup; without one it falls back
+    to a full backup.
+    """
+    started = time.perf_counter()
+    directory = Path(backup_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    base = latest_full_backup(directory, db_path) if incremental else None
+    if incremental and base is None:
+        logger.info("No full backup to diff against, creating a full backup")
+
+    snapshot = directory / f"{Path(db_path).stem}_snapshot.tmp"
+    try:
+        steps = online_copy(db_path, snapshot, pages_per_step, pause)
+        if not integrity_check(snapshot):
+            return None
+
+        pages = page_hashes(snapshot)
+
+        if base is not None:
+            with open(f"{base}{MANIFEST_SUFFIX}") as f:
+                base_pages = json.load(f)
+            if base_pages['page_size'] != pages['page_size']:
+                logger.info("Page size changed since the last full backup, creating a full backup")
+                base = None
+
+        if base is None:
+            target = _unused_path(directory / backup_name(db_path, 'full', compress))
+            with open(snapshot, 'rb') as src, _open(target, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            with open(f"{target}{MANIFEST_SUFFIX}", 'w') as f:
+                json.dump(pages, f)
+            result = BackupResult(target, 'full', page_count=pages['page_count'], pages_written=pages['page_count'])
+        else:
+            target = _unused_path(directory / backup_name(db_path, 'incremental', compress))
+            base_hashes = base_pages['hashes']
+            header = {'base': base.name, 'page_size': pages['page_size'], 'page_count': pages['page_count']}
+            written = 0
+            with open(snapshot, 'rb') as src, _open(target, 'wb') as dst:
+                dst.write(json.dumps(header).encode() + b'\n')
+                for number, digest in enumerate(pages['hashes']):
+                    if number < len(base_hashes) and base_hashes[number] == digest:
+                        continue
+                    src.seek(number * pages['page_size'])
+                    dst.write(PAGE_RECORD.pack(number))
+                    dst.write(src.read(pages['page_size']))
+                    written += 1
+            result = BackupResult(target, 'incremental', base=base.name,
+                                  page_count=pages['page_count'], pages_written=written)
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"Backup of {db_path} failed: {e}")
+        return None
+    finally:
+        if snapshot.exists():
+            snapshot.unlink()
+
+    result.steps = steps
+    result.bytes_written = target.stat().st_size
+    result.elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(
+        f"Created {result.kind} backup {target.name}: {result.pages_written}/{result.page_count} pages, "
+        f"{result.bytes_written} bytes in {steps} steps, {result.elapsed_ms:.0f} ms"
+    )
+    return result
+
+
+def restore_backup(backup_file: str, dest_path: str) -> bool:
+    """Rebuild a database file from a full or incremental backup and verify it."""
+    backup = Path(backup_file)
+    dest = Path(dest_path)
+
+    if '.incr' not in backup.suffixes:
+        with _open(backup, 'rb') as src, open(dest, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        return integrity_check(dest)
+
+    with _open(backup, 'rb') as src:
+        header = json.loads(src.readline())
+        base = backup.parent / header['base']
+        if not base.exists():
+            logger.error(f"Full backup {header['base']} needed by {backup.name} is missing")
+            return False
+
+        with _open(base, 'rb') as base_src, open(dest, 'wb') as dst:
+            shutil.copyfileobj(base_src, dst)
+
+        page_size = header['page_size']
+        with open(dest, 'r+b') as dst:
+            while True:
+                record = src.read(PAGE_RECORD.size)
+                if not record:
+                    break
+                (number,) = PAGE_RECORD.unpack(record)
+                dst.seek(number * page_size)
+                dst.write(src.read(page_size))
+            dst.truncate(header['page_count'] * page_size)
+
+    return integrity_check(dest)
+
+
+def prune_backups(backup_dir: str, db_path: str, keep_full: int) -> int:
+    """Keep the newest `keep_full` full backups and the incrementals based on them."""
+    directory = Path(backup_dir)
+    files = list_backup_files(directory, db_path)
+    fulls = [path for path in files if '.incr' not in path.suffixes]
+    expired = fulls[:-keep_full] if keep_full > 0 else []
+    if not expired:
+        return 0
+
+    # Everything older than the oldest kept full backup depends on an expired one
+    oldest_kept = fulls[-keep_full].name if keep_full > 0 else None
+    removed = 0
+    for path in files:
+        if oldest_kept is not None and path.name >= oldest_kept:
+            break
+        manifest = Path(f"{path}{MANIFEST_SUFFIX}")
+        if manifest.exists():
+            manifest.unlink()
+        path.unlink()
+        removed += 1
+    if removed:
+        logger.info(f"Removed {removed} old backups from {directory}")
+    return removed
+
+
+def run_scheduled_backup(
+    db_path: str,
+    backup_dir: str,
+    full_every: int,
+    keep_full: int,
+    compress: bool = True,
+    pages_per_step: int = BACKUP_PAGES_PER_STEP
+) -> Optional[BackupResult]:
+    """One run of the in-bot backup job: incremental, full every `full_every` runs."""
+    directory = Path(backup_dir)
+    base = latest_full_backup(directory, db_path) if directory.exists() else None
+    incrementals_since_base = 0
+    if base is not None:
+        incrementals_since_base = sum(
+            1 for path in list_backup_files(directory, db_path)
+            if '.incr' in path.suffixes and path.name > base.name
+        )
+
+    incremental = base is not None and incrementals_since_base + 1 < max(full_every, 1)
+    result = create_backup(db_path, backup_dir, incremental=incremental, compress=compress,
+                           pages_per_step=pages_per_step)
+    if result is not None and result.kind == 'full':
+        prune_backups(backup_dir, db_path, keep_full)
+    return result
@@ -0,0 +1,121 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional, Set
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+    expirations: int = 0
+    entries: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class LRUCache:
+    """
+    Bounded least-recently-used cache with tag-based invalidation.
+
+    Every entry belongs to one tag (e.g. a chat and the table it was read
+    from); a write invalidates the whole tag. Readers take the tag's version
+    before they query the database and pass it to put(), so a result read
+    before a concurrent write is never stored after it. With a `ttl` entries
+    also expire that many seconds after they were stored. Values must not be
+    None, get() returns None on a miss.
+    """
+
+    def __init__(self, max_entries: int, ttl: Optional[float] = None) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._tags: Dict[Hashable, Hashable] = {}
+        self._keys_by_tag: Dict[Hashable, Set[Hashable]] = {}
+        self._versions: Dict[Hashable, int] = {}
+        self._expires: Dict[Hashable, float] = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        value = self._entries.get(key)
+        if value is None:
+            self._misses += 1
+            return None
+
+        if self.ttl is not None and self._expires[key] <= time.monotonic():
+            del self._entries[key]
+            self._forget(key)
+            self._expirations += 1
+            self._misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return value
+
+    def version(self, tag: Hashable) -> int:
+        return self._versions.get(tag, 0)
+
+    def put(self, key: Hashable, value: Any, tag: Hashable, version: int) -> None:
+        if self.max_entries <= 0 or self._versions.get(tag, 0) != version:
+            return
+
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        self._tags[key] = tag
+        self._keys_by_tag.setdefault(tag, set()).add(key)
+        if self.ttl is not None:
+            self._expires[key] = time.monotonic() + self.ttl
+
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self._forget(evicted)
+            self._evictions += 1
+
+    def update(self, key: Hashable, fn: Callable[[Any], Any], tag: Hashable) -> None:
+        """Apply a write to a cached value in place, if it is cached."""
+        # Readers still in flight for this tag must not store what they read before the write
+        self._versions[tag] = self._versions.get(tag, 0) + 1
+        if key in self._entries:
+            self._entries[key] = fn(self._entries[key])
+
+    def invalidate(self, tag: Hashable) -> None:
+        self._versions[tag] = self._versions.get(tag, 0) + 1
+        for key in self._keys_by_tag.pop(tag, ()):
+            self._entries.pop(key, None)
+            self._tags.pop(key, None)
+            self._expires.pop(key, None)
+            self._invalidations += 1
+
+    def clear(self) -> None:
+        for tag in list(self._keys_by_tag):
+            self.invalidate(tag)
+
+    def _forget(self, key: Hashable) -> None:
+        self._expires.pop(key, None)
+        tag = self._tags.pop(key, None)
+        keys = self._keys_by_tag.get(tag)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_tag[tag]
+
+    @property
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            hits=self._hits,
+            misses=self._misses,
+            evictions=self._evictions,
+            invalidations=self._invalidations,
+            expirations=self._expirations,
+            entries=len(self._entries)
+        )
@@ -25,10 +25,81 @@ class Config:
     SPEECHKIT_LANGUAGE: str = os.getenv("SPEECHKIT_LANGUAGE", "ru-RU")
 
     DB_PATH: str = os.getenv("DB_PATH", "data/messages.db")
+    # Connections per process when DB_PATH is a postgres:// URL
+    POSTGRES_POOL_SIZE: int = int(os.getenv("POSTGRES_POOL_SIZE", "10"))
+
+    # Legacy messages migrated with chat_id = 0: "auto" shows them in every chat while
+    # any exist, "include"/"exclude" force the behaviour
+    LEGACY_CHAT_ROWS: Literal["auto", "include", "exclude"] = os.getenv("LEGACY_CHAT_ROWS", "auto")  # type: ignore
+
+    # Write-behind ingestion: buffer messages in memory and insert them in batches
+    WRITE_BEHIND_ENABLED: bool = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() == "true"
+    WRITE_BEHIND_BATCH_SIZE: int = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "100"))
+    WRITE_BEHIND_FLUSH_MS: int = int(os.getenv("WRITE_BEHIND_FLUSH_MS", "500"))
+
+    # Aggregate profanity counter deltas in memory and upsert them every N seconds (0 = write immediately)
+    PROFANITY_FLUSH_SECONDS: float = float(os.getenv("PROFANITY_FLUSH_SECONDS", "0"))
+
+    # Keep the last MAX_SUMMARY_HOURS of every chat in memory, capped at N MiB (0 = disabled)
+    HOT_WINDOW_MB: float = float(os.getenv("HOT_WINDOW_MB", "0"))
+
+    # Cached /tox, /mytox and /quizstats results, invalidated by writes (0 = disabled)
+    STATS_CACHE_ENTRIES: int = int(os.getenv("STATS_CACHE_ENTRIES", "1024"))
+
+    # Generated summaries reused until a new message arrives or N seconds pass (0 entries = disabled);
+    # with SUMMARY_CACHE_PERSIST they are also kept in the summaries table across restarts
+    SUMMARY_CACHE_ENTRIES: int = int(os.getenv("SUMMARY_CACHE_ENTRIES", "256"))
+    SUMMARY_CACHE_TTL_SECONDS: float = float(os.getenv("SUMMARY_CACHE_TTL_SECONDS", "1800"))
+    SUMMARY_CACHE_PERSIST: bool = os.getenv("SUMMARY_CACHE_PERSIST", "false").lower() == "true"
+
+    # /summary strategy: flat (whole history in one prompt), hierarchical (stored per-chunk
+    # summaries of closed SUMMARY_CHUNK_HOURS chunks plus the raw messages of the open one)
+    # or map_reduce (SUMMARY_CHUNK_TOKENS sized parts summarized concurrently, then combined)
+    SUMMARY_MODE: str = os.getenv("SUMMARY_MODE", "flat")
+    SUMMARY_CHUNK_HOURS: int = int(os.getenv("SUMMARY_CHUNK_HOURS", "1"))
+    # Estimated tokens of history per LLM call in map_reduce mode
+    SUMMARY_CHUNK_TOKENS: int = int(os.getenv("SUMMARY_CHUNK_TOKENS", "8000"))
+    # LLM calls one /summary may run at once for its chunks, within the LLM_MAX_CONCURRENCY of all chats
+    SUMMARY_MAX_CONCURRENCY: int = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "4"))
+
+    # LLM calls of all chats together: at most N at once and about N tokens per minute
+    # (0 = no token limit); at most LLM_MAX_QUEUE wait, /summary answers "busy" beyond that
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+    LLM_TOKENS_PER_MINUTE: int = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+    LLM_MAX_QUEUE: int = int(os.getenv("LLM_MAX_QUEUE", "32"))
+
+    # SQLite storage profile (applied to every connection)
+    SQLITE_JOURNAL_MODE: str = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_CACHE_SIZE: int = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # negative = KiB, i.e. 64 MiB
+    SQLITE_MMAP_SIZE: int = int(os.getenv("SQLITE_MMAP_SIZE", "268435456"))  # 256 MiB
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_READ_POOL_SIZE: int = int(os.getenv("SQLITE_READ_POOL_SIZE", "4"))
+    # NONE / FULL / INCREMENTAL; only applies to new databases (existing ones need a VACUUM)
+    SQLITE_AUTO_VACUUM: str = os.getenv("SQLITE_AUTO_VACUUM", "INCREMENTAL")
+
+    # Retention cleanup: rows per DELETE transaction, seconds per run, pages per incremental_vacuum step
+    CLEANUP_BATCH_SIZE: int = int(os.getenv("CLEANUP_BATCH_SIZE", "1000"))
+    CLEANUP_TIME_BUDGET_SECONDS: float = float(os.getenv("CLEANUP_TIME_BUDGET_SECONDS", "30"))
+    CLEANUP_VACUUM_PAGES: int = int(os.getenv("CLEANUP_VACUUM_PAGES", "1000"))
+    # Store new messages in one table per day / week / month, retention drops whole tables (none = single table)
+    MESSAGE_PARTITION_PERIOD: str = os.getenv("MESSAGE_PARTITION_PERIOD", "none")
+    # Move expired messages into compressed per-chat, per-day blocks instead of deleting them
+    MESSAGE_ARCHIVE_ENABLED: bool = os.getenv("MESSAGE_ARCHIVE_ENABLED", "false").lower() == "true"
+
+    # Scheduled online backups every N hours (0 = disabled); incremental, with a full one every N runs
+    BACKUP_INTERVAL_HOURS: float = float(os.getenv("BACKUP_INTERVAL_HOURS", "0"))
+    BACKUP_DIR: str = os.getenv("BACKUP_DIR", "data/backups")
+    BACKUP_FULL_EVERY: int = int(os.getenv("BACKUP_FULL_EVERY", "7"))
+    BACKUP_KEEP_FULL: int = int(os.getenv("BACKUP_KEEP_FULL", "4"))
+    BACKUP_COMPRESS: bool = os.getenv("BACKUP_COMPRESS", "true").lower() == "true"
+    BACKUP_PAGES_PER_STEP: int = int(os.getenv("BACKUP_PAGES_PER_STEP", "1000"))
 
     DEFAULT_SUMMARY_HOURS: int = int(os.getenv("DEFAULT_SUMMARY_HOURS", "24"))
     MAX_SUMMARY_HOURS: int = int(os.getenv("MAX_SUMMARY_HOURS", "168"))  # 7 days
     MESSAGE_CLEANUP_DAYS: int = int(os.getenv("MESSAGE_CLEANUP_DAYS", "30"))
+    # Only offer members seen within N days to /who and /whosaid (0 = everyone ever seen)
+    PARTICIPANT_ACTIVE_DAYS: int = int(os.getenv("PARTICIPANT_ACTIVE_DAYS", "0"))
 
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
 
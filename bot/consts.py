@@ -9,4 +9,17 @@ ANIME_TAGS = {
     "nsfw": ["waifu", "neko", "blowjob"]
 }
 
-NSFW_EMOJI_TRIGGERS = {'🥵', '😈', '💋', '🍌', '🍑', '🍆'}
\ No newline at end of file
+NSFW_EMOJI_TRIGGERS = {'🥵', '😈', '💋', '🍌', '🍑', '🍆'}
+# Stored instead of the image itself when someone sends a photo
+PHOTO_PLACEHOLDER_TEXT = "(прислал какое-то изображение)"
+
+# Shorter messages are too ambiguous to be used in /whosaid
+QUIZ_MIN_MESSAGE_LENGTH = 20
+
+# Match markers in search snippets; control characters never occur in chat text
+SNIPPET_OPEN = '\x02'
+SNIPPET_CLOSE = '\x03'
+
+# Same text format SQLAlchemy uses for DateTime on SQLite, truncated to the hour,
+# so buckets built in SQL compare equal to buckets bound from Python
+SQLITE_HOUR_FORMAT = '%Y-%m-%d %H:00:00.000000'
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CounterKey = Tuple[int, int]  # (chat_id, user_id)
+
+
+class CounterBuffer:
+    """
+    In-memory aggregation of per-(chat, user) counter deltas.
+
+    Deltas are summed locally and handed to ``flush_callback`` as one list of
+    rows every ``flush_interval`` seconds. Rows that are being flushed stay
+    visible through ``pending`` until the callback returns, and readers that
+    merge pending deltas into stored values should hold ``lock`` so they never
+    observe a flush half-way.
+    """
+
+    def __init__(
+        self,
+        flush_callback: Callable[[List[Dict]], Awaitable[None]],
+        flush_interval: float = 5.0
+    ):
+        self._flush_callback = flush_callback
+        self.flush_interval = flush_interval
+        self._deltas: Dict[CounterKey, Dict] = {}
+        self._inflight: Dict[CounterKey, Dict] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stop = asyncio.Event()
+        self.lock = asyncio.Lock()
+        self.flush_count = 0
+        self.flushed_rows = 0
+
+    def __len__(self) -> int:
+        return len(self._deltas) + len(self._inflight)
+
+    def add(self, chat_id: int, user_id: int, username: Optional[str], count: int) -> None:
+        key = (chat_id, user_id)
+        entry = self._deltas.get(key)
+        if entry is None:
+            self._deltas[key] = {
+                'chat_id': chat_id,
+                'user_id': user_id,
+                'username': username,
+                'count': count,
+                'last_updated': datetime.now(),
+            }
+        else:
+            entry['count'] += count
+            entry['username'] = username
+            entry['last_updated'] = datetime.now()
+
+    def pending(self, chat_id: int, user_id: int) -> int:
+        key = (chat_id, user_id)
+        return sum(entries[key]['count'] for entries in (self._inflight, self._deltas) if key in entries)
+
+    def pending_for_chat(self, chat_id: int) -> Dict[int, Dict]:
+        merged: Dict[int, Dict] = {}
+        for entries in (self._inflight, self._deltas):
+            for (c, user_id), entry in entries.items():
+                if c != chat_id:
+                    continue
+                if user_id in merged:
+                    merged[user_id] = {**entry, 'count': merged[user_id]['count'] + entry['count']}
+                else:
+                    merged[user_id] = dict(entry)
+        return merged
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._stop.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Counter flush failed, will retry: {e}", exc_info=True)
+
+    async def flush(self) -> int:
+        async with self.lock:
+            if not self._deltas:
+                return 0
+
+            # Deltas added while the flush is running go into a fresh dict
+            self._inflight, self._deltas = self._deltas, {}
+            rows = list(self._inflight.values())
+            try:
+                await self._flush_callback(rows)
+            except BaseException:
+                # Also when cancelled, the deltas must not be dropped
+                for key, entry in self._inflight.items():
+                    newer = self._deltas.get(key)
+                    if newer is not None:
+                        entry['count'] += newer['count']
+                        entry['username'] = newer['username']
+                        entry['last_updated'] = newer['last_updated']
+                    self._deltas[key] = entry
+                raise
+            finally:
+                self._inflight = {}
+
+            self.flush_count += 1
+            self.flushed_rows += len(rows)
+            logger.debug(f"Flushed {len(rows)} aggregated counter rows")
+            return len(rows)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            # Let a running flush finish instead of cancelling it halfway
+            self._stop.set()
+            await self._task
+            self._task = None
+
+        await self.flush()
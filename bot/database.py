@@ -1,32 +1,294 @@
+import asyncio
 import logging
+import random
+import re
+import time
+from dataclasses import dataclass, replace
 from datetime import datetime, timedelta
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine, AsyncSession
-from sqlalchemy import select, func, delete, inspect
-from typing import List, Optional
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine, AsyncEngine, AsyncSession
+from sqlalchemy import select, func, delete, insert, update, inspect, event, literal_column, text, union_all, Table
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
-from models import ChatMessage, Message, ProfanityStat, QuizScore, Base
+from archive import ArchiveStats, archive_day, decode_block, encode_block
+from cache import CacheStats, LRUCache
+from config import Config
+from consts import PHOTO_PLACEHOLDER_TEXT, QUIZ_MIN_MESSAGE_LENGTH, SNIPPET_CLOSE, SNIPPET_OPEN, SQLITE_HOUR_FORMAT
+from counter_buffer import CounterBuffer
+from games import is_quiz_eligible
+from hot_window import HotWindowCache, HotWindowStats
+from migrations import MIGRATIONS
+from models import (
+    ActivityHourly, ArchiveBlock, ChatMessage, ChatParticipant, MaintenanceState, Message, MessageBatch, MessageIngest,
+    MessagePartition, ProfanityStat, QuizCandidate, QuizScore, SchemaVersion, SearchResult, StoredSummary, ChunkSummary, Base
+)
+from participants import Participant, ParticipantCache
+from partitions import PARTITION_PERIODS, Partition, partition_name, period_end, period_start
+from storage import SEARCH_PAGE_SIZE, CleanupStats, Storage, truncate_to_hour
+from write_queue import WriteBehindQueue, WriteQueueStats
 
 logger = logging.getLogger(__name__)
 
 
-class Database:
-    def __init__(self, db_path: str = "data/messages.db"):
+# Rows per multi-row INSERT, well below SQLite's bound-parameter limit
+UPSERT_CHUNK_SIZE = 500
+
+
+
+# Rows fetched per round trip when streaming history
+STREAM_CHUNK_SIZE = 500
+# Estimated bytes per cached message besides its text, used to plan the hot window warm-up
+HOT_WINDOW_ROW_OVERHEAD = 200
+
+# Random id probes per quiz pick before giving up on a sparse pool
+QUIZ_SAMPLE_ATTEMPTS = 5
+
+# Full-text index over messages.message_text (external content, rowid = messages.id)
+SEARCH_TABLE = 'messages_fts'
+# Message ids in (checkpoint, high water] exist but are not indexed yet
+SEARCH_CHECKPOINT_KEY = 'search_index_checkpoint'
+SEARCH_HIGH_WATER_KEY = 'search_index_high_water'
+SEARCH_INDEX_BATCH_SIZE = 5000
+
+# Highest id handed out by a dropped partition; sqlite_sequence forgets it with the table,
+# and reused ids would let summaries cached by last message id match new messages
+MESSAGE_ID_HIGH_WATER_KEY = 'message_id_high_water'
+
+# Triggers only touch rows that are indexed, the pending range is left to index_search_backlog
+_SEARCH_INDEXED = f"""NOT EXISTS (
+    SELECT 1 FROM maintenance_state lo JOIN maintenance_state hi
+      ON lo.key = '{SEARCH_CHECKPOINT_KEY}' AND hi.key = '{SEARCH_HIGH_WATER_KEY}'
+    WHERE {{row}}.id > CAST(lo.value AS INTEGER) AND {{row}}.id <= CAST(hi.value AS INTEGER)
+)"""
+
+# Partitions are indexed from the moment they are created, their triggers need no pending check
+PARTITION_SEARCH_DDL = [
+    """CREATE TRIGGER {name}_fts_insert AFTER INSERT ON {name}
+    BEGIN
+        INSERT INTO {name}_fts(rowid, message_text) VALUES (new.id, new.message_text);
+    END""",
+    """CREATE TRIGGER {name}_fts_delete AFTER DELETE ON {name}
+    BEGIN
+        INSERT INTO {name}_fts({name}_fts, rowid, message_text) VALUES ('delete', old.id, old.message_text);
+    END""",
+    """CREATE TRIGGER {name}_fts_update AFTER UPDATE OF message_text ON {name}
+    BEGIN
+        INSERT INTO {name}_fts({name}_fts, rowid, message_text) VALUES ('delete', old.id, old.message_text);
+        INSERT INTO {name}_fts(rowid, message_text) VALUES (new.id, new.message_text);
+    END""",
+]
+
+SEARCH_DDL = [
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert AFTER INSERT ON messages
+    WHEN {_SEARCH_INDEXED.format(row='new')}
+    BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, message_text) VALUES (new.id, new.message_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete AFTER DELETE ON messages
+    WHEN {_SEARCH_INDEXED.format(row='old')}
+    BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, message_text) VALUES ('delete', old.id, old.message_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update AFTER UPDATE OF message_text ON messages
+    WHEN {_SEARCH_INDEXED.format(row='old')}
+    BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, message_text) VALUES ('delete', old.id, old.message_text);
+        INSERT INTO {SEARCH_TABLE}(rowid, message_text) VALUES (new.id, new.message_text);
+    END""",
+]
+
+
+# Pause between cleanup batches so queued ingest writes get the writer connection
+CLEANUP_BATCH_PAUSE_SECONDS = 0.05
+
+
+def search_match_expression(query: str) -> Optional[str]:
+    """Turn free user input into an FTS5 query: every word as a quoted prefix term."""
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def quiz_eligible_clause(text_column):
+    # SQL twin of games.is_quiz_eligible, used to rebuild the pool from history
+    return (
+        (func.length(text_column) >= QUIZ_MIN_MESSAGE_LENGTH)
+        & ~text_column.startswith('/', autoescape=True)
+        & (text_column != PHOTO_PLACEHOLDER_TEXT)
+    )
+
+
+class Database(Storage):
+    def __init__(
+        self,
+        db_path: str = "data/messages.db",
+        write_behind: Optional[bool] = None,
+        profanity_flush_seconds: Optional[float] = None,
+        hot_window_mb: Optional[float] = None,
+        stats_cache_entries: Optional[int] = None,
+        partition_period: Optional[str] = None,
+        archive_enabled: Optional[bool] = None
+    ):
         if not db_path.startswith("sqlite"):
             db_url = f"sqlite+aiosqlite:///{db_path}"
         else:
             db_url = db_path
 
         self.db_url = db_url
+        self.db_file = make_url(db_url).database
+
+        # All writes go through a single pooled connection, so they are serialized
+        # in-process instead of fighting over the SQLite write lock
         self.async_engine = create_async_engine(
             url=db_url,
             echo=False,  # Set to True for SQL query logging
+            **self._pool_options(db_url, pool_size=1)
         )
+        self._apply_storage_profile(self.async_engine, read_only=False)
+
         self.async_session = async_sessionmaker(
             self.async_engine,
             expire_on_commit=False,
             class_=AsyncSession
         )
 
+        # In WAL mode readers never block the writer (and vice versa), so reads
+        # get their own pool of read-only connections. In-memory databases cannot
+        # be shared between connections and keep using the writer engine.
+        if self._is_file_database():
+            self.read_engine = create_async_engine(
+                url=f"sqlite+aiosqlite:///file:{self.db_file}?mode=ro&uri=true",
+                echo=False,
+                **self._pool_options(db_url, pool_size=Config.SQLITE_READ_POOL_SIZE)
+            )
+            self._apply_storage_profile(self.read_engine, read_only=True)
+        else:
+            self.read_engine = self.async_engine
+
+        self.read_session = async_sessionmaker(
+            self.read_engine,
+            expire_on_commit=False,
+            class_=AsyncSession
+        )
+
+        if write_behind is None:
+            write_behind = Config.WRITE_BEHIND_ENABLED
+
+        self.write_queue: Optional[WriteBehindQueue[MessageIngest]] = None
+        if write_behind:
+            self.write_queue = WriteBehindQueue(
+                self._apply_ingest,
+                batch_size=Config.WRITE_BEHIND_BATCH_SIZE,
+                flush_interval_ms=Config.WRITE_BEHIND_FLUSH_MS
+            )
+
+        if profanity_flush_seconds is None:
+            profanity_flush_seconds = Config.PROFANITY_FLUSH_SECONDS
+
+        self.profanity_buffer: Optional[CounterBuffer] = None
+        if profanity_flush_seconds > 0:
+            self.profanity_buffer = CounterBuffer(
+                self._flush_profanity_buffer,
+                flush_interval=profanity_flush_seconds
+            )
+
+        # Last username written to the stats tables per (chat_id, user_id), so the
+        # ingest path only issues a refresh when a display name actually changes
+        self._known_usernames: Dict[Tuple[int, int], Optional[str]] = {}
+
+        self.participants = ParticipantCache()
+
+        if stats_cache_entries is None:
+            stats_cache_entries = Config.STATS_CACHE_ENTRIES
+
+        # Results of the leaderboard and per-user counter reads, per chat. The
+        # write paths invalidate a chat's leaderboards and adjust cached
+        # per-user counts in place.
+        self.stats_cache = LRUCache(max_entries=stats_cache_entries)
+
+        if hot_window_mb is None:
+            hot_window_mb = Config.HOT_WINDOW_MB
+
+        self.hot_window: Optional[HotWindowCache] = None
+        if hot_window_mb > 0:
+            self.hot_window = HotWindowCache(
+                hours=Config.MAX_SUMMARY_HOURS,
+                max_bytes=int(hot_window_mb * 1024 * 1024)
+            )
+
+        # Resolved against the data in init_db when LEGACY_CHAT_ROWS is "auto"
+        self.include_legacy_rows = Config.LEGACY_CHAT_ROWS != "exclude"
+
+        # Set in init_db once the FTS5 index and its triggers exist
+        self.search_enabled = False
+
+        if partition_period is None:
+            partition_period = Config.MESSAGE_PARTITION_PERIOD
+        if partition_period not in PARTITION_PERIODS:
+            raise ValueError(f"MESSAGE_PARTITION_PERIOD must be one of {', '.join(PARTITION_PERIODS)}")
+        self.partition_period = partition_period
+
+        # Time partitions in start order, loaded in init_db; rows written before
+        # partitioning was enabled stay in the messages table
+        self.partitions: List[Partition] = []
+
+        if archive_enabled is None:
+            archive_enabled = Config.MESSAGE_ARCHIVE_ENABLED
+        self.archive_enabled = archive_enabled
+
+        # Newest archived timestamp, loaded in init_db; reads starting after it skip the archive
+        self._archive_high_water: Optional[datetime] = None
+        self._archive_blocks_read = 0
+        self._archive_bytes_decompressed = 0
+
+    def _is_file_database(self) -> bool:
+        return bool(self.db_file) and self.db_file != ":memory:" and not self.db_file.startswith("file:")
+
+    def _chat_scope(self, column, chat_id: int):
+        if not self.include_legacy_rows:
+            return column == chat_id
+        return column.in_(self._chat_scope_ids(chat_id))
+
+    def _chat_scope_ids(self, chat_id: int) -> List[int]:
+        # Rows saved before chat_id existed were migrated with chat_id = 0 and are
+        # shown in every chat until scripts/backfill_legacy_chat_id.py assigns them
+        if not self.include_legacy_rows:
+            return [chat_id]
+        return [chat_id, 0]
+
+    async def _has_legacy_rows(self) -> bool:
+        async with self.read_session() as session:
+            stmt = select(literal_column('1')).select_from(Message).where(Message.chat_id == 0).limit(1)
+            return (await session.execute(stmt)).first() is not None
+
+    @staticmethod
+    def _pool_options(db_url: str, pool_size: int) -> Dict:
+        if ":memory:" in db_url:
+            return {}
+        return {"pool_size": max(1, pool_size), "max_overflow": 0}
+
+    @staticmethod
+    def _apply_storage_profile(engine: AsyncEngine, read_only: bool) -> None:
+        @event.listens_for(engine.sync_engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute(f"PRAGMA busy_timeout = {int(Config.SQLITE_BUSY_TIMEOUT_MS)}")
+            if read_only:
+                cursor.execute("PRAGMA query_only = ON")
+            else:
+                # Only takes effect on a new database, before its first table is created
+                cursor.execute(f"PRAGMA auto_vacuum = {Config.SQLITE_AUTO_VACUUM}")
+                # journal_mode is persistent in the database file, set it from the writer
+                cursor.execute(f"PRAGMA journal_mode = {Config.SQLITE_JOURNAL_MODE}")
+            cursor.execute(f"PRAGMA synchronous = {Config.SQLITE_SYNCHRONOUS}")
+            cursor.execute(f"PRAGMA cache_size = {int(Config.SQLITE_CACHE_SIZE)}")
+            cursor.execute(f"PRAGMA mmap_size = {int(Config.SQLITE_MMAP_SIZE)}")
+            cursor.execute("PRAGMA temp_store = MEMORY")
+            cursor.close()
+
     async def validate_schema(self) -> bool:
         async with self.async_engine.connect() as conn:
             def check_schema(connection):
@@ -45,8 +307,8 @@ class Database:
                         f"{'='*60}\n"
                         f"Missing required columns: {', '.join(missing_columns)}\n\n"
                         f"This usually happens after updating to a new version.\n"
-                        f"You need to run the migration script:\n\n"
-                        f"  python scripts/migrate_add_chat_id.py\n\n"
+                        f"You need to run the migrations:\n\n"
+                        f"  python scripts/migrate.py\n\n"
                         f"IMPORTANT: Backup your database first:\n\n"
                         f"  python scripts/backup_db.py\n\n"
                         f"For more information, see CLAUDE.md - Database Migration section.\n"
@@ -60,31 +322,726 @@ class Database:
 
     async def init_db(self) -> None:
         async with self.async_engine.begin() as conn:
+            fresh = not await conn.run_sync(lambda sync_conn: inspect(sync_conn).has_table('messages'))
             await conn.run_sync(Base.metadata.create_all)
 
         await self.validate_schema()
+        await self._check_schema_version(fresh)
+        await self._load_partitions()
+        await self._load_archive_high_water()
+
+        if Config.LEGACY_CHAT_ROWS == "auto":
+            self.include_legacy_rows = await self._has_legacy_rows()
+        if self.include_legacy_rows:
+            logger.warning(
+                "Legacy messages with chat_id = 0 are shown in every chat; "
+                "run scripts/backfill_legacy_chat_id.py to assign them"
+            )
+
+        await self._ensure_search_index()
+        await self._check_auto_vacuum()
+
+        if self.hot_window is not None:
+            await self.warm_hot_window()
+
+        if self.write_queue is not None:
+            self.write_queue.start()
+            logger.info(
+                f"Write-behind ingestion enabled (batch size {self.write_queue.batch_size}, "
+                f"flush interval {Config.WRITE_BEHIND_FLUSH_MS} ms)"
+            )
+
+        if self.profanity_buffer is not None:
+            self.profanity_buffer.start()
+            logger.info(f"Profanity counter aggregation enabled (flush every {self.profanity_buffer.flush_interval}s)")
 
         logger.info("Database initialized successfully")
 
-    async def save_message(
+    async def _check_auto_vacuum(self) -> None:
+        if not self._is_file_database() or Config.SQLITE_AUTO_VACUUM.upper() != "INCREMENTAL":
+            return
+
+        async with self.async_engine.connect() as conn:
+            mode = (await conn.execute(text("PRAGMA auto_vacuum"))).scalar()
+        if mode != 2:
+            logger.warning(
+                "Database was created without auto_vacuum = INCREMENTAL, cleanup cannot shrink the file; "
+                f"convert it with the bot stopped: sqlite3 {self.db_file} \"PRAGMA auto_vacuum = INCREMENTAL; VACUUM;\""
+            )
+
+    async def _ensure_search_index(self) -> None:
+        async with self.async_engine.begin() as conn:
+            exists = (await conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': SEARCH_TABLE}
+            )).first()
+
+            if not exists:
+                try:
+                    await conn.execute(text(
+                        f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+                        f"message_text, content='messages', content_rowid='id', "
+                        f"tokenize='unicode61 remove_diacritics 2')"
+                    ))
+                except OperationalError as e:
+                    logger.warning(f"Full-text search unavailable, /search is disabled: {e}")
+                    self.search_enabled = False
+                    return
+
+                # Existing rows are indexed in batches by scripts/rebuild_search_index.py
+                high_water = (await conn.execute(select(func.max(Message.id)))).scalar()
+                if high_water:
+                    await self._mark_search_pending(conn, high_water)
+
+            for statement in SEARCH_DDL:
+                await conn.execute(text(statement))
+
+        self.search_enabled = True
+
+        pending = await self.get_search_backlog()
+        if pending:
+            logger.warning(
+                f"{pending} messages are not in the search index yet; "
+                f"run scripts/rebuild_search_index.py to index them"
+            )
+
+    @staticmethod
+    async def _mark_search_pending(conn, high_water: int) -> None:
+        for key, value in ((SEARCH_CHECKPOINT_KEY, 0), (SEARCH_HIGH_WATER_KEY, high_water)):
+            stmt = sqlite_insert(MaintenanceState).values(key=key, value=str(value))
+            await conn.execute(stmt.on_conflict_do_update(
+                index_elements=[MaintenanceState.key],
+                set_={'value': stmt.excluded.value}
+            ))
+
+    @staticmethod
+    async def _get_search_pending_range(conn) -> Optional[Tuple[int, int]]:
+        rows = dict((await conn.execute(
+            select(MaintenanceState.key, MaintenanceState.value).where(
+                MaintenanceState.key.in_([SEARCH_CHECKPOINT_KEY, SEARCH_HIGH_WATER_KEY])
+            )
+        )).all())
+        if len(rows) < 2:
+            return None
+        return int(rows[SEARCH_CHECKPOINT_KEY]), int(rows[SEARCH_HIGH_WATER_KEY])
+
+    async def get_search_backlog(self) -> int:
+        """Number of existing messages that are not in the search index yet."""
+        async with self.read_engine.connect() as conn:
+            pending = await self._get_search_pending_range(conn)
+            if pending is None:
+                return 0
+            low, high = pending
+            return (await conn.execute(
+                select(func.count()).select_from(Message).where(Message.id > low, Message.id <= high)
+            )).scalar()
+
+    async def reset_search_index(self) -> None:
+        """
+        Empty the index and mark every stored message as pending.
+
+        Partition indexes have no pending range, each is rebuilt from its
+        partition in one transaction instead (and created if it is missing).
+        """
+        async with self.async_engine.begin() as conn:
+            await conn.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('delete-all')"))
+            high_water = (await conn.execute(select(func.max(Message.id)))).scalar()
+            if high_water:
+                await self._mark_search_pending(conn, high_water)
+
+        for partition in self.partitions:
+            async with self.async_engine.begin() as conn:
+                exists = (await conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                    {'name': partition.search_table}
+                )).first()
+                if not exists:
+                    await self._create_partition_search_index(conn, partition)
+                await conn.execute(text(
+                    f"INSERT INTO {partition.search_table}({partition.search_table}) VALUES ('rebuild')"
+                ))
+            logger.info(f"Search index of partition {partition.name} rebuilt")
+
+    async def index_search_backlog(
+        self,
+        batch_size: int = SEARCH_INDEX_BATCH_SIZE,
+        pause: float = 0.0
+    ) -> int:
+        """Index pending messages in short transactions, returns the number indexed."""
+        indexed = 0
+
+        while True:
+            async with self.async_engine.begin() as conn:
+                pending = await self._get_search_pending_range(conn)
+                if pending is None:
+                    break
+                low, high = pending
+
+                batch_end = (await conn.execute(
+                    select(func.max(literal_column('id'))).select_from(
+                        select(Message.id).where(Message.id > low, Message.id <= high)
+                        .order_by(Message.id).limit(batch_size).subquery()
+                    )
+                )).scalar()
+
+                if batch_end is None:
+                    # Range exhausted: from now on the triggers cover every row
+                    await conn.execute(delete(MaintenanceState).where(
+                        MaintenanceState.key.in_([SEARCH_CHECKPOINT_KEY, SEARCH_HIGH_WATER_KEY])
+                    ))
+                    break
+
+                result = await conn.execute(
+                    text(
+                        f"INSERT INTO {SEARCH_TABLE}(rowid, message_text) "
+                        f"SELECT id, message_text FROM messages WHERE id > :low AND id <= :high"
+                    ),
+                    {'low': low, 'high': batch_end}
+                )
+                await conn.execute(
+                    update(MaintenanceState).where(MaintenanceState.key == SEARCH_CHECKPOINT_KEY)
+                    .values(value=str(batch_end))
+                )
+                indexed += result.rowcount
+
+            logger.info(f"Search index: {indexed} messages indexed (up to id {batch_end} of {high})")
+            if pause:
+                await asyncio.sleep(pause)
+
+        return indexed
+
+    async def search_messages(
         self,
-        user_id: int,
-        username: str,
-        message_text: str,
         chat_id: int,
-        ts: Optional[datetime] = None
-    ) -> None:
+        query: str,
+        limit: int = SEARCH_PAGE_SIZE,
+        offset: int = 0
+    ) -> List[SearchResult]:
+        match = search_match_expression(query)
+        if match is None or not self.search_enabled:
+            return []
+
+        scope = "m.chat_id IN (:chat_id, 0)" if self.include_legacy_rows else "m.chat_id = :chat_id"
+        # The messages table has its own index and every partition one more; bm25 ranks are merged
+        indexes = [(SEARCH_TABLE, 'messages')] + [(p.search_table, p.name) for p in self.partitions]
+        arms = " UNION ALL ".join(
+            f"""SELECT m.id AS id, m.user_id AS user_id, m.username AS username, m.timestamp AS timestamp,
+                       snippet({fts}, 0, :open, :close, '…', 16) AS snippet, {fts}.rank AS rank
+                FROM {fts}
+                JOIN {content} m ON m.id = {fts}.rowid
+                WHERE {fts} MATCH :match AND {scope}"""
+            for fts, content in indexes
+        )
+        stmt = text(f"""
+            SELECT id, user_id, username, timestamp, snippet FROM ({arms})
+            ORDER BY rank, id DESC
+            LIMIT :limit OFFSET :offset
+        """).columns(timestamp=Message.timestamp.type)
+
+        async with self.read_engine.connect() as conn:
+            result = await conn.execute(stmt, {
+                'chat_id': chat_id,
+                'match': match,
+                'open': SNIPPET_OPEN,
+                'close': SNIPPET_CLOSE,
+                'limit': limit,
+                'offset': offset
+            })
+            return [
+                SearchResult(
+                    message_id=message_id,
+                    user_id=user_id,
+                    username=username,
+                    timestamp=timestamp,
+                    snippet=snippet
+                )
+                for message_id, user_id, username, timestamp, snippet in result
+            ]
+
+    async def warm_hot_window(self) -> None:
+        since_time = self.hot_window.horizon()
+
+        source = self._message_source(since_time)
+        async with self.read_session() as session:
+            stmt = select(
+                source.c.chat_id,
+                func.max(source.c.timestamp),
+                func.count(),
+                func.sum(func.length(source.c.message_text))
+            ).where(
+                source.c.timestamp >= since_time
+            ).group_by(source.c.chat_id)
+            chats = (await session.execute(stmt)).all()
+
+        if self.include_legacy_rows and any(chat_id == 0 for chat_id, *_ in chats):
+            # Legacy rows belong to every chat and cannot be cached per chat
+            logger.warning("Hot window disabled: legacy chat_id = 0 messages fall inside it")
+            self.hot_window = None
+            return
+
+        # Most recently active chats first, until the estimated size hits the cap
+        chats.sort(key=lambda chat: chat[1], reverse=True)
+        budget = self.hot_window.max_bytes
+        skipped = []
+
+        for chat_id, _, count, text_length in chats:
+            estimate = count * HOT_WINDOW_ROW_OVERHEAD + (text_length or 0) * 2
+            if estimate > budget:
+                skipped.append(chat_id)
+                continue
+            budget -= estimate
+
+            async with self.read_engine.connect() as conn:
+                result = await conn.execute(self._messages_since_stmt(chat_id, since_time))
+                self.hot_window.load(chat_id, (ChatMessage.from_row(row) for row in result), since_time)
+
+        self.hot_window.mark_warm(since_time, skipped)
+        stats = self.hot_window.stats
+        logger.info(
+            f"Hot window warmed: {stats.messages} messages in {stats.chats} chats "
+            f"({stats.memory_bytes / 1024 / 1024:.1f} MiB, {len(skipped)} chats left to the database)"
+        )
+
+    async def _check_schema_version(self, fresh: bool) -> None:
         async with self.async_session() as session:
-            message = Message(
-                chat_id=chat_id,
-                user_id=user_id,
-                username=username,
-                message_text=message_text,
-                timestamp=datetime.now() if not ts else ts
+            if fresh:
+                # create_all has just built the current schema, nothing to migrate
+                await session.execute(
+                    sqlite_insert(SchemaVersion).on_conflict_do_nothing(),
+                    [{'version': migration.version, 'name': migration.name} for migration in MIGRATIONS]
+                )
+                await session.commit()
+                return
+
+            applied = set((await session.execute(select(SchemaVersion.version))).scalars().all())
+
+        pending = [migration for migration in MIGRATIONS if migration.version not in applied]
+        if pending:
+            names = ', '.join(f"{migration.version} ({migration.name})" for migration in pending)
+            logger.warning(f"Pending schema migrations: {names}; run python scripts/migrate.py")
+
+    async def _load_partitions(self) -> None:
+        async with self.read_session() as session:
+            rows = (await session.execute(select(MessagePartition).order_by(MessagePartition.period_start))).scalars().all()
+        self.partitions = [Partition(row.name, row.period_start, row.period_end) for row in rows]
+
+        if self.partitions and self.partition_period == "none":
+            # New rows must not go back into the messages table once partitions hold newer ids
+            logger.warning("MESSAGE_PARTITION_PERIOD is none but partitions exist; new partitions will be monthly")
+            self.partition_period = "month"
+
+        if self.partition_period != "none":
+            logger.info(f"Messages are partitioned by {self.partition_period} ({len(self.partitions)} partitions)")
+
+    def _message_tables(self, since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[Table]:
+        # The messages table is always included: it keeps everything written before partitioning
+        return [Message.__table__] + [p.table for p in self.partitions if p.overlaps(since, until)]
+
+    def _message_source(self, since: Optional[datetime] = None, until: Optional[datetime] = None):
+        """The messages table, or a UNION ALL over it and the partitions overlapping [since, until)."""
+        tables = self._message_tables(since, until)
+        if len(tables) == 1:
+            return tables[0]
+        return union_all(*(
+            select(table.c.id, table.c.chat_id, table.c.user_id, table.c.username, table.c.message_text, table.c.timestamp)
+            for table in tables
+        )).subquery('all_messages')
+
+    def _partition_for(self, ts: datetime, created: List[Partition]) -> Partition:
+        known = self.partitions + created
+        for partition in known:
+            if partition.covers(ts):
+                return partition
+
+        start = period_start(ts, self.partition_period)
+        end = period_end(start, self.partition_period)
+        # Clip to the neighbours, so a changed period never produces overlapping partitions
+        for partition in known:
+            if partition.end <= ts:
+                start = max(start, partition.end)
+            elif partition.start > ts:
+                end = min(end, partition.start)
+
+        partition = Partition(partition_name(start), start, end)
+        created.append(partition)
+        return partition
+
+    async def _create_partition(self, session: AsyncSession, partition: Partition) -> None:
+        table = partition.table
+        await session.run_sync(lambda sync_session: table.create(sync_session.connection()))
+
+        # Continue the id sequence of the messages table and every partition, including
+        # dropped ones, so ids stay globally unique and are never reused
+        seed = (await session.execute(text(
+            "SELECT max(coalesce((SELECT max(id) FROM messages), 0), "
+            "coalesce((SELECT max(seq) FROM sqlite_sequence WHERE name LIKE 'messages_%'), 0), "
+            "coalesce((SELECT CAST(value AS INTEGER) FROM maintenance_state WHERE key = :key), 0))"
+        ), {'key': MESSAGE_ID_HIGH_WATER_KEY})).scalar()
+        await session.execute(
+            text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"),
+            {'name': partition.name, 'seq': seed}
+        )
+
+        if self.search_enabled:
+            await self._create_partition_search_index(session, partition)
+
+        session.add(MessagePartition(name=partition.name, period_start=partition.start, period_end=partition.end))
+        await session.flush()
+        logger.info(f"Created message partition {partition.name} [{partition.start}, {partition.end})")
+
+    @staticmethod
+    async def _create_partition_search_index(conn, partition: Partition) -> None:
+        await conn.execute(text(
+            f"CREATE VIRTUAL TABLE {partition.search_table} USING fts5("
+            f"message_text, content='{partition.name}', content_rowid='id', "
+            f"tokenize='unicode61 remove_diacritics 2')"
+        ))
+        for statement in PARTITION_SEARCH_DDL:
+            await conn.execute(text(statement.format(name=partition.name)))
+
+    async def _insert_messages(self, session: AsyncSession, records: List[MessageIngest]) -> Tuple[List[int], List[Partition]]:
+        """Insert message rows, returns their ids in record order and the partitions created."""
+        if self.partition_period == "none":
+            message_ids = (await session.execute(
+                insert(Message).returning(Message.id, sort_by_parameter_order=True),
+                [record.to_row() for record in records]
+            )).scalars().all()
+            return list(message_ids), []
+
+        created: List[Partition] = []
+        groups: Dict[str, Tuple[Partition, List[int]]] = {}
+        for position, record in enumerate(records):
+            partition = self._partition_for(record.timestamp, created)
+            groups.setdefault(partition.name, (partition, []))[1].append(position)
+
+        for partition in created:
+            await self._create_partition(session, partition)
+
+        message_ids = [0] * len(records)
+        for partition, positions in groups.values():
+            table = partition.table
+            ids = (await session.execute(
+                insert(table).returning(table.c.id, sort_by_parameter_order=True),
+                [records[position].to_row() for position in positions]
+            )).scalars().all()
+            for position, message_id in zip(positions, ids):
+                message_ids[position] = message_id
+
+        return message_ids, created
+
+    async def _drop_partition(self, partition: Partition) -> int:
+        """Remove a whole partition with its search index and quiz candidates."""
+        table = partition.table
+        async with self.async_engine.begin() as conn:
+            if self.archive_enabled:
+                archived = (await conn.execute(select(*self._archive_columns(table)))).all()
+                await self._archive_rows(conn, archived)
+            rows = (await conn.execute(select(func.count()).select_from(table))).scalar()
+            await conn.execute(delete(QuizCandidate).where(QuizCandidate.message_id.in_(select(table.c.id))))
+            await conn.execute(text(f"DROP TABLE IF EXISTS {partition.search_table}"))
+            await conn.execute(text(
+                "INSERT INTO maintenance_state (key, value) "
+                "SELECT :key, CAST(seq AS TEXT) FROM sqlite_sequence WHERE name = :name "
+                "ON CONFLICT(key) DO UPDATE SET value = "
+                "CAST(max(CAST(value AS INTEGER), CAST(excluded.value AS INTEGER)) AS TEXT)"
+            ), {'key': MESSAGE_ID_HIGH_WATER_KEY, 'name': partition.name})
+            # Triggers and the sqlite_sequence entry go with the table
+            await conn.execute(text(f"DROP TABLE {partition.name}"))
+            await conn.execute(delete(MessagePartition).where(MessagePartition.name == partition.name))
+
+        self.partitions.remove(partition)
+        logger.info(f"Dropped message partition {partition.name} ({rows} messages)")
+        return rows
+
+    async def _load_archive_high_water(self) -> None:
+        async with self.read_session() as session:
+            self._archive_high_water = (await session.execute(select(func.max(ArchiveBlock.last_timestamp)))).scalar()
+
+    @staticmethod
+    def _archive_columns(table: Table) -> tuple:
+        return (table.c.id, table.c.chat_id, table.c.user_id, table.c.username, table.c.message_text, table.c.timestamp)
+
+    async def _archive_rows(self, conn, rows) -> None:
+        """
+        Merge message rows into the compressed (chat, day) blocks.
+
+        `conn` is the connection or session of the transaction that deletes the
+        rows, so a message is either archived or still in place, never both.
+        """
+        days: Dict[Tuple[int, datetime], List[ChatMessage]] = {}
+        for _, chat_id, user_id, username, message_text, timestamp in rows:
+            days.setdefault((chat_id, archive_day(timestamp)), []).append(
+                ChatMessage(user_id, message_text, timestamp, username, chat_id)
             )
-            session.add(message)
+
+        for (chat_id, day), messages in days.items():
+            existing = (await conn.execute(
+                select(ArchiveBlock.payload).where(ArchiveBlock.chat_id == chat_id, ArchiveBlock.day == day)
+            )).scalar()
+            if existing is not None:
+                # Cleanup runs in batches, so one day usually arrives in several pieces
+                messages = decode_block(chat_id, day, existing) + messages
+                messages.sort(key=lambda msg: msg.timestamp)
+
+            payload, raw_bytes = encode_block(day, messages)
+            values = {
+                'first_timestamp': messages[0].timestamp,
+                'last_timestamp': messages[-1].timestamp,
+                'message_count': len(messages),
+                'raw_bytes': raw_bytes,
+                'payload': payload
+            }
+            stmt = sqlite_insert(ArchiveBlock).values(chat_id=chat_id, day=day, **values)
+            await conn.execute(stmt.on_conflict_do_update(index_elements=['chat_id', 'day'], set_=values))
+
+            if self._archive_high_water is None or messages[-1].timestamp > self._archive_high_water:
+                self._archive_high_water = messages[-1].timestamp
+
+    async def get_archived_messages(
+        self,
+        chat_id: int,
+        since_time: datetime,
+        until_time: Optional[datetime] = None
+    ) -> List[ChatMessage]:
+        """
+        Archived messages of a chat in [since_time, until_time), oldest first.
+
+        Every (chat, day) block overlapping the range is decompressed in full,
+        so the cost is one block per day of the range.
+        """
+        if self._archive_high_water is None or since_time > self._archive_high_water:
+            return []
+
+        stmt = select(ArchiveBlock.chat_id, ArchiveBlock.day, ArchiveBlock.payload).where(
+            self._chat_scope(ArchiveBlock.chat_id, chat_id),
+            ArchiveBlock.day >= archive_day(since_time),
+            ArchiveBlock.last_timestamp >= since_time
+        )
+        if until_time is not None:
+            stmt = stmt.where(ArchiveBlock.day < until_time)
+
+        messages: List[ChatMessage] = []
+        async with self.read_engine.connect() as conn:
+            for block_chat_id, day, payload in await conn.execute(stmt):
+                self._archive_blocks_read += 1
+                self._archive_bytes_decompressed += len(payload)
+                messages.extend(
+                    msg for msg in decode_block(block_chat_id, day, payload)
+                    if msg.timestamp >= since_time and (until_time is None or msg.timestamp < until_time)
+                )
+
+        messages.sort(key=lambda msg: msg.timestamp)
+        return messages
+
+    async def get_archive_stats(self) -> ArchiveStats:
+        async with self.read_session() as session:
+            blocks, messages, raw_bytes, compressed_bytes = (await session.execute(select(
+                func.count(),
+                func.coalesce(func.sum(ArchiveBlock.message_count), 0),
+                func.coalesce(func.sum(ArchiveBlock.raw_bytes), 0),
+                func.coalesce(func.sum(func.length(ArchiveBlock.payload)), 0)
+            ))).one()
+
+        return ArchiveStats(
+            blocks=blocks,
+            messages=messages,
+            raw_bytes=raw_bytes,
+            compressed_bytes=compressed_bytes,
+            blocks_read=self._archive_blocks_read,
+            bytes_decompressed=self._archive_bytes_decompressed
+        )
+
+    async def _random_archived_message(self, session: AsyncSession, chat_id: int) -> Optional[ChatMessage]:
+        blocks = (await session.execute(
+            select(ArchiveBlock.id, ArchiveBlock.message_count).where(self._chat_scope(ArchiveBlock.chat_id, chat_id))
+        )).all()
+        if not blocks:
+            return None
+
+        for _ in range(QUIZ_SAMPLE_ATTEMPTS):
+            block_id = random.choices([row.id for row in blocks], weights=[row.message_count for row in blocks])[0]
+            block = (await session.execute(
+                select(ArchiveBlock.chat_id, ArchiveBlock.day, ArchiveBlock.payload).where(ArchiveBlock.id == block_id)
+            )).one()
+            self._archive_blocks_read += 1
+            self._archive_bytes_decompressed += len(block.payload)
+
+            eligible = [msg for msg in decode_block(*block) if is_quiz_eligible(msg.message_text)]
+            if eligible:
+                return random.choice(eligible)
+
+        return None
+
+    async def ingest_message(self, record: MessageIngest) -> None:
+        # Buffered profanity counters are flushed on their own schedule
+        if self.profanity_buffer is not None and record.profanity_count > 0:
+            self.profanity_buffer.add(record.chat_id, record.user_id, record.username, record.profanity_count)
+            # Reads merge the buffer, so the cached numbers change right away
+            self._profanity_changed(record.chat_id, record.user_id, record.profanity_count)
+            record = replace(record, profanity_count=0)
+
+        if self.write_queue is not None:
+            self.write_queue.put(record)
+            logger.debug(f"Queued message from user {record.user_id} in chat {record.chat_id}")
+            return
+
+        await self._apply_ingest([record])
+        logger.debug(f"Saved message from user {record.user_id} in chat {record.chat_id}")
+
+    async def _apply_ingest(self, records: List[MessageIngest]) -> None:
+        # Message rows, counter deltas and username refreshes commit together
+        async with self.async_session() as session:
+            message_ids, created_partitions = await self._insert_messages(session, records)
+
+            quiz_rows = [
+                {'chat_id': record.chat_id, 'message_id': message_id}
+                for record, message_id in zip(records, message_ids)
+                if is_quiz_eligible(record.message_text)
+            ]
+            if quiz_rows:
+                await session.execute(insert(QuizCandidate), quiz_rows)
+
+            deltas: Dict[Tuple[int, int], Dict] = {}
+            latest_usernames: Dict[Tuple[int, int], Optional[str]] = {}
+            activity: Dict[Tuple[int, int, datetime], Dict] = {}
+            seen: Dict[Tuple[int, int], Dict] = {}
+            for record in records:
+                key = (record.chat_id, record.user_id)
+                latest_usernames[key] = record.username
+
+                participant = seen.setdefault(key, {
+                    'chat_id': record.chat_id,
+                    'user_id': record.user_id,
+                    'first_seen': record.timestamp,
+                    'last_seen': record.timestamp,
+                    'message_count': 0,
+                })
+                participant['username'] = record.username
+                participant['first_seen'] = min(participant['first_seen'], record.timestamp)
+                participant['last_seen'] = max(participant['last_seen'], record.timestamp)
+                participant['message_count'] += 1
+
+                hour_start = truncate_to_hour(record.timestamp)
+                bucket = activity.setdefault((record.chat_id, record.user_id, hour_start), {
+                    'chat_id': record.chat_id,
+                    'user_id': record.user_id,
+                    'hour_start': hour_start,
+                    'message_count': 0,
+                })
+                bucket['message_count'] += 1
+                bucket['username'] = record.username
+                if record.profanity_count > 0:
+                    entry = deltas.setdefault(key, {
+                        'chat_id': record.chat_id,
+                        'user_id': record.user_id,
+                        'count': 0,
+                    })
+                    entry['count'] += record.profanity_count
+                    entry['username'] = record.username
+                    entry['last_updated'] = record.timestamp
+
+            await self._upsert_activity_rows(session, list(activity.values()))
+            await self._upsert_participant_rows(session, list(seen.values()))
+
+            if deltas:
+                await self._upsert_profanity_rows(session, list(deltas.values()))
+
+            renamed = {
+                key: username for key, username in latest_usernames.items()
+                if key not in deltas and self._known_usernames.get(key, ...) != username
+            }
+            for (chat_id, user_id), username in renamed.items():
+                await self._refresh_username(session, chat_id, user_id, username)
+
             await session.commit()
-            logger.debug(f"Saved message from user {user_id} in chat {chat_id}")
+
+        if created_partitions:
+            self.partitions = sorted(self.partitions + created_partitions, key=lambda p: p.start)
+        self._known_usernames.update(latest_usernames)
+        for entry in deltas.values():
+            self._profanity_changed(entry['chat_id'], entry['user_id'], entry['count'])
+        for chat_id, _ in renamed:
+            self.stats_cache.invalidate(('profanity', chat_id))
+            self.stats_cache.invalidate(('quiz', chat_id))
+        for row in seen.values():
+            self.participants.touch(row['chat_id'], row['user_id'], row['username'], row['last_seen'])
+
+        # Only committed rows go into the hot window, so it never runs ahead of the database
+        if self.hot_window is not None:
+            for record in records:
+                self.hot_window.add(ChatMessage(
+                    user_id=record.user_id,
+                    message_text=record.message_text,
+                    timestamp=record.timestamp,
+                    username=record.username,
+                    chat_id=record.chat_id
+                ))
+
+    @staticmethod
+    async def _upsert_activity_rows(session: AsyncSession, rows: List[Dict]) -> None:
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            stmt = sqlite_insert(ActivityHourly).values(rows[start:start + UPSERT_CHUNK_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ActivityHourly.chat_id, ActivityHourly.user_id, ActivityHourly.hour_start],
+                set_={
+                    'message_count': ActivityHourly.message_count + stmt.excluded.message_count,
+                    'username': stmt.excluded.username,
+                }
+            )
+            await session.execute(stmt)
+
+    @staticmethod
+    async def _upsert_participant_rows(session: AsyncSession, rows: List[Dict]) -> None:
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            stmt = sqlite_insert(ChatParticipant).values(rows[start:start + UPSERT_CHUNK_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ChatParticipant.chat_id, ChatParticipant.user_id],
+                set_={
+                    'username': stmt.excluded.username,
+                    # Two-argument min()/max() are scalar functions in SQLite
+                    'first_seen': func.min(ChatParticipant.first_seen, stmt.excluded.first_seen),
+                    'last_seen': func.max(ChatParticipant.last_seen, stmt.excluded.last_seen),
+                    'message_count': ChatParticipant.message_count + stmt.excluded.message_count,
+                }
+            )
+            await session.execute(stmt)
+
+    def _profanity_changed(self, chat_id: int, user_id: int, count: int) -> None:
+        self.stats_cache.invalidate(('profanity', chat_id))
+        self.stats_cache.update(
+            ('profanity_user', chat_id, user_id),
+            lambda cached: cached + count,
+            tag=('profanity_user', chat_id)
+        )
+
+    def get_stats_cache_stats(self) -> CacheStats:
+        return self.stats_cache.stats
+
+    def log_stats_cache_stats(self) -> None:
+        stats = self.stats_cache.stats
+        logger.info(
+            f"Stats cache: {stats.hits} hits, {stats.misses} misses ({stats.hit_ratio:.0%} hit ratio), "
+            f"{stats.entries} entries, {stats.evictions} evictions, {stats.invalidations} invalidations"
+        )
+
+    @staticmethod
+    async def _refresh_username(session: AsyncSession, chat_id: int, user_id: int, username: Optional[str]) -> None:
+        for model in (ProfanityStat, QuizScore):
+            await session.execute(
+                update(model).where(
+                    model.chat_id == chat_id,
+                    model.user_id == user_id,
+                    model.username.is_distinct_from(username)
+                ).values(username=username)
+            )
+
+    async def flush_writes(self) -> int:
+        if self.write_queue is None:
+            return 0
+        return await self.write_queue.flush()
+
+    def get_write_queue_stats(self) -> Optional[WriteQueueStats]:
+        return self.write_queue.stats if self.write_queue is not None else None
 
     async def get_messages_since(
         self,
@@ -93,40 +1050,293 @@ class Database:
     ) -> List[ChatMessage]:
         since_time = datetime.now() - timedelta(hours=hours)
 
-        async with self.async_session() as session:
-            stmt = select(Message).where(
-                (Message.chat_id == chat_id) | (Message.chat_id == 0),
-                Message.timestamp >= since_time
-            ).order_by(Message.timestamp.asc())
+        cached = self._hot_messages(chat_id, since_time)
+        if cached is not None:
+            logger.info(f"Served {len(cached)} messages from chat {chat_id} for last {hours} hours from the hot window")
+            return cached
 
-            result = await session.execute(stmt)
-            messages = result.scalars().all()
+        # Archived rows are all older than the live ones
+        chat_messages = await self.get_archived_messages(chat_id, since_time)
 
-            chat_messages = [msg.to_chat_message() for msg in messages]
+        # Plain column tuples: no ORM identities for rows that are only converted
+        async with self.read_engine.connect() as conn:
+            result = await conn.execute(self._messages_since_stmt(chat_id, since_time))
+            chat_messages.extend(ChatMessage.from_row(row) for row in result)
 
             logger.info(f"Retrieved {len(chat_messages)} messages from chat {chat_id} for last {hours} hours")
             return chat_messages
 
+    async def stream_messages_since(
+        self,
+        chat_id: int,
+        hours: int,
+        chunk_size: int = STREAM_CHUNK_SIZE
+    ) -> AsyncIterator[ChatMessage]:
+        since_time = datetime.now() - timedelta(hours=hours)
+
+        cached = self._hot_messages(chat_id, since_time)
+        if cached is not None:
+            for message in cached:
+                yield message
+            return
+
+        for message in await self.get_archived_messages(chat_id, since_time):
+            yield message
+
+        async with self.read_engine.connect() as conn:
+            stmt = self._messages_since_stmt(chat_id, since_time).execution_options(yield_per=chunk_size)
+            result = await conn.stream(stmt)
+
+            async for partition in result.partitions():
+                for row in partition:
+                    yield ChatMessage.from_row(row)
+
+    async def get_message_batch(
+        self,
+        chat_id: int,
+        hours: int,
+        chunk_size: int = STREAM_CHUNK_SIZE
+    ) -> MessageBatch:
+        since_time = datetime.now() - timedelta(hours=hours)
+
+        cached = self._hot_messages(chat_id, since_time)
+        if cached is not None:
+            return MessageBatch.from_messages(cached)
+
+        batch = MessageBatch.from_messages(await self.get_archived_messages(chat_id, since_time))
+
+        # Rows go straight into the batch columns, no ChatMessage per row
+        async with self.read_engine.connect() as conn:
+            stmt = self._messages_since_stmt(chat_id, since_time).execution_options(yield_per=chunk_size)
+            result = await conn.stream(stmt)
+
+            async for partition in result.partitions():
+                batch.extend_rows(partition)
+
+        logger.info(f"Retrieved {len(batch)} messages from chat {chat_id} for last {hours} hours "
+                    f"({batch.nbytes} bytes)")
+        return batch
+
+    def _hot_messages(self, chat_id: int, since_time: datetime) -> Optional[List[ChatMessage]]:
+        if self.hot_window is None:
+            return None
+        return self.hot_window.get(chat_id, since_time)
+
+    def get_hot_window_stats(self) -> Optional[HotWindowStats]:
+        return self.hot_window.stats if self.hot_window is not None else None
+
+    def log_hot_window_stats(self) -> None:
+        if self.hot_window is None:
+            return
+        stats = self.hot_window.stats
+        logger.info(
+            f"Hot window: {stats.hits} hits, {stats.misses} misses ({stats.hit_ratio:.0%} hit ratio), "
+            f"{stats.chats} chats, {stats.messages} messages, {stats.memory_bytes / 1024 / 1024:.1f} MiB, "
+            f"{stats.evictions} evictions"
+        )
+
+    def _messages_since_stmt(self, chat_id: int, since_time: datetime):
+        # One index range scan per table overlapping the window, merged by timestamp
+        selects = [
+            select(*Message.chat_message_columns(table)).where(
+                self._chat_scope(table.c.chat_id, chat_id),
+                table.c.timestamp >= since_time
+            )
+            for table in self._message_tables(since_time)
+        ]
+        stmt = selects[0] if len(selects) == 1 else union_all(*selects)
+        return stmt.order_by(stmt.selected_columns.timestamp.asc())
+
     async def get_message_count(self, chat_id: Optional[int] = None) -> int:
-        async with self.async_session() as session:
-            stmt = select(func.count()).select_from(Message)
+        async with self.read_session() as session:
+            source = self._message_source()
+            stmt = select(func.count()).select_from(source)
             if chat_id is not None:
-                stmt = stmt.where((Message.chat_id == chat_id) | (Message.chat_id == 0))
+                stmt = stmt.where(self._chat_scope(source.c.chat_id, chat_id))
             result = await session.execute(stmt)
             count = result.scalar()
             return count if count else 0
 
-    async def get_chat_participants(self, chat_id: int) -> List[str]:
+    async def get_last_message_id(self, chat_id: int, hours: int) -> Optional[int]:
+        since_time = datetime.now() - timedelta(hours=hours)
+        async with self.read_session() as session:
+            source = self._message_source(since_time)
+            stmt = select(func.max(source.c.id)).where(
+                self._chat_scope(source.c.chat_id, chat_id),
+                source.c.timestamp >= since_time
+            )
+            return (await session.execute(stmt)).scalar()
+
+    async def get_stored_summary(
+        self,
+        chat_id: int,
+        hours: int,
+        last_message_id: int,
+        model: str,
+        created_after: datetime
+    ) -> Optional[str]:
+        async with self.read_session() as session:
+            stmt = select(StoredSummary.summary).where(
+                StoredSummary.chat_id == chat_id,
+                StoredSummary.hours == hours,
+                StoredSummary.last_message_id == last_message_id,
+                StoredSummary.model == model,
+                StoredSummary.created_at >= created_after
+            )
+            return (await session.execute(stmt)).scalar()
+
+    async def store_summary(self, chat_id: int, hours: int, last_message_id: int, model: str, summary: str) -> None:
         async with self.async_session() as session:
-            stmt = select(Message.username).where(
-                (Message.chat_id == chat_id) | (Message.chat_id == 0)
-            ).distinct()
+            stmt = sqlite_insert(StoredSummary).values(
+                chat_id=chat_id,
+                hours=hours,
+                last_message_id=last_message_id,
+                model=model,
+                summary=summary,
+                created_at=datetime.now()
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[StoredSummary.chat_id, StoredSummary.hours, StoredSummary.last_message_id,
+                                StoredSummary.model],
+                set_={'summary': stmt.excluded.summary, 'created_at': stmt.excluded.created_at}
+            )
+            await session.execute(stmt)
+            await session.commit()
+
+    async def get_chunk_summaries(
+        self,
+        chat_id: int,
+        chunk_hours: int,
+        model: str,
+        since: datetime,
+        until: datetime
+    ) -> Dict[datetime, str]:
+        async with self.read_session() as session:
+            stmt = select(ChunkSummary.chunk_start, ChunkSummary.summary).where(
+                ChunkSummary.chat_id == chat_id,
+                ChunkSummary.chunk_hours == chunk_hours,
+                ChunkSummary.model == model,
+                ChunkSummary.chunk_start >= since,
+                ChunkSummary.chunk_start < until
+            )
+            return {chunk_start: summary for chunk_start, summary in (await session.execute(stmt)).all()}
+
+    async def store_chunk_summaries(self, chat_id: int, chunk_hours: int, model: str, chunks: Dict[datetime, str]) -> None:
+        if not chunks:
+            return
+
+        async with self.async_session() as session:
+            stmt = sqlite_insert(ChunkSummary).values([
+                {'chat_id': chat_id, 'chunk_hours': chunk_hours, 'model': model, 'chunk_start': start, 'summary': summary}
+                for start, summary in chunks.items()
+            ])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ChunkSummary.chat_id, ChunkSummary.chunk_hours, ChunkSummary.model,
+                                ChunkSummary.chunk_start],
+                set_={'summary': stmt.excluded.summary}
+            )
+            await session.execute(stmt)
+            await session.commit()
+
+    async def get_chat_participants(
+        self,
+        chat_id: int,
+        active_within_hours: Optional[int] = None
+    ) -> List[str]:
+        participants = await self.get_participant_directory(chat_id, active_within_hours)
+
+        usernames = []
+        seen = set()
+        for participant in participants:
+            if participant.username and participant.username not in seen:
+                seen.add(participant.username)
+                usernames.append(participant.username)
+
+        logger.debug(f"Found {len(usernames)} participants in chat {chat_id}")
+        return usernames
+
+    async def get_participant_directory(
+        self,
+        chat_id: int,
+        active_within_hours: Optional[int] = None
+    ) -> List[Participant]:
+        participants: List[Participant] = []
+        for scope_id in self._chat_scope_ids(chat_id):
+            directory = self.participants.get(scope_id)
+            if directory is None:
+                directory = self.participants.load(scope_id, await self._load_participants(scope_id))
+            participants.extend(directory.values())
+
+        if active_within_hours is not None:
+            since_time = datetime.now() - timedelta(hours=active_within_hours)
+            participants = [p for p in participants if p.last_seen >= since_time]
+
+        return participants
+
+    async def _load_participants(self, chat_id: int) -> List[Participant]:
+        async with self.read_session() as session:
+            stmt = select(
+                ChatParticipant.user_id,
+                ChatParticipant.username,
+                ChatParticipant.last_seen
+            ).where(ChatParticipant.chat_id == chat_id)
 
             result = await session.execute(stmt)
-            usernames = [username for username in result.scalars().all() if username]
+            return [
+                Participant(user_id=user_id, username=username, last_seen=last_seen)
+                for user_id, username, last_seen in result.all()
+            ]
+
+    async def rebuild_participants(self, chat_id: Optional[int] = None) -> int:
+        source = self._message_source()
+
+        # Bare column next to a single max(): SQLite takes it from the newest row
+        latest_names = select(
+            source.c.chat_id,
+            source.c.user_id,
+            source.c.username,
+            func.max(source.c.id)
+        ).group_by(source.c.chat_id, source.c.user_id)
+
+        activity = select(
+            source.c.chat_id,
+            source.c.user_id,
+            func.min(source.c.timestamp).label('first_seen'),
+            func.max(source.c.timestamp).label('last_seen'),
+            func.count().label('message_count')
+        ).group_by(source.c.chat_id, source.c.user_id)
+
+        clear_stmt = delete(ChatParticipant)
+        if chat_id is not None:
+            latest_names = latest_names.where(source.c.chat_id == chat_id)
+            activity = activity.where(source.c.chat_id == chat_id)
+            clear_stmt = clear_stmt.where(ChatParticipant.chat_id == chat_id)
+
+        latest_names = latest_names.subquery()
+        activity = activity.subquery()
+        fill_stmt = insert(ChatParticipant).from_select(
+            ['chat_id', 'user_id', 'username', 'first_seen', 'last_seen', 'message_count'],
+            select(
+                activity.c.chat_id,
+                activity.c.user_id,
+                latest_names.c.username,
+                activity.c.first_seen,
+                activity.c.last_seen,
+                activity.c.message_count
+            ).join(
+                latest_names,
+                (latest_names.c.chat_id == activity.c.chat_id) & (latest_names.c.user_id == activity.c.user_id)
+            )
+        )
+
+        async with self.async_session() as session:
+            await session.execute(clear_stmt)
+            result = await session.execute(fill_stmt)
+            await session.commit()
 
-            logger.debug(f"Found {len(usernames)} participants in chat {chat_id}")
-            return usernames
+        self.participants.invalidate(chat_id)
+        logger.info(f"Rebuilt participants directory: {result.rowcount} entries")
+        return result.rowcount
 
     async def update_profanity_count(
         self,
@@ -138,36 +1348,123 @@ class Database:
         if count == 0:
             return
 
+        if self.profanity_buffer is not None:
+            self.profanity_buffer.add(chat_id, user_id, username, count)
+            self._profanity_changed(chat_id, user_id, count)
+            logger.debug(f"Buffered profanity count for user {user_id} in chat {chat_id}: +{count}")
+            return
+
         async with self.async_session() as session:
-            # Try to get existing stat
-            stmt = select(ProfanityStat).where(
-                ProfanityStat.chat_id == chat_id,
-                ProfanityStat.user_id == user_id
-            )
-            result = await session.execute(stmt)
-            stat = result.scalar_one_or_none()
+            await self._upsert_profanity_rows(session, [{
+                'chat_id': chat_id,
+                'user_id': user_id,
+                'username': username,
+                'count': count,
+                'last_updated': datetime.now(),
+            }])
+            await session.commit()
 
-            if stat:
-                # Update existing
-                stat.profanity_count += count
-                stat.username = username  # Update username in case it changed
-                stat.last_updated = datetime.now()
-            else:
-                # Create new
-                stat = ProfanityStat(
-                    chat_id=chat_id,
-                    user_id=user_id,
-                    username=username,
-                    profanity_count=count,
-                    last_updated=datetime.now()
-                )
-                session.add(stat)
+        self._known_usernames[(chat_id, user_id)] = username
+        self._profanity_changed(chat_id, user_id, count)
+        logger.debug(f"Updated profanity count for user {user_id} in chat {chat_id}: +{count}")
+
+    @staticmethod
+    async def _upsert_profanity_rows(session: AsyncSession, rows: List[Dict]) -> None:
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            chunk = rows[start:start + UPSERT_CHUNK_SIZE]
+            stmt = sqlite_insert(ProfanityStat).values([
+                {
+                    'chat_id': row['chat_id'],
+                    'user_id': row['user_id'],
+                    'username': row['username'],
+                    'profanity_count': row['count'],
+                    'last_updated': row['last_updated'],
+                }
+                for row in chunk
+            ])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ProfanityStat.chat_id, ProfanityStat.user_id],
+                set_={
+                    'profanity_count': ProfanityStat.profanity_count + stmt.excluded.profanity_count,
+                    'username': stmt.excluded.username,
+                    'last_updated': stmt.excluded.last_updated,
+                }
+            )
+            await session.execute(stmt)
 
+    async def _flush_profanity_buffer(self, rows: List[Dict]) -> None:
+        async with self.async_session() as session:
+            await self._upsert_profanity_rows(session, rows)
             await session.commit()
-            logger.debug(f"Updated profanity count for user {user_id} in chat {chat_id}: +{count}")
+
+        for row in rows:
+            self._known_usernames[(row['chat_id'], row['user_id'])] = row['username']
+
+    async def flush_profanity_counts(self) -> int:
+        if self.profanity_buffer is None:
+            return 0
+        return await self.profanity_buffer.flush()
 
     async def get_profanity_stats(self, chat_id: int, limit: int = 10) -> List[tuple[str, int]]:
-        async with self.async_session() as session:
+        key = ('profanity_top', chat_id, limit)
+        cached = self.stats_cache.get(key)
+        if cached is not None:
+            return list(cached)
+
+        tag = ('profanity', chat_id)
+        version = self.stats_cache.version(tag)
+        stats = await self._read_profanity_stats(chat_id, limit)
+        self.stats_cache.put(key, tuple(stats), tag=tag, version=version)
+        return stats
+
+    async def _read_profanity_stats(self, chat_id: int, limit: int) -> List[tuple[str, int]]:
+        if self.profanity_buffer is None or not self.profanity_buffer.pending_for_chat(chat_id):
+            return await self._get_stored_profanity_stats(chat_id, limit)
+
+        # Hold the buffer lock so a concurrent flush cannot be counted twice
+        async with self.profanity_buffer.lock:
+            pending = self.profanity_buffer.pending_for_chat(chat_id)
+
+            async with self.read_session() as session:
+                # Users without pending deltas can only make the top if they are
+                # within the stored top (limit + number of pending users)
+                top_stmt = select(
+                    ProfanityStat.user_id,
+                    ProfanityStat.username,
+                    ProfanityStat.profanity_count
+                ).where(
+                    ProfanityStat.chat_id == chat_id
+                ).order_by(
+                    ProfanityStat.profanity_count.desc()
+                ).limit(limit + len(pending))
+
+                pending_stmt = select(
+                    ProfanityStat.user_id,
+                    ProfanityStat.username,
+                    ProfanityStat.profanity_count
+                ).where(
+                    ProfanityStat.chat_id == chat_id,
+                    ProfanityStat.user_id.in_(list(pending))
+                )
+
+                merged: Dict[int, List] = {}
+                for stmt in (top_stmt, pending_stmt):
+                    for user_id, username, count in (await session.execute(stmt)).all():
+                        merged[user_id] = [username, count]
+
+            for user_id, entry in pending.items():
+                stored = merged.setdefault(user_id, [entry['username'], 0])
+                stored[0] = entry['username']
+                stored[1] += entry['count']
+
+        ranked = sorted(merged.values(), key=lambda item: item[1], reverse=True)[:limit]
+        stats = [(username, count) for username, count in ranked]
+
+        logger.debug(f"Retrieved profanity stats for chat {chat_id}: {len(stats)} users ({len(pending)} unflushed)")
+        return stats
+
+    async def _get_stored_profanity_stats(self, chat_id: int, limit: int) -> List[tuple[str, int]]:
+        async with self.read_session() as session:
             stmt = select(
                 ProfanityStat.username,
                 ProfanityStat.profanity_count
@@ -184,7 +1481,27 @@ class Database:
             return stats
 
     async def get_user_profanity_count(self, user_id: int, chat_id: int) -> int:
-        async with self.async_session() as session:
+        key = ('profanity_user', chat_id, user_id)
+        cached = self.stats_cache.get(key)
+        if cached is not None:
+            return cached
+
+        tag = ('profanity_user', chat_id)
+        version = self.stats_cache.version(tag)
+        count = await self._read_user_profanity_count(user_id, chat_id)
+        self.stats_cache.put(key, count, tag=tag, version=version)
+        return count
+
+    async def _read_user_profanity_count(self, user_id: int, chat_id: int) -> int:
+        if self.profanity_buffer is None:
+            return await self._get_stored_user_profanity_count(user_id, chat_id)
+
+        async with self.profanity_buffer.lock:
+            stored = await self._get_stored_user_profanity_count(user_id, chat_id)
+            return stored + self.profanity_buffer.pending(chat_id, user_id)
+
+    async def _get_stored_user_profanity_count(self, user_id: int, chat_id: int) -> int:
+        async with self.read_session() as session:
             stmt = select(ProfanityStat.profanity_count).where(
                 ProfanityStat.chat_id == chat_id,
                 ProfanityStat.user_id == user_id
@@ -195,21 +1512,76 @@ class Database:
             return count if count else 0
 
     async def get_random_message_for_quiz(self, chat_id: int) -> Optional[ChatMessage]:
-        async with self.async_session() as session:
-            # Get messages that are long enough and not commands
-            stmt = select(Message).where(
-                (Message.chat_id == chat_id) | (Message.chat_id == 0),
-                func.length(Message.message_text) >= 20
-            ).order_by(func.random()).limit(1)
+        async with self.read_session() as session:
+            # Id range of the pool per scope; both ends come straight from idx_quiz_pool_chat_id
+            ranges = []
+            for scope_id in self._chat_scope_ids(chat_id):
+                bounds_stmt = select(func.min(QuizCandidate.id), func.max(QuizCandidate.id)).where(
+                    QuizCandidate.chat_id == scope_id
+                )
+                low, high = (await session.execute(bounds_stmt)).one()
+                if low is not None:
+                    ranges.append((scope_id, low, high))
 
-            result = await session.execute(stmt)
-            message = result.scalar_one_or_none()
+            # Archived messages take part in proportion to their number
+            if self._archive_high_water is not None:
+                archived = (await session.execute(
+                    select(func.coalesce(func.sum(ArchiveBlock.message_count), 0)).where(
+                        self._chat_scope(ArchiveBlock.chat_id, chat_id)
+                    )
+                )).scalar()
+                pooled = sum(high - low + 1 for _, low, high in ranges)
+                if archived and random.random() < archived / (archived + pooled):
+                    message = await self._random_archived_message(session, chat_id)
+                    if message is not None:
+                        return message
+
+            if not ranges:
+                return None
+
+            for _ in range(QUIZ_SAMPLE_ATTEMPTS):
+                weights = [high - low + 1 for _, low, high in ranges]
+                scope_id, low, high = random.choices(ranges, weights=weights)[0]
+                probe = random.randint(low, high)
+
+                probe_stmt = select(QuizCandidate.message_id).where(
+                    QuizCandidate.chat_id == scope_id,
+                    QuizCandidate.id >= probe
+                ).order_by(QuizCandidate.id).limit(1)
+                message_id = (await session.execute(probe_stmt)).scalar()
+                if message_id is None:
+                    continue
 
-            if message and not message.message_text.startswith('/'):
-                return message.to_chat_message()
+                # Primary key lookup, pushed down into every partition when partitioned
+                source = self._message_source()
+                stmt = select(*Message.chat_message_columns(source)).where(source.c.id == message_id)
+                row = (await session.execute(stmt)).first()
+                if row is not None:
+                    return ChatMessage.from_row(row)
 
             return None
 
+    async def rebuild_quiz_pool(self, chat_id: Optional[int] = None) -> int:
+        source = self._message_source()
+        eligible = select(source.c.chat_id, source.c.id).where(
+            quiz_eligible_clause(source.c.message_text)
+        ).order_by(source.c.id)
+
+        clear_stmt = delete(QuizCandidate)
+        if chat_id is not None:
+            eligible = eligible.where(source.c.chat_id == chat_id)
+            clear_stmt = clear_stmt.where(QuizCandidate.chat_id == chat_id)
+
+        async with self.async_session() as session:
+            await session.execute(clear_stmt)
+            result = await session.execute(
+                insert(QuizCandidate).from_select(['chat_id', 'message_id'], eligible)
+            )
+            await session.commit()
+
+            logger.info(f"Rebuilt quiz pool: {result.rowcount} eligible messages")
+            return result.rowcount
+
     async def update_quiz_score(
         self,
         user_id: int,
@@ -218,38 +1590,44 @@ class Database:
         correct: bool
     ) -> None:
         async with self.async_session() as session:
-            # Try to get existing score
-            stmt = select(QuizScore).where(
-                QuizScore.chat_id == chat_id,
-                QuizScore.user_id == user_id
+            stmt = sqlite_insert(QuizScore).values(
+                chat_id=chat_id,
+                user_id=user_id,
+                username=username,
+                correct_answers=1 if correct else 0,
+                total_games=1,
+                last_played=datetime.now()
             )
-            result = await session.execute(stmt)
-            score = result.scalar_one_or_none()
-
-            if score:
-                # Update existing
-                score.total_games += 1
-                if correct:
-                    score.correct_answers += 1
-                score.username = username  # Update username in case it changed
-                score.last_played = datetime.now()
-            else:
-                # Create new
-                score = QuizScore(
-                    chat_id=chat_id,
-                    user_id=user_id,
-                    username=username,
-                    correct_answers=1 if correct else 0,
-                    total_games=1,
-                    last_played=datetime.now()
-                )
-                session.add(score)
-
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[QuizScore.chat_id, QuizScore.user_id],
+                set_={
+                    'correct_answers': QuizScore.correct_answers + stmt.excluded.correct_answers,
+                    'total_games': QuizScore.total_games + 1,
+                    'username': stmt.excluded.username,
+                    'last_played': stmt.excluded.last_played,
+                }
+            )
+            await session.execute(stmt)
             await session.commit()
+
+            self._known_usernames[(chat_id, user_id)] = username
+            self.stats_cache.invalidate(('quiz', chat_id))
             logger.debug(f"Updated quiz score for user {user_id} in chat {chat_id}: correct={correct}")
 
     async def get_quiz_leaderboard(self, chat_id: int, limit: int = 10) -> List[tuple[str, int, int]]:
-        async with self.async_session() as session:
+        key = ('quiz_top', chat_id, limit)
+        cached = self.stats_cache.get(key)
+        if cached is not None:
+            return list(cached)
+
+        tag = ('quiz', chat_id)
+        version = self.stats_cache.version(tag)
+        leaderboard = await self._read_quiz_leaderboard(chat_id, limit)
+        self.stats_cache.put(key, tuple(leaderboard), tag=tag, version=version)
+        return leaderboard
+
+    async def _read_quiz_leaderboard(self, chat_id: int, limit: int) -> List[tuple[str, int, int]]:
+        async with self.read_session() as session:
             stmt = select(
                 QuizScore.username,
                 QuizScore.correct_answers,
@@ -266,18 +1644,251 @@ class Database:
             logger.debug(f"Retrieved quiz leaderboard for chat {chat_id}: {len(leaderboard)} entries")
             return leaderboard
 
-    async def cleanup_old_messages(self, days: int = 30) -> int:
-        cutoff_date = datetime.now() - timedelta(days=days)
+    async def rebuild_activity_rollup(self, chat_id: Optional[int] = None) -> int:
+        source = self._message_source()
+        hour_start = func.strftime(SQLITE_HOUR_FORMAT, source.c.timestamp).label('hour_start')
+
+        buckets = select(
+            source.c.chat_id,
+            source.c.user_id,
+            # Bare column next to max(): SQLite takes it from the newest row of the bucket
+            source.c.username,
+            hour_start,
+            func.count().label('message_count'),
+            func.max(source.c.id)
+        ).group_by(source.c.chat_id, source.c.user_id, hour_start)
+
+        clear_stmt = delete(ActivityHourly)
+        if chat_id is not None:
+            buckets = buckets.where(source.c.chat_id == chat_id)
+            clear_stmt = clear_stmt.where(ActivityHourly.chat_id == chat_id)
+
+        buckets = buckets.subquery()
+        fill_stmt = insert(ActivityHourly).from_select(
+            ['chat_id', 'user_id', 'username', 'hour_start', 'message_count'],
+            select(
+                buckets.c.chat_id,
+                buckets.c.user_id,
+                buckets.c.username,
+                buckets.c.hour_start,
+                buckets.c.message_count
+            )
+        )
 
         async with self.async_session() as session:
-            stmt = delete(Message).where(Message.timestamp < cutoff_date)
+            await session.execute(clear_stmt)
+            result = await session.execute(fill_stmt)
+            await session.commit()
+
+            logger.info(f"Rebuilt activity rollup: {result.rowcount} hourly buckets")
+            return result.rowcount
+
+    async def get_activity_count(self, chat_id: int, hours: int) -> int:
+        since_time = datetime.now() - timedelta(hours=hours)
+        # Buckets fully inside the window come from the rollup, the partial
+        # first hour is counted from the messages index
+        first_full_hour = truncate_to_hour(since_time) + timedelta(hours=1)
+
+        async with self.read_session() as session:
+            buckets_stmt = select(func.coalesce(func.sum(ActivityHourly.message_count), 0)).where(
+                self._chat_scope(ActivityHourly.chat_id, chat_id),
+                ActivityHourly.hour_start >= first_full_hour
+            )
+            source = self._message_source(since_time, first_full_hour)
+            edge_stmt = select(func.count()).select_from(source).where(
+                self._chat_scope(source.c.chat_id, chat_id),
+                source.c.timestamp >= since_time,
+                source.c.timestamp < first_full_hour
+            )
+
+            buckets = (await session.execute(buckets_stmt)).scalar() or 0
+            edge = (await session.execute(edge_stmt)).scalar() or 0
+            return buckets + edge
+
+    async def get_activity_heatmap(self, chat_id: int, days: Optional[int] = None) -> List[List[int]]:
+        weekday = func.strftime('%w', ActivityHourly.hour_start)
+        hour = func.strftime('%H', ActivityHourly.hour_start)
+
+        async with self.read_session() as session:
+            stmt = select(
+                weekday,
+                hour,
+                func.sum(ActivityHourly.message_count)
+            ).where(
+                self._chat_scope(ActivityHourly.chat_id, chat_id)
+            ).group_by(weekday, hour)
+
+            if days is not None:
+                stmt = stmt.where(ActivityHourly.hour_start >= truncate_to_hour(datetime.now() - timedelta(days=days)))
+
+            # Rows are Monday..Sunday, columns are hours 0..23
+            heatmap = [[0] * 24 for _ in range(7)]
+            for weekday_str, hour_str, count in (await session.execute(stmt)).all():
+                # strftime('%w') counts from Sunday = 0
+                heatmap[(int(weekday_str) + 6) % 7][int(hour_str)] += count
+
+            return heatmap
+
+    async def get_top_talkers(
+        self,
+        chat_id: int,
+        hours: Optional[int] = None,
+        limit: int = 10
+    ) -> List[tuple[str, int]]:
+        total = func.sum(ActivityHourly.message_count).label('total')
+
+        async with self.read_session() as session:
+            stmt = select(
+                ActivityHourly.user_id,
+                # Username of the newest bucket (SQLite takes bare columns from the max() row)
+                ActivityHourly.username,
+                func.max(ActivityHourly.hour_start),
+                total
+            ).where(
+                self._chat_scope(ActivityHourly.chat_id, chat_id)
+            ).group_by(
+                ActivityHourly.user_id
+            ).order_by(
+                total.desc()
+            ).limit(limit)
+
+            if hours is not None:
+                stmt = stmt.where(ActivityHourly.hour_start >= truncate_to_hour(datetime.now() - timedelta(hours=hours)))
+
             result = await session.execute(stmt)
-            deleted_count = result.rowcount
+            return [
+                (username if username else f"User{user_id}", count)
+                for user_id, username, _, count in result.all()
+            ]
+
+    async def cleanup_old_messages(
+        self,
+        days: int = 30,
+        batch_size: Optional[int] = None,
+        time_budget: Optional[float] = None
+    ) -> CleanupStats:
+        """
+        Delete messages older than `days` in short transactions.
+
+        Old rows are taken oldest first through idx_timestamp, `batch_size` at
+        a time, with a pause after every batch so ingestion is never blocked
+        for long. The run stops once `time_budget` seconds have passed; the
+        remaining rows are picked up by the next run. Freed pages are then
+        returned to the file system with incremental vacuum steps.
+        """
+        batch_size = batch_size or Config.CLEANUP_BATCH_SIZE
+        time_budget = Config.CLEANUP_TIME_BUDGET_SECONDS if time_budget is None else time_budget
+        cutoff_date = datetime.now() - timedelta(days=days)
+
+        started = time.perf_counter()
+        deadline = started + time_budget
+        stats = CleanupStats()
+
+        # Partitions that ended before the cutoff go as a whole; rows of the
+        # partition containing the cutoff stay until that partition expires
+        for partition in [p for p in self.partitions if p.end <= cutoff_date]:
+            drop_started = time.perf_counter()
+            dropped = await self._drop_partition(partition)
+            stats.rows_deleted += dropped
+            if self.archive_enabled:
+                stats.rows_archived += dropped
+            stats.partitions_dropped += 1
+            stats.record_lock(drop_started)
+
+        # The messages table itself (history from before partitioning) is trimmed row by row
+        while time.perf_counter() < deadline:
+            old_ids = select(Message.id).where(
+                Message.timestamp < cutoff_date
+            ).order_by(Message.timestamp).limit(batch_size).scalar_subquery()
+
+            batch_started = time.perf_counter()
+            async with self.async_session() as session:
+                if self.archive_enabled:
+                    old_rows = (await session.execute(
+                        select(*self._archive_columns(Message.__table__)).where(
+                            Message.timestamp < cutoff_date
+                        ).order_by(Message.timestamp).limit(batch_size)
+                    )).all()
+                    await self._archive_rows(session, old_rows)
+                    old_ids = [row.id for row in old_rows]
+
+                await session.execute(delete(QuizCandidate).where(QuizCandidate.message_id.in_(old_ids)))
+                result = await session.execute(delete(Message).where(Message.id.in_(old_ids)))
+                await session.commit()
+            stats.record_lock(batch_started)
+
+            stats.rows_deleted += result.rowcount
+            if self.archive_enabled:
+                stats.rows_archived += result.rowcount
+            stats.batches += 1
+            if result.rowcount < batch_size:
+                stats.completed = True
+                break
+
+            await asyncio.sleep(CLEANUP_BATCH_PAUSE_SECONDS)
+
+        if self.hot_window is not None:
+            self.hot_window.discard_before(cutoff_date)
+
+        # Stored summaries are keyed by message ids that no longer exist
+        async with self.async_session() as session:
+            await session.execute(delete(StoredSummary).where(StoredSummary.created_at < cutoff_date))
+            await session.execute(delete(ChunkSummary).where(ChunkSummary.chunk_start < cutoff_date))
             await session.commit()
 
-            logger.info(f"Cleaned up {deleted_count} old messages (older than {days} days)")
-            return deleted_count
+        await self._incremental_vacuum(stats, deadline)
+
+        stats.elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.info(
+            f"Cleaned up {stats.rows_deleted} old messages (older than {days} days) in {stats.batches} batches "
+            f"and {stats.partitions_dropped} dropped partitions ({stats.rows_archived} archived), "
+            f"freed {stats.pages_freed} pages, longest lock {stats.max_lock_ms:.1f} ms, "
+            f"took {stats.elapsed_ms:.0f} ms" + ("" if stats.completed else " (time budget exhausted)")
+        )
+        return stats
+
+    async def _incremental_vacuum(self, stats: CleanupStats, deadline: float) -> None:
+        async with self.async_engine.connect() as conn:
+            if (await conn.execute(text("PRAGMA auto_vacuum"))).scalar() != 2:  # 2 = INCREMENTAL
+                return
+
+        while time.perf_counter() < deadline:
+            # The writer connection is held for one step only, queued writes get in between
+            step_started = time.perf_counter()
+            async with self.async_engine.begin() as conn:
+                free_before = (await conn.execute(text("PRAGMA freelist_count"))).scalar()
+                if not free_before:
+                    break
+
+                # Each sqlite3_step of the pragma frees a single page and cursors stop after
+                # the first one; executescript runs it to the end
+                raw = await conn.get_raw_connection()
+                await raw.driver_connection.executescript(
+                    f"PRAGMA incremental_vacuum({int(Config.CLEANUP_VACUUM_PAGES)});"
+                )
+                free_after = (await conn.execute(text("PRAGMA freelist_count"))).scalar()
+            stats.record_lock(step_started)
+
+            stats.pages_freed += free_before - free_after
+            stats.vacuum_steps += 1
+            await asyncio.sleep(CLEANUP_BATCH_PAUSE_SECONDS)
 
     async def close(self) -> None:
+        if self.profanity_buffer is not None:
+            await self.profanity_buffer.stop()
+
+        if self.write_queue is not None:
+            await self.write_queue.stop()
+            stats = self.write_queue.stats
+            logger.info(
+                f"Write-behind queue drained: {stats.flushed_rows} rows in {stats.flush_count} flushes "
+                f"(avg {stats.avg_flush_ms:.1f} ms, max {stats.max_flush_ms:.1f} ms)"
+            )
+
+        self.log_hot_window_stats()
+        self.log_stats_cache_stats()
+
+        if self.read_engine is not self.async_engine:
+            await self.read_engine.dispose()
         await self.async_engine.dispose()
         logger.info("Database connections closed")
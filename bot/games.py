@@ -1,6 +1,15 @@
 import random
 from typing import List, Tuple
 from models import ChatMessage
+from consts import PHOTO_PLACEHOLDER_TEXT, QUIZ_MIN_MESSAGE_LENGTH
+
+
+def is_quiz_eligible(text: str) -> bool:
+    return (
+        len(text) >= QUIZ_MIN_MESSAGE_LENGTH
+        and not text.startswith('/')
+        and text != PHOTO_PLACEHOLDER_TEXT
+    )
 
 
 def create_quiz_question(
@@ -1,15 +1,18 @@
 from datetime import datetime
 import logging
+from typing import Optional
 from aiogram import Router, F, Bot
 from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 
 from messages import Messages
-from database import Database
+from storage import SEARCH_PAGE_SIZE, Storage
+from models import MessageIngest
+from llm_scheduler import SchedulerBusy
 from summarizer import Summarizer
 from transcription import Transcriber
 from config import Config
-from consts import NSFW_EMOJI_TRIGGERS
+from consts import NSFW_EMOJI_TRIGGERS, PHOTO_PLACEHOLDER_TEXT
 from fun_features import magic_ball, pick_random_person, rate_text, send_anime_image
 from profanity import count_profanity, get_toxicity_title
 from games import create_quiz_question
@@ -21,6 +24,10 @@ router = Router()
 KNOWN_USERS = Config.get_known_users()
 
 
+def get_active_window_hours() -> Optional[int]:
+    return Config.PARTICIPANT_ACTIVE_DAYS * 24 if Config.PARTICIPANT_ACTIVE_DAYS > 0 else None
+
+
 def get_username(message: Message) -> str:
     if message.from_user.id in KNOWN_USERS:
         return KNOWN_USERS[message.from_user.id]
@@ -41,12 +48,12 @@ async def cmd_ball(message: Message) -> None:
 
 
 @router.message(Command("who"))
-async def cmd_who(message: Message, db: Database) -> None:
+async def cmd_who(message: Message, db: Storage) -> None:
     if message.chat.type not in ["group", "supergroup"]:
         await message.answer(Messages.error_group_only())
         return
 
-    participants = await db.get_chat_participants(message.chat.id)
+    participants = await db.get_chat_participants(message.chat.id, get_active_window_hours())
     chosen = pick_random_person(participants)
 
     command_parts = message.text.split(maxsplit=1)
@@ -76,7 +83,7 @@ async def cmd_rate(message: Message) -> None:
 
 
 @router.message(Command("tox"))
-async def cmd_toxicity(message: Message, db: Database) -> None:
+async def cmd_toxicity(message: Message, db: Storage) -> None:
     if message.chat.type not in ["group", "supergroup"]:
         await message.answer(Messages.error_group_only())
         return
@@ -102,7 +109,7 @@ async def cmd_toxicity(message: Message, db: Database) -> None:
 
 
 @router.message(Command("mytox"))
-async def cmd_mytoxicity(message: Message, db: Database) -> None:
+async def cmd_mytoxicity(message: Message, db: Storage) -> None:
     if message.chat.type not in ["group", "supergroup"]:
         await message.answer(Messages.error_group_only())
         return
@@ -129,7 +136,7 @@ async def cmd_mytoxicity(message: Message, db: Database) -> None:
 
 
 @router.message(Command("whosaid"))
-async def cmd_whosaid(message: Message, db: Database) -> None:
+async def cmd_whosaid(message: Message, db: Storage) -> None:
     if message.chat.type not in ["group", "supergroup"]:
         await message.answer(Messages.error_group_only())
         return
@@ -141,7 +148,7 @@ async def cmd_whosaid(message: Message, db: Database) -> None:
             await message.answer("❌ Недостаточно сообщений для викторины! Нужно минимум 4 участника с сообщениями длиннее 20 символов.")
             return
 
-        participants = await db.get_chat_participants(message.chat.id)
+        participants = await db.get_chat_participants(message.chat.id, get_active_window_hours())
 
         if len(participants) < 4:
             await message.answer("❌ Недостаточно участников для викторины! Нужно минимум 4 участника.")
@@ -165,7 +172,7 @@ async def cmd_whosaid(message: Message, db: Database) -> None:
 
 
 @router.callback_query(F.data.startswith("quiz:"))
-async def handle_quiz_answer(callback: CallbackQuery, db: Database) -> None:
+async def handle_quiz_answer(callback: CallbackQuery, db: Storage) -> None:
     try:
         # Parse callback data: quiz:<chat_id>:<correct_answer>:<selected_answer>
         parts = callback.data.split(":", 3)
@@ -210,7 +217,7 @@ async def handle_quiz_answer(callback: CallbackQuery, db: Database) -> None:
 
 
 @router.message(Command("quizstats"))
-async def cmd_quizstats(message: Message, db: Database) -> None:
+async def cmd_quizstats(message: Message, db: Storage) -> None:
     if message.chat.type not in ["group", "supergroup"]:
         await message.answer(Messages.error_group_only())
         return
@@ -236,7 +243,7 @@ async def cmd_quizstats(message: Message, db: Database) -> None:
 
 
 @router.message(Command("summary"))
-async def cmd_summary(message: Message, db: Database, summarizer: Summarizer) -> None:
+async def cmd_summary(message: Message, db: Storage, summarizer: Summarizer) -> None:
     if message.chat.type not in ["group", "supergroup"]:
         await message.answer(Messages.error_group_only())
         return
@@ -263,21 +270,25 @@ async def cmd_summary(message: Message, db: Database, summarizer: Summarizer) ->
     processing_msg = await message.answer(Messages.processing_summary(hours))
 
     try:
-        messages = await db.get_messages_since(message.chat.id, hours)
+        message_count = await db.get_activity_count(message.chat.id, hours)
 
-        if len(messages) < 30:
+        if message_count < 30:
             await processing_msg.delete()
-            await message.answer(Messages.error_not_enough_msgs(len(messages)))
+            await message.answer(Messages.error_not_enough_msgs(message_count))
             return
 
-        summary = await summarizer.summarize(messages, hours)
+        summary = await summarizer.summarize_chat(db, message.chat.id, hours)
         result_text = Messages.summary_header(hours) + summary
 
         await processing_msg.delete()
 
         await message.answer(result_text, parse_mode="Markdown")
 
-        logger.info(f"Summary generated for chat {message.chat.id} ({len(messages)} messages, {hours} hours)")
+        logger.info(f"Summary generated for chat {message.chat.id} ({message_count} messages, {hours} hours)")
+
+    except SchedulerBusy:
+        logger.warning(f"LLM queue is full, /summary rejected for chat {message.chat.id}")
+        await processing_msg.edit_text(Messages.error_llm_busy())
 
     except Exception as e:
         logger.error(f"Error generating summary: {e}", exc_info=True)
@@ -285,17 +296,17 @@ async def cmd_summary(message: Message, db: Database, summarizer: Summarizer) ->
 
 
 @router.message(Command("stats"))
-async def cmd_stats(message: Message, db: Database) -> None:
+async def cmd_stats(message: Message, db: Storage) -> None:
     if message.chat.type not in ["group", "supergroup"]:
         await message.answer(Messages.error_group_only())
         return
 
     try:
-        messages_24h = await db.get_messages_since(message.chat.id, 24)
-        messages_7d = await db.get_messages_since(message.chat.id, 168)  # 7 days
+        messages_24h = await db.get_activity_count(message.chat.id, 24)
+        messages_7d = await db.get_activity_count(message.chat.id, 168)  # 7 days
         total_messages = await db.get_message_count(message.chat.id)
 
-        stats_text = Messages.stats(len(messages_24h), len(messages_7d), total_messages)
+        stats_text = Messages.stats(messages_24h, messages_7d, total_messages)
         await message.answer(stats_text, parse_mode="Markdown")
 
     except Exception as e:
@@ -303,8 +314,119 @@ async def cmd_stats(message: Message, db: Database) -> None:
         await message.answer(Messages.error_stats_retrieval(str(e)))
 
 
+@router.message(Command("top"))
+async def cmd_top(message: Message, db: Storage) -> None:
+    if message.chat.type not in ["group", "supergroup"]:
+        await message.answer(Messages.error_group_only())
+        return
+
+    try:
+        command_parts = message.text.split(maxsplit=1)
+        hours = int(command_parts[1]) if len(command_parts) > 1 else 24
+        if hours <= 0:
+            await message.answer(Messages.error_invalid_hours())
+            return
+    except ValueError:
+        await message.answer("❌ Используйте: `/top [часы]`")
+        return
+
+    try:
+        talkers = await db.get_top_talkers(message.chat.id, hours=hours, limit=10)
+        await message.answer(Messages.top_talkers(talkers, hours), parse_mode="Markdown")
+
+    except Exception as e:
+        logger.error(f"Error getting top talkers: {e}", exc_info=True)
+        await message.answer(Messages.error_stats_retrieval(str(e)))
+
+
+@router.message(Command("heatmap"))
+async def cmd_heatmap(message: Message, db: Storage) -> None:
+    if message.chat.type not in ["group", "supergroup"]:
+        await message.answer(Messages.error_group_only())
+        return
+
+    try:
+        command_parts = message.text.split(maxsplit=1)
+        days = int(command_parts[1]) if len(command_parts) > 1 else 30
+        if days <= 0:
+            raise ValueError(days)
+    except ValueError:
+        await message.answer("❌ Используйте: `/heatmap [дни]`")
+        return
+
+    try:
+        heatmap = await db.get_activity_heatmap(message.chat.id, days=days)
+        await message.answer(Messages.activity_heatmap(heatmap, days), parse_mode="Markdown")
+
+    except Exception as e:
+        logger.error(f"Error getting activity heatmap: {e}", exc_info=True)
+        await message.answer(Messages.error_stats_retrieval(str(e)))
+
+
+def search_page_markup(page: int, has_more: bool) -> Optional[InlineKeyboardMarkup]:
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton(text="◀ Назад", callback_data=f"search:{page - 1}"))
+    if has_more:
+        buttons.append(InlineKeyboardButton(text="Дальше ▶", callback_data=f"search:{page + 1}"))
+    return InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+
+
+async def render_search_page(db: Storage, chat_id: int, query: str, page: int) -> tuple[str, Optional[InlineKeyboardMarkup]]:
+    # One extra row tells whether a next page exists
+    results = await db.search_messages(chat_id, query, limit=SEARCH_PAGE_SIZE + 1, offset=page * SEARCH_PAGE_SIZE)
+    has_more = len(results) > SEARCH_PAGE_SIZE
+    text = Messages.search_results(query, results[:SEARCH_PAGE_SIZE], page)
+    return text, search_page_markup(page, has_more)
+
+
+@router.message(Command("search"))
+async def cmd_search(message: Message, db: Storage) -> None:
+    if message.chat.type not in ["group", "supergroup"]:
+        await message.answer(Messages.error_group_only())
+        return
+
+    command_parts = message.text.split(maxsplit=1)
+    if len(command_parts) < 2 or not command_parts[1].strip():
+        await message.answer(Messages.error_search_usage())
+        return
+
+    if not db.search_enabled:
+        await message.answer(Messages.error_search_unavailable())
+        return
+
+    try:
+        text, reply_markup = await render_search_page(db, message.chat.id, command_parts[1].strip(), 0)
+        # Replying keeps the query next to the results for the page buttons
+        await message.reply(text, reply_markup=reply_markup, parse_mode="HTML")
+
+    except Exception as e:
+        logger.error(f"Error searching messages: {e}", exc_info=True)
+        await message.answer(f"❌ Ошибка при поиске: {e}")
+
+
+@router.callback_query(F.data.startswith("search:"))
+async def handle_search_page(callback: CallbackQuery, db: Storage) -> None:
+    try:
+        # Callback data: search:<page>; the query is taken from the /search command replied to
+        page = int(callback.data.split(":", 1)[1])
+        command = callback.message.reply_to_message
+        command_parts = command.text.split(maxsplit=1) if command and command.text else []
+        if len(command_parts) < 2 or page < 0:
+            await callback.answer("❌ Ошибка данных")
+            return
+
+        text, reply_markup = await render_search_page(db, callback.message.chat.id, command_parts[1].strip(), page)
+        await callback.message.edit_text(text, reply_markup=reply_markup, parse_mode="HTML")
+        await callback.answer()
+
+    except Exception as e:
+        logger.error(f"Error handling search page: {e}", exc_info=True)
+        await callback.answer("❌ Ошибка при поиске")
+
+
 @router.message(F.text)
-async def handle_message(message: Message, db: Database) -> None:
+async def handle_message(message: Message, db: Storage) -> None:
     if message.chat.type not in ["group", "supergroup"]:
         if NSFW_EMOJI_TRIGGERS.intersection(set(message.text)):
             await send_anime_image(message, nsfw=True)
@@ -344,22 +466,14 @@ async def handle_message(message: Message, db: Database) -> None:
             username = get_username(message)
             ts = datetime.now()
 
-            await db.save_message(
+            await db.ingest_message(MessageIngest(
+                chat_id=message.chat.id,
                 user_id=message.from_user.id,
-                message_text=message.text,
                 username=username,
-                chat_id=message.chat.id,
-                ts=ts
-            )
-
-            profanity_count = count_profanity(message.text)
-            if profanity_count > 0:
-                await db.update_profanity_count(
-                    user_id=message.from_user.id,
-                    username=username,
-                    chat_id=message.chat.id,
-                    count=profanity_count
-                )
+                message_text=message.text,
+                timestamp=ts,
+                profanity_count=count_profanity(message.text)
+            ))
 
             logger.debug(f"Saved message from {message.from_user.id} ({username}) in chat {message.chat.id}")
 
@@ -368,7 +482,7 @@ async def handle_message(message: Message, db: Database) -> None:
         
         
 @router.message(F.voice)
-async def handle_voice(message: Message, bot: Bot, db: Database, transcriber: Transcriber) -> None:
+async def handle_voice(message: Message, bot: Bot, db: Storage, transcriber: Transcriber) -> None:
     if message.chat.type not in ["group", "supergroup"]:
         await send_anime_image(message)
         return
@@ -382,22 +496,14 @@ async def handle_voice(message: Message, bot: Bot, db: Database, transcriber: Tr
         text = await transcriber.transcribe_audio(audio_file)
 
         if text:
-            await db.save_message(
+            await db.ingest_message(MessageIngest(
+                chat_id=message.chat.id,
                 user_id=message.from_user.id,
-                message_text=text,
                 username=username,
-                chat_id=message.chat.id,
-                ts=ts
-            )
-
-            profanity_count = count_profanity(text)
-            if profanity_count > 0:
-                await db.update_profanity_count(
-                    user_id=message.from_user.id,
-                    username=username,
-                    chat_id=message.chat.id,
-                    count=profanity_count
-                )
+                message_text=text,
+                timestamp=ts,
+                profanity_count=count_profanity(text)
+            ))
             logger.debug(f"Saved transcribed audio message from {message.from_user.id} ({username}) in chat {message.chat.id}")
         else:
             logger.warning(f"Failed to transcribe audio from {message.from_user.id} in chat {message.chat.id}")
@@ -407,7 +513,7 @@ async def handle_voice(message: Message, bot: Bot, db: Database, transcriber: Tr
 
 
 @router.message(F.video_note)
-async def handle_video_note(message: Message, bot: Bot, db: Database, transcriber: Transcriber) -> None:
+async def handle_video_note(message: Message, bot: Bot, db: Storage, transcriber: Transcriber) -> None:
     if message.chat.type not in ["group", "supergroup"]:
         await send_anime_image(message)
         return
@@ -421,22 +527,14 @@ async def handle_video_note(message: Message, bot: Bot, db: Database, transcribe
         text = await transcriber.transcribe_video_note(video_file)
 
         if text:
-            await db.save_message(
+            await db.ingest_message(MessageIngest(
+                chat_id=message.chat.id,
                 user_id=message.from_user.id,
-                message_text=text,
                 username=username,
-                chat_id=message.chat.id,
-                ts=ts
-            )
-
-            profanity_count = count_profanity(text)
-            if profanity_count > 0:
-                await db.update_profanity_count(
-                    user_id=message.from_user.id,
-                    username=username,
-                    chat_id=message.chat.id,
-                    count=profanity_count
-                )
+                message_text=text,
+                timestamp=ts,
+                profanity_count=count_profanity(text)
+            ))
             logger.debug(f"Saved transcribed circle message from {message.from_user.id} ({username}) in chat {message.chat.id}")
         else:
             logger.warning(f"Failed to transcribe video note from {message.from_user.id} in chat {message.chat.id}")
@@ -446,7 +544,7 @@ async def handle_video_note(message: Message, bot: Bot, db: Database, transcribe
 
 
 @router.message(F.photo)
-async def handle_photo(message: Message, db: Database) -> None:
+async def handle_photo(message: Message, db: Storage) -> None:
     if message.chat.type not in ["group", "supergroup"]:
         await send_anime_image(message)
         return
@@ -456,7 +554,7 @@ async def handle_photo(message: Message, db: Database) -> None:
 
         await db.save_message(
             user_id=message.from_user.id,
-            message_text="(прислал какое-то изображение)",
+            message_text=PHOTO_PLACEHOLDER_TEXT,
             username=username,
             chat_id=message.chat.id,
             ts=ts
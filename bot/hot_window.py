@@ -0,0 +1,202 @@
+import sys
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Deque, Iterable, List, Optional, Set
+
+from models import ChatMessage
+
+
+@dataclass
+class HotWindowStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    chats: int = 0
+    messages: int = 0
+    memory_bytes: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def message_size(message: ChatMessage) -> int:
+    """Approximate memory held by one cached message."""
+    return sys.getsizeof(message) + sys.getsizeof(message.timestamp) + sys.getsizeof(message.message_text)
+
+
+class ChatWindow:
+    """Messages of one chat, oldest first, complete from covered_since onwards."""
+
+    __slots__ = ('messages', 'covered_since', 'nbytes')
+
+    def __init__(self, covered_since: datetime) -> None:
+        self.messages: Deque[ChatMessage] = deque()
+        self.covered_since = covered_since
+        self.nbytes = 0
+
+    def append(self, message: ChatMessage) -> int:
+        size = message_size(message)
+        messages = self.messages
+
+        if not messages or messages[-1].timestamp <= message.timestamp:
+            messages.append(message)
+        else:
+            # Out of order (rare): keep the deque sorted like the database query
+            position = len(messages)
+            while position > 0 and messages[position - 1].timestamp > message.timestamp:
+                position -= 1
+            messages.insert(position, message)
+
+        self.nbytes += size
+        return size
+
+    def trim(self, horizon: datetime) -> int:
+        """Drop messages older than horizon, returns the number of bytes freed."""
+        freed = 0
+        messages = self.messages
+        while messages and messages[0].timestamp < horizon:
+            freed += message_size(messages.popleft())
+
+        self.covered_since = max(self.covered_since, horizon)
+        self.nbytes -= freed
+        return freed
+
+    def since(self, since_time: datetime) -> List[ChatMessage]:
+        # Walk back from the newest message, the result is usually a short tail
+        tail = []
+        for message in reversed(self.messages):
+            if message.timestamp < since_time:
+                break
+            tail.append(message)
+        tail.reverse()
+        return tail
+
+
+class HotWindowCache:
+    """
+    Recent history of every active chat, kept in memory.
+
+    Each chat holds a time-bounded ring of its last `hours` of messages. It is
+    filled from the database at startup and afterwards by the ingest path, so
+    a window answers any query whose start lies inside it. When the total
+    size exceeds `max_bytes`, the least recently used chats are dropped and go
+    back to the database until their window has filled up again.
+    """
+
+    def __init__(self, hours: int, max_bytes: int) -> None:
+        self.hours = hours
+        self.max_bytes = max_bytes
+        self._windows: "OrderedDict[int, ChatWindow]" = OrderedDict()
+        # Chats that may have messages in the database which are not cached
+        self._dropped: Set[int] = set()
+        # Every chat not in _dropped is complete from here on
+        self._warmed_since: Optional[datetime] = None
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def is_warm(self) -> bool:
+        return self._warmed_since is not None
+
+    def horizon(self, now: Optional[datetime] = None) -> datetime:
+        return (now or datetime.now()) - timedelta(hours=self.hours)
+
+    def mark_warm(self, since: datetime, skipped_chats: Iterable[int] = ()) -> None:
+        self._warmed_since = since
+        self._dropped.update(skipped_chats)
+
+    def load(self, chat_id: int, messages: Iterable[ChatMessage], covered_since: datetime) -> None:
+        window = ChatWindow(covered_since)
+        for message in messages:
+            self._bytes += window.append(message)
+        self._install(chat_id, window)
+        self._evict()
+
+    def add(self, message: ChatMessage) -> None:
+        chat_id = message.chat_id
+        window = self._windows.get(chat_id)
+
+        if window is None:
+            if self._warmed_since is not None and chat_id not in self._dropped:
+                covered_since = self._warmed_since
+            else:
+                # Older messages may exist in the database, only this one onwards is known
+                covered_since = message.timestamp
+            window = ChatWindow(covered_since)
+            self._install(chat_id, window)
+        else:
+            self._windows.move_to_end(chat_id)
+
+        if message.username:
+            message.username = sys.intern(message.username)
+        self._bytes += window.append(message)
+        self._bytes -= window.trim(self.horizon(message.timestamp))
+        self._evict()
+
+    def get(self, chat_id: int, since_time: datetime) -> Optional[List[ChatMessage]]:
+        """Messages since since_time, or None when the window does not cover it."""
+        window = self._windows.get(chat_id)
+
+        if window is None:
+            # A chat that never wrote since warm-up has no messages in the window
+            if self._warmed_since is not None and chat_id not in self._dropped and since_time >= self._warmed_since:
+                self._hits += 1
+                return []
+            self._misses += 1
+            return None
+
+        # since_time was taken before now, trimming to a fresh horizon would move the window past it
+        self._bytes -= window.trim(min(self.horizon(), since_time))
+        if since_time < window.covered_since:
+            self._misses += 1
+            return None
+
+        self._windows.move_to_end(chat_id)
+        self._hits += 1
+        return window.since(since_time)
+
+    def discard_before(self, cutoff: datetime) -> None:
+        """Forget messages that were deleted from the database."""
+        for window in self._windows.values():
+            self._bytes -= window.trim(cutoff)
+
+    def invalidate(self, chat_id: Optional[int] = None) -> None:
+        chat_ids = list(self._windows) if chat_id is None else [chat_id]
+        for key in chat_ids:
+            window = self._windows.pop(key, None)
+            if window is not None:
+                self._bytes -= window.nbytes
+            self._dropped.add(key)
+        if chat_id is None:
+            self._warmed_since = None
+
+    def _install(self, chat_id: int, window: ChatWindow) -> None:
+        previous = self._windows.pop(chat_id, None)
+        if previous is not None:
+            self._bytes -= previous.nbytes
+        self._windows[chat_id] = window
+        self._dropped.discard(chat_id)
+
+    def _evict(self) -> None:
+        # Least recently used first; a single chat above the cap goes as well
+        while self._bytes > self.max_bytes and self._windows:
+            chat_id, window = self._windows.popitem(last=False)
+            self._bytes -= window.nbytes
+            self._dropped.add(chat_id)
+            self._evictions += 1
+
+    @property
+    def stats(self) -> HotWindowStats:
+        return HotWindowStats(
+            hits=self._hits,
+            misses=self._misses,
+            evictions=self._evictions,
+            chats=len(self._windows),
+            messages=sum(len(window.messages) for window in self._windows.values()),
+            memory_bytes=self._bytes
+        )
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, Hashable, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Lower runs first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND)
+
+# Tokens per minute are counted over a sliding window of this many seconds
+TOKEN_WINDOW_SECONDS = 60.0
+
+
+class SchedulerBusy(Exception):
+    """Raised instead of queueing an LLM call when the scheduler queue is full."""
+
+
+@dataclass(frozen=True)
+class LLMRequest:
+    """Who an LLM call is made for; calls are fair between chats."""
+    chat_id: Optional[int] = None
+    priority: int = PRIORITY_BACKGROUND
+
+
+# Set around a /summary or a background job, inherited by the tasks it starts
+current_llm_request: ContextVar[LLMRequest] = ContextVar("current_llm_request", default=LLMRequest())
+
+
+@dataclass
+class LLMSchedulerStats:
+    started: int = 0
+    rejected: int = 0
+    queued: int = 0
+    running: int = 0
+    tokens_last_minute: int = 0
+    # Total time started calls spent in the queue
+    wait_seconds: float = 0.0
+
+    @property
+    def avg_wait_ms(self) -> float:
+        return self.wait_seconds * 1000 / self.started if self.started else 0.0
+
+
+@dataclass
+class _Waiter:
+    future: asyncio.Future
+    tokens: int
+    chat_key: Hashable
+    enqueued: float = field(default_factory=time.monotonic)
+
+
+class LLMScheduler:
+    """
+    Admission control for LLM provider calls.
+
+    At most `max_concurrency` calls run at once and, with `tokens_per_minute`
+    set, a call starts only while the estimated tokens of the calls started
+    in the last minute leave room for it. Waiting calls are served by
+    priority and, within a priority, round-robin between chats, so one chat's
+    map-reduce parts cannot hold back everyone else. At most `max_queue`
+    calls wait; beyond that SchedulerBusy is raised right away.
+    """
+
+    def __init__(self, max_concurrency: int, tokens_per_minute: int = 0, max_queue: int = 32) -> None:
+        self.max_concurrency = max(1, max_concurrency)
+        self.tokens_per_minute = tokens_per_minute
+        self.max_queue = max_queue
+        # Per priority: chat -> its waiting calls, in round-robin order
+        self._queues: Dict[int, "OrderedDict[Hashable, Deque[_Waiter]]"] = {p: OrderedDict() for p in PRIORITIES}
+        self._queued = 0
+        self._running = 0
+        # (start time, tokens) of the calls started within the token window
+        self._spent: Deque[Tuple[float, int]] = deque()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._started = 0
+        self._rejected = 0
+        self._wait_seconds = 0.0
+
+    @property
+    def saturated(self) -> bool:
+        """Whether a new call would be rejected."""
+        return self._queued >= self.max_queue and (self._queued > 0 or self._running >= self.max_concurrency)
+
+    def admit(self) -> None:
+        """Reject up front, before any work is done for a call that could not be queued."""
+        if self.saturated:
+            self._rejected += 1
+            raise SchedulerBusy(f"LLM queue is full ({self._queued} waiting, {self._running} running)")
+
+    async def run(self, tokens: int, fn: Callable[[], Awaitable[T]], request: Optional[LLMRequest] = None) -> T:
+        """Run fn once a slot and the token budget allow; `tokens` is the call's estimated cost."""
+        if request is None:
+            request = current_llm_request.get()
+        priority = request.priority if request.priority in self._queues else PRIORITY_BACKGROUND
+        # Calls without a chat share one round-robin turn
+        chat_key = request.chat_id
+
+        self.admit()
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), tokens, chat_key)
+        self._queues[priority].setdefault(chat_key, deque()).append(waiter)
+        self._queued += 1
+        self._dispatch()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.cancelled():
+                self._remove(priority, waiter)
+            else:
+                # Granted a slot in the same step as the cancellation
+                self._release()
+            raise
+
+        try:
+            return await fn()
+        finally:
+            self._release()
+
+    def _remove(self, priority: int, waiter: _Waiter) -> None:
+        chats = self._queues[priority]
+        waiters = chats.get(waiter.chat_key)
+        if waiters is None or waiter not in waiters:
+            return
+        waiters.remove(waiter)
+        if not waiters:
+            del chats[waiter.chat_key]
+        self._queued -= 1
+        # The removed call may have been the one holding the others back
+        self._dispatch()
+
+    def _release(self) -> None:
+        self._running -= 1
+        self._dispatch()
+
+    def _tokens_in_window(self, now: float) -> int:
+        while self._spent and self._spent[0][0] <= now - TOKEN_WINDOW_SECONDS:
+            self._spent.popleft()
+        return sum(tokens for _, tokens in self._spent)
+
+    def _dispatch(self) -> None:
+        while self._running < self.max_concurrency:
+            chats = next((self._queues[p] for p in PRIORITIES if self._queues[p]), None)
+            if chats is None:
+                return
+
+            chat_key, waiters = next(iter(chats.items()))
+            waiter = waiters[0]
+            now = time.monotonic()
+            if self.tokens_per_minute > 0 and self._spent:
+                spent = self._tokens_in_window(now)
+                # A call bigger than the whole budget still runs once the window is empty
+                if spent and spent + waiter.tokens > self.tokens_per_minute:
+                    self._wake_at(self._spent[0][0] + TOKEN_WINDOW_SECONDS - now)
+                    return
+
+            waiters.popleft()
+            del chats[chat_key]
+            if waiters:
+                # The chat goes to the back of the round
+                chats[chat_key] = waiters
+            self._queued -= 1
+            self._running += 1
+            self._started += 1
+            self._wait_seconds += now - waiter.enqueued
+            if self.tokens_per_minute > 0:
+                self._spent.append((now, waiter.tokens))
+            waiter.future.set_result(None)
+
+    def _wake_at(self, delay: float) -> None:
+        if self._timer is not None and not self._timer.cancelled():
+            return
+
+        def wake() -> None:
+            self._timer = None
+            self._dispatch()
+
+        self._timer = asyncio.get_running_loop().call_later(max(delay, 0.0), wake)
+
+    @property
+    def stats(self) -> LLMSchedulerStats:
+        return LLMSchedulerStats(
+            started=self._started,
+            rejected=self._rejected,
+            queued=self._queued,
+            running=self._running,
+            tokens_last_minute=self._tokens_in_window(time.monotonic()),
+            wait_seconds=self._wait_seconds
+        )
+
+    def log_stats(self) -> None:
+        stats = self.stats
+        logger.info(
+            f"LLM scheduler: {stats.started} calls started, {stats.rejected} rejected as busy, "
+            f"{stats.running} running, {stats.queued} queued, {stats.avg_wait_ms:.0f} ms average wait, "
+            f"~{stats.tokens_last_minute} tokens in the last minute"
+        )
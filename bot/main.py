@@ -8,8 +8,10 @@ from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
 from utils import AccessControlMiddleware, DependencyInjectionMiddleware
+from backup import run_scheduled_backup
 from config import Config
 from database import Database
+from storage import Storage, create_storage
 from summarizer import Summarizer
 from transcription import Transcriber
 from handlers import router
@@ -31,7 +33,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-async def on_startup(bot: Bot, db: Database) -> None:
+async def on_startup(bot: Bot, db: Storage) -> None:
     logger.info("Starting bot...")
 
     await db.init_db()
@@ -43,8 +45,9 @@ async def on_startup(bot: Bot, db: Database) -> None:
     logger.info(f"Default summary hours: {Config.DEFAULT_SUMMARY_HOURS}")
 
 
-async def on_shutdown(bot: Bot) -> None:
+async def on_shutdown(bot: Bot, db: Storage) -> None:
     logger.info("Shutting down bot...")
+    await db.close()
     await bot.session.close()
 
 
@@ -57,7 +60,7 @@ async def main() -> None:
             default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN)
         )
 
-        db = Database(Config.DB_PATH)
+        db = create_storage(Config.DB_PATH)
         summarizer = Summarizer()
         transcriber = Transcriber()
 
@@ -76,16 +79,47 @@ async def main() -> None:
         await on_startup(bot, db)
 
         async def periodic_cleanup():
+            delay = 86400  # 24 часа
             while True:
                 try:
-                    await asyncio.sleep(86400)  # 24 часа
+                    await asyncio.sleep(delay)
                     logger.info("Running periodic message cleanup...")
-                    deleted = await db.cleanup_old_messages(Config.MESSAGE_CLEANUP_DAYS)
-                    logger.info(f"Cleanup completed: {deleted} messages deleted")
+                    stats = await db.cleanup_old_messages(Config.MESSAGE_CLEANUP_DAYS)
+                    logger.info(f"Cleanup completed: {stats.rows_deleted} messages deleted")
+                    # A run cut short by its time budget continues soon instead of tomorrow
+                    delay = 86400 if stats.completed else 60
+                    db.log_hot_window_stats()
+                    db.log_stats_cache_stats()
+                    summarizer.log_stats()
                 except Exception as e:
                     logger.error(f"Error in periodic cleanup: {e}", exc_info=True)
         cleanup_task = asyncio.create_task(periodic_cleanup())
 
+        async def periodic_backup():
+            while True:
+                try:
+                    await asyncio.sleep(Config.BACKUP_INTERVAL_HOURS * 3600)
+                    logger.info("Running scheduled database backup...")
+                    # The backup API is blocking; the thread copies a few pages at a time
+                    result = await asyncio.to_thread(
+                        run_scheduled_backup,
+                        db.db_file,
+                        Config.BACKUP_DIR,
+                        full_every=Config.BACKUP_FULL_EVERY,
+                        keep_full=Config.BACKUP_KEEP_FULL,
+                        compress=Config.BACKUP_COMPRESS,
+                        pages_per_step=Config.BACKUP_PAGES_PER_STEP
+                    )
+                    if result is None:
+                        logger.error("Scheduled backup failed")
+                except Exception as e:
+                    logger.error(f"Error in scheduled backup: {e}", exc_info=True)
+
+        backup_task = None
+        # Online backups copy the SQLite file, other backends are backed up by their own tools
+        if Config.BACKUP_INTERVAL_HOURS > 0 and isinstance(db, Database):
+            backup_task = asyncio.create_task(periodic_backup())
+
         try:
             logger.info("Bot is running. Press Ctrl+C to stop.")
             await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
@@ -94,12 +128,15 @@ async def main() -> None:
             logger.info("Received stop signal")
 
         finally:
-            cleanup_task.cancel()
-            try:
-                await cleanup_task
-            except asyncio.CancelledError:
-                pass
-            await on_shutdown(bot)
+            for task in (cleanup_task, backup_task):
+                if task is None:
+                    continue
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+            await on_shutdown(bot, db)
 
     except Exception as e:
         logger.error(f"Fatal error: {e}", exc_info=True)
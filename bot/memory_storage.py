@@ -0,0 +1,246 @@
+import logging
+import random
+import time
+from bisect import insort
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from games import is_quiz_eligible
+from models import ChatMessage, MessageIngest
+from participants import Participant
+from storage import CleanupStats, Storage, truncate_to_hour
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryStorage(Storage):
+    """
+    Storage backend that keeps everything in process memory.
+
+    Meant for tests and load benchmarks: nothing touches the disk and all
+    state is gone once the process exits.
+    """
+
+    def __init__(self) -> None:
+        # Per chat, ordered by (timestamp, id)
+        self._messages: Dict[int, List[Tuple[datetime, int, ChatMessage]]] = {}
+        self._next_id = 1
+        # Per chat: message ids that can be asked in /whosaid
+        self._quiz_pool: Dict[int, List[int]] = {}
+        self._by_id: Dict[int, ChatMessage] = {}
+        # (chat_id, user_id, hour_start) -> [username, count]
+        self._activity: Dict[Tuple[int, int, datetime], List] = {}
+        self._participants: Dict[int, Dict[int, Participant]] = {}
+        # (chat_id, user_id) -> [username, count]
+        self._profanity: Dict[Tuple[int, int], List] = {}
+        # (chat_id, user_id) -> [username, correct, total]
+        self._quiz_scores: Dict[Tuple[int, int], List] = {}
+        # (chat_id, hours, last_message_id, model) -> (summary, created_at)
+        self._summaries: Dict[Tuple[int, int, int, str], Tuple[str, datetime]] = {}
+        # (chat_id, chunk_hours, model) -> {chunk_start: summary}
+        self._chunk_summaries: Dict[Tuple[int, int, str], Dict[datetime, str]] = {}
+
+    async def init_db(self) -> None:
+        logger.info("Using in-memory storage, nothing is persisted")
+
+    async def close(self) -> None:
+        logger.info("In-memory storage closed")
+
+    async def ingest_message(self, record: MessageIngest) -> None:
+        message_id = self._next_id
+        self._next_id += 1
+
+        message = ChatMessage(
+            user_id=record.user_id,
+            message_text=record.message_text,
+            timestamp=record.timestamp,
+            username=record.username,
+            chat_id=record.chat_id
+        )
+        insort(self._messages.setdefault(record.chat_id, []), (record.timestamp, message_id, message),
+               key=lambda item: (item[0], item[1]))
+        self._by_id[message_id] = message
+        if is_quiz_eligible(record.message_text):
+            self._quiz_pool.setdefault(record.chat_id, []).append(message_id)
+
+        bucket = self._activity.setdefault(
+            (record.chat_id, record.user_id, truncate_to_hour(record.timestamp)), [record.username, 0]
+        )
+        bucket[0] = record.username
+        bucket[1] += 1
+
+        directory = self._participants.setdefault(record.chat_id, {})
+        participant = directory.get(record.user_id)
+        last_seen = max(participant.last_seen, record.timestamp) if participant else record.timestamp
+        directory[record.user_id] = Participant(record.user_id, record.username, last_seen)
+
+        # Leaderboards show the name of the latest message
+        key = (record.chat_id, record.user_id)
+        for entry in (self._profanity.get(key), self._quiz_scores.get(key)):
+            if entry is not None:
+                entry[0] = record.username
+
+        if record.profanity_count > 0:
+            await self.update_profanity_count(record.user_id, record.username, record.chat_id, record.profanity_count)
+
+    def _since(self, chat_id: int, since_time: datetime) -> List[ChatMessage]:
+        return [message for timestamp, _, message in self._messages.get(chat_id, []) if timestamp >= since_time]
+
+    async def get_messages_since(self, chat_id: int, hours: int) -> List[ChatMessage]:
+        messages = self._since(chat_id, datetime.now() - timedelta(hours=hours))
+        logger.info(f"Retrieved {len(messages)} messages from chat {chat_id} for last {hours} hours")
+        return messages
+
+    async def get_message_count(self, chat_id: Optional[int] = None) -> int:
+        if chat_id is not None:
+            return len(self._messages.get(chat_id, []))
+        return sum(len(messages) for messages in self._messages.values())
+
+    async def get_last_message_id(self, chat_id: int, hours: int) -> Optional[int]:
+        since_time = datetime.now() - timedelta(hours=hours)
+        return max(
+            (message_id for timestamp, message_id, _ in self._messages.get(chat_id, []) if timestamp >= since_time),
+            default=None
+        )
+
+    async def get_stored_summary(
+        self,
+        chat_id: int,
+        hours: int,
+        last_message_id: int,
+        model: str,
+        created_after: datetime
+    ) -> Optional[str]:
+        stored = self._summaries.get((chat_id, hours, last_message_id, model))
+        if stored is None or stored[1] < created_after:
+            return None
+        return stored[0]
+
+    async def store_summary(self, chat_id: int, hours: int, last_message_id: int, model: str, summary: str) -> None:
+        self._summaries[(chat_id, hours, last_message_id, model)] = (summary, datetime.now())
+
+    async def get_chunk_summaries(
+        self,
+        chat_id: int,
+        chunk_hours: int,
+        model: str,
+        since: datetime,
+        until: datetime
+    ) -> Dict[datetime, str]:
+        chunks = self._chunk_summaries.get((chat_id, chunk_hours, model), {})
+        return {start: summary for start, summary in chunks.items() if since <= start < until}
+
+    async def store_chunk_summaries(self, chat_id: int, chunk_hours: int, model: str, chunks: Dict[datetime, str]) -> None:
+        self._chunk_summaries.setdefault((chat_id, chunk_hours, model), {}).update(chunks)
+
+    async def get_chat_participants(self, chat_id: int, active_within_hours: Optional[int] = None) -> List[str]:
+        participants = list(self._participants.get(chat_id, {}).values())
+        if active_within_hours is not None:
+            since_time = datetime.now() - timedelta(hours=active_within_hours)
+            participants = [p for p in participants if p.last_seen >= since_time]
+
+        usernames = []
+        for participant in participants:
+            if participant.username and participant.username not in usernames:
+                usernames.append(participant.username)
+        return usernames
+
+    async def update_profanity_count(self, user_id: int, username: str, chat_id: int, count: int) -> None:
+        if count == 0:
+            return
+        entry = self._profanity.setdefault((chat_id, user_id), [username, 0])
+        entry[0] = username
+        entry[1] += count
+
+    async def get_profanity_stats(self, chat_id: int, limit: int = 10) -> List[tuple[str, int]]:
+        ranked = sorted(
+            (entry for (entry_chat, _), entry in self._profanity.items() if entry_chat == chat_id),
+            key=lambda entry: entry[1],
+            reverse=True
+        )
+        return [(username, count) for username, count in ranked[:limit]]
+
+    async def get_user_profanity_count(self, user_id: int, chat_id: int) -> int:
+        entry = self._profanity.get((chat_id, user_id))
+        return entry[1] if entry else 0
+
+    async def get_random_message_for_quiz(self, chat_id: int) -> Optional[ChatMessage]:
+        pool = self._quiz_pool.get(chat_id)
+        if not pool:
+            return None
+        return self._by_id[random.choice(pool)]
+
+    async def update_quiz_score(self, user_id: int, username: str, chat_id: int, correct: bool) -> None:
+        entry = self._quiz_scores.setdefault((chat_id, user_id), [username, 0, 0])
+        entry[0] = username
+        entry[1] += 1 if correct else 0
+        entry[2] += 1
+
+    async def get_quiz_leaderboard(self, chat_id: int, limit: int = 10) -> List[tuple[str, int, int]]:
+        ranked = sorted(
+            (entry for (entry_chat, _), entry in self._quiz_scores.items() if entry_chat == chat_id),
+            key=lambda entry: entry[1],
+            reverse=True
+        )
+        return [(username, correct, total) for username, correct, total in ranked[:limit]]
+
+    def _buckets(self, chat_id: int, since_hour: Optional[datetime] = None):
+        for (bucket_chat, user_id, hour_start), (username, count) in self._activity.items():
+            if bucket_chat == chat_id and (since_hour is None or hour_start >= since_hour):
+                yield user_id, hour_start, username, count
+
+    async def get_activity_count(self, chat_id: int, hours: int) -> int:
+        since_time = datetime.now() - timedelta(hours=hours)
+        # Whole hours from the rollup, which outlives retention, the partial first hour from messages
+        first_full_hour = truncate_to_hour(since_time) + timedelta(hours=1)
+        buckets = sum(count for _, _, _, count in self._buckets(chat_id, first_full_hour))
+        edge = sum(
+            1 for timestamp, _, _ in self._messages.get(chat_id, []) if since_time <= timestamp < first_full_hour
+        )
+        return buckets + edge
+
+    async def get_activity_heatmap(self, chat_id: int, days: Optional[int] = None) -> List[List[int]]:
+        since_hour = truncate_to_hour(datetime.now() - timedelta(days=days)) if days is not None else None
+        # Rows are Monday..Sunday, columns are hours 0..23
+        heatmap = [[0] * 24 for _ in range(7)]
+        for _, hour_start, _, count in self._buckets(chat_id, since_hour):
+            heatmap[hour_start.weekday()][hour_start.hour] += count
+        return heatmap
+
+    async def get_top_talkers(self, chat_id: int, hours: Optional[int] = None, limit: int = 10) -> List[tuple[str, int]]:
+        since_hour = truncate_to_hour(datetime.now() - timedelta(hours=hours)) if hours is not None else None
+        # user_id -> [newest hour, username of that hour, total]
+        totals: Dict[int, List] = {}
+        for user_id, hour_start, username, count in self._buckets(chat_id, since_hour):
+            entry = totals.setdefault(user_id, [hour_start, username, 0])
+            if hour_start >= entry[0]:
+                entry[0], entry[1] = hour_start, username
+            entry[2] += count
+
+        ranked = sorted(totals.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+        return [(username if username else f"User{user_id}", total) for user_id, (_, username, total) in ranked]
+
+    async def cleanup_old_messages(self, days: int = 30) -> CleanupStats:
+        started = time.perf_counter()
+        cutoff_date = datetime.now() - timedelta(days=days)
+        stats = CleanupStats(batches=1, completed=True)
+
+        for chat_id, messages in self._messages.items():
+            expired = [message_id for timestamp, message_id, _ in messages if timestamp < cutoff_date]
+            if not expired:
+                continue
+
+            self._messages[chat_id] = messages[len(expired):]
+            expired_ids = set(expired)
+            for message_id in expired:
+                del self._by_id[message_id]
+            if chat_id in self._quiz_pool:
+                self._quiz_pool[chat_id] = [i for i in self._quiz_pool[chat_id] if i not in expired_ids]
+            stats.rows_deleted += len(expired)
+
+        self._summaries = {key: stored for key, stored in self._summaries.items() if stored[1] >= cutoff_date}
+        for key, chunks in self._chunk_summaries.items():
+            self._chunk_summaries[key] = {start: summary for start, summary in chunks.items() if start >= cutoff_date}
+        stats.elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"Cleaned up {stats.rows_deleted} old messages (older than {days} days)")
+        return stats
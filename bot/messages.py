@@ -3,6 +3,11 @@ Bot messages and text templates.
 Centralized message management for easy localization and maintenance.
 """
 
+import html
+from datetime import datetime
+
+from consts import SNIPPET_CLOSE, SNIPPET_OPEN
+
 
 class Messages:
     """Collection of all bot messages and text templates."""
@@ -30,6 +35,69 @@ class Messages:
 За последние 7 дней: {messages_7d} сообщений
 Всего сохранено: {total} сообщений"""
 
+    @staticmethod
+    def top_talkers(talkers: list[tuple[str, int]], hours: int) -> str:
+        """
+        Most active participants message.
+
+        Args:
+            talkers: (display name, message count) pairs, most active first
+            hours: Number of hours covered
+        """
+        if not talkers:
+            return f"📭 За последние {hours} часов в чате никто не писал."
+
+        lines = [f"🗣 **Самые активные за последние {hours} часов:**\n"]
+        for i, (username, count) in enumerate(talkers, 1):
+            medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else f"{i}."
+            lines.append(f"{medal} **{username}**: {count} сообщений")
+        return "\n".join(lines)
+
+    @staticmethod
+    def activity_heatmap(heatmap: list[list[int]], days: int) -> str:
+        """
+        Activity heatmap (weekday x hour of day).
+
+        Args:
+            heatmap: 7 rows (Monday..Sunday) of 24 hourly message counts
+            days: Number of days covered
+        """
+        peak = max((count for row in heatmap for count in row), default=0)
+        if peak == 0:
+            return f"📭 За последние {days} дней в чате никто не писал."
+
+        shades = " ░▒▓█"
+        weekdays = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+        rows = ["   0     6     12    18"]
+        for name, row in zip(weekdays, heatmap):
+            cells = "".join(shades[0 if count == 0 else 1 + (count * 4 - 1) // peak] for count in row)
+            rows.append(f"{name} {cells}")
+
+        grid = "\n".join(rows)
+        return f"🔥 **Активность чата за последние {days} дней:**\n\n```\n{grid}\n```\nМаксимум: {peak} сообщений в час"
+
+    @staticmethod
+    def search_results(query: str, results: list, page: int) -> str:
+        """
+        Full-text search results page (HTML).
+
+        Args:
+            query: Search query as typed by the user
+            results: SearchResult items of this page, best match first
+            page: Zero-based page number
+        """
+        if not results:
+            if page == 0:
+                return f"🔍 По запросу «{html.escape(query)}» ничего не найдено."
+            return f"🔍 Больше результатов по запросу «{html.escape(query)}» нет."
+
+        lines = [f"🔍 <b>Результаты по запросу «{html.escape(query)}»</b> (стр. {page + 1}):\n"]
+        for result in results:
+            snippet = html.escape(result.snippet).replace(SNIPPET_OPEN, "<b>").replace(SNIPPET_CLOSE, "</b>")
+            date_str = result.timestamp.strftime("%d.%m.%Y %H:%M")
+            lines.append(f"<b>{html.escape(result.get_display_name())}</b>, {date_str}\n{snippet}\n")
+        return "\n".join(lines)
+
     @staticmethod
     def summary_header(hours: int) -> str:
         """
@@ -78,6 +146,16 @@ class Messages:
         """Error for invalid command format."""
         return "❌ Неверный формат! Используйте: /summary [часы]\nПример: /summary 24"
 
+    @staticmethod
+    def error_search_usage() -> str:
+        """Error for /search without a query."""
+        return "❌ Используйте: /search <текст>\nПример: /search шашлыки"
+
+    @staticmethod
+    def error_search_unavailable() -> str:
+        """Error when the database has no full-text index."""
+        return "❌ Поиск недоступен: SQLite собран без FTS5"
+
     @staticmethod
     def error_summary_generation(error: str) -> str:
         """
@@ -88,6 +166,11 @@ class Messages:
         """
         return f"❌ Ошибка при генерации саммари: {error}"
 
+    @staticmethod
+    def error_llm_busy() -> str:
+        """Error when too many summaries are being generated to queue another one."""
+        return "⏳ Сейчас слишком много запросов к нейросети, попробуйте через пару минут"
+
     @staticmethod
     def error_stats_retrieval(error: str) -> str:
         """
@@ -142,6 +225,31 @@ class Messages:
 
 Разговор за последние {hours} часов:"""
 
+    @staticmethod
+    def ai_chunk_prompt(start: datetime, end: datetime) -> str:
+        """
+        Prompt for the summary of one closed time chunk (hierarchical mode).
+
+        Args:
+            start: Chunk start
+            end: Chunk end
+        """
+        return f"""Ты - ассистент для анализа групповых разговоров в Telegram.
+Кратко перескажи на русском языке фрагмент разговора за {start:%d.%m %H:%M}–{end:%d.%m %H:%M}:
+о чем говорили, что решили, кто был активен. Не более 5 предложений, без вступлений.
+
+Фрагмент разговора:"""
+
+    @staticmethod
+    def ai_chunk_summaries_header() -> str:
+        """Header before the stored chunk summaries in the hierarchical prompt."""
+        return "Краткие пересказы разговора по периодам:"
+
+    @staticmethod
+    def ai_recent_messages_header() -> str:
+        """Header before the raw messages of the open chunk in the hierarchical prompt."""
+        return "Последние сообщения:"
+
     @staticmethod
     def ai_empty_response_error(provider: str) -> str:
         """
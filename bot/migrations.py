@@ -0,0 +1,406 @@
+import logging
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence, Set
+
+from consts import PHOTO_PLACEHOLDER_TEXT, QUIZ_MIN_MESSAGE_LENGTH, SQLITE_HOUR_FORMAT
+
+logger = logging.getLogger(__name__)
+
+VERSION_TABLE = 'schema_version'
+STATE_TABLE = 'maintenance_state'
+MIGRATION_BATCH_SIZE = 1000
+MIGRATION_BATCH_PAUSE_SECONDS = 0.05
+PROGRESS_LOG_SECONDS = 5.0
+
+
+@dataclass
+class Backfill:
+    """
+    Data change applied to one table in id ranges, one short transaction each.
+
+    `apply` is run per batch with the :low (exclusive) and :high (inclusive)
+    id bounds and must be idempotent. `pending` is a WHERE clause matching the
+    rows that still need the change; it is only used for estimates and to
+    skip a backfill that has nothing to do. New rows written while the
+    backfill runs must already be written in the new form by the bot.
+    """
+
+    table: str
+    apply: str
+    pending: str
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    # Idempotent DDL, runs in one transaction before the backfill
+    schema: Optional[Callable[[sqlite3.Connection], None]] = None
+    backfill: Optional[Backfill] = None
+
+
+@dataclass
+class MigrationEstimate:
+    version: int
+    name: str
+    rows: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    # False when rows is an upper bound, the pending clause needed schema that does not exist yet
+    exact: bool = True
+
+
+def column_exists(conn: sqlite3.Connection, table: str, column: str) -> bool:
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+
+def table_exists(conn: sqlite3.Connection, table: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+
+def add_chat_id(conn: sqlite3.Connection) -> None:
+    # Rows saved before chat_id existed get chat_id = 0, see scripts/backfill_legacy_chat_id.py
+    if not column_exists(conn, 'messages', 'chat_id'):
+        conn.execute("ALTER TABLE messages ADD COLUMN chat_id INTEGER NOT NULL DEFAULT 0")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_messages_chat_id ON messages (chat_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_timestamp ON messages (chat_id, timestamp)")
+
+
+def create_quiz_pool(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS quiz_pool (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_quiz_pool_chat_id ON quiz_pool (chat_id, id)")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_quiz_pool_message ON quiz_pool (message_id)")
+
+
+def create_activity_hourly(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS activity_hourly (
+            id INTEGER PRIMARY KEY,
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            username VARCHAR,
+            hour_start DATETIME NOT NULL,
+            message_count INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_activity_chat_user_hour ON activity_hourly (chat_id, user_id, hour_start)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_activity_chat_hour ON activity_hourly (chat_id, hour_start)")
+
+
+def create_chat_participants(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS chat_participants (
+            id INTEGER PRIMARY KEY,
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            username VARCHAR,
+            first_seen DATETIME NOT NULL,
+            last_seen DATETIME NOT NULL,
+            message_count INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_participants_chat_user ON chat_participants (chat_id, user_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_participants_chat_last_seen ON chat_participants (chat_id, last_seen)")
+
+
+# SQL twin of games.is_quiz_eligible, like database.quiz_eligible_clause
+QUIZ_ELIGIBLE = (
+    f"length(message_text) >= {QUIZ_MIN_MESSAGE_LENGTH} "
+    f"AND message_text NOT LIKE '/%' "
+    f"AND message_text != '{PHOTO_PLACEHOLDER_TEXT}'"
+)
+
+# Ordered, append only: a released version is never changed or renumbered
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'add_chat_id', schema=add_chat_id),
+    Migration(2, 'quiz_pool', schema=create_quiz_pool, backfill=Backfill(
+        table='messages',
+        apply=f"""
+            INSERT OR IGNORE INTO quiz_pool (chat_id, message_id)
+            SELECT chat_id, id FROM messages
+            WHERE id > :low AND id <= :high AND {QUIZ_ELIGIBLE}
+            ORDER BY id
+        """,
+        pending=f"{QUIZ_ELIGIBLE} AND id NOT IN (SELECT message_id FROM quiz_pool)"
+    )),
+    # The bot counts its own writes into the rollup, so the buckets a batch
+    # touches are recounted from their messages instead of incremented
+    Migration(3, 'activity_hourly', schema=create_activity_hourly, backfill=Backfill(
+        table='messages',
+        apply=f"""
+            INSERT INTO activity_hourly (chat_id, user_id, username, hour_start, message_count)
+            SELECT chat_id, user_id, username, hour_start, (
+                SELECT count(*) FROM messages m
+                WHERE m.chat_id = b.chat_id AND m.user_id = b.user_id
+                  AND m.timestamp >= strftime('%Y-%m-%d %H:00:00', b.hour_start)
+                  AND m.timestamp < strftime('%Y-%m-%d %H:00:00', b.hour_start, '+1 hour')
+                  AND strftime('{SQLITE_HOUR_FORMAT}', m.timestamp) = b.hour_start
+            )
+            FROM (
+                -- Bare username next to max(id): SQLite takes it from the newest row
+                SELECT chat_id, user_id, username, strftime('{SQLITE_HOUR_FORMAT}', timestamp) AS hour_start, max(id)
+                FROM messages WHERE id > :low AND id <= :high
+                GROUP BY chat_id, user_id, hour_start
+            ) b
+            WHERE true
+            ON CONFLICT (chat_id, user_id, hour_start) DO UPDATE SET message_count = excluded.message_count
+        """,
+        # A bucket the bot has started may still lack older messages, every row is recounted
+        pending="1"
+    )),
+    # Message counts are summed from the finished rollup, which also keeps
+    # the hours past message retention
+    Migration(4, 'chat_participants', schema=create_chat_participants, backfill=Backfill(
+        table='messages',
+        apply="""
+            INSERT INTO chat_participants (chat_id, user_id, username, first_seen, last_seen, message_count)
+            SELECT chat_id, user_id, username, first_seen, last_seen, (
+                SELECT coalesce(sum(a.message_count), 0) FROM activity_hourly a
+                WHERE a.chat_id = b.chat_id AND a.user_id = b.user_id
+            )
+            FROM (
+                SELECT chat_id, user_id, username, min(timestamp) AS first_seen, max(timestamp) AS last_seen, max(id)
+                FROM messages WHERE id > :low AND id <= :high
+                GROUP BY chat_id, user_id
+            ) b
+            WHERE true
+            ON CONFLICT (chat_id, user_id) DO UPDATE SET
+                username = CASE WHEN excluded.last_seen >= last_seen THEN excluded.username ELSE username END,
+                first_seen = min(first_seen, excluded.first_seen),
+                last_seen = max(last_seen, excluded.last_seen),
+                message_count = excluded.message_count
+        """,
+        pending="1"
+    )),
+]
+
+
+def latest_version(migrations: Sequence[Migration] = MIGRATIONS) -> int:
+    return max((migration.version for migration in migrations), default=0)
+
+
+class MigrationRunner:
+    """
+    Applies pending migrations to a database file, also while the bot is running.
+
+    Every migration runs its schema step, then its backfill in batches of
+    `batch_size` rows with a pause in between, and is recorded in
+    schema_version once complete. Backfill progress is checkpointed in
+    maintenance_state, so an interrupted run resumes where it stopped.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        migrations: Sequence[Migration] = MIGRATIONS,
+        batch_size: int = MIGRATION_BATCH_SIZE,
+        pause: float = MIGRATION_BATCH_PAUSE_SECONDS
+    ) -> None:
+        self.db_path = db_path
+        self.migrations = sorted(migrations, key=lambda migration: migration.version)
+        self.batch_size = batch_size
+        self.pause = pause
+
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        if read_only:
+            # Status and dry run never write, not even the bookkeeping tables
+            uri = f"{Path(self.db_path).resolve().as_uri()}?mode=ro"
+            return sqlite3.connect(uri, uri=True, timeout=30, isolation_level=None)
+
+        # Autocommit mode, transactions are opened explicitly per step
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR NOT NULL,
+                applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+                key VARCHAR PRIMARY KEY,
+                value VARCHAR NOT NULL
+            )
+        """)
+        return conn
+
+    @staticmethod
+    def _applied(conn: sqlite3.Connection) -> Set[int]:
+        # A database no runner has touched yet is at version 0
+        if not table_exists(conn, VERSION_TABLE):
+            return set()
+        return {row[0] for row in conn.execute(f"SELECT version FROM {VERSION_TABLE}")}
+
+    def current_version(self) -> int:
+        conn = self._connect(read_only=True)
+        try:
+            return max(self._applied(conn), default=0)
+        finally:
+            conn.close()
+
+    def pending(self, target: Optional[int] = None) -> List[Migration]:
+        conn = self._connect(read_only=True)
+        try:
+            return self._pending(conn, target)
+        finally:
+            conn.close()
+
+    def _pending(self, conn: sqlite3.Connection, target: Optional[int]) -> List[Migration]:
+        applied = self._applied(conn)
+        return [
+            migration for migration in self.migrations
+            if migration.version not in applied and (target is None or migration.version <= target)
+        ]
+
+    @staticmethod
+    def _checkpoint_key(migration: Migration) -> str:
+        return f"migration_{migration.version}_last_id"
+
+    def _get_checkpoint(self, conn: sqlite3.Connection, migration: Migration) -> int:
+        if not table_exists(conn, STATE_TABLE):
+            return 0
+        row = conn.execute(f"SELECT value FROM {STATE_TABLE} WHERE key = ?", (self._checkpoint_key(migration),)).fetchone()
+        return int(row[0]) if row else 0
+
+    def _next_batch(self, conn: sqlite3.Connection, table: str, after_id: int):
+        # Row count and upper id bound of the next batch, straight from the primary key
+        return conn.execute(
+            f"SELECT count(*), max(id) FROM (SELECT id FROM {table} WHERE id > ? ORDER BY id LIMIT ?)",
+            (after_id, self.batch_size)
+        ).fetchone()
+
+    def estimate(self, target: Optional[int] = None) -> List[MigrationEstimate]:
+        """
+        Dry run: rows and time each pending migration would take.
+
+        The database is opened read-only. Schema steps are not run, so a
+        pending clause that needs a table or column a migration has not
+        created yet cannot be evaluated; every unprocessed row is counted
+        instead and the estimate is marked as not exact. Time is extrapolated
+        from reading one sample batch, the writes themselves are not timed.
+        """
+        conn = self._connect(read_only=True)
+        estimates = []
+        try:
+            for migration in self._pending(conn, target):
+                estimate = MigrationEstimate(migration.version, migration.name)
+                backfill = migration.backfill
+
+                # A table the migration creates itself starts empty
+                if backfill is not None and table_exists(conn, backfill.table):
+                    checkpoint = self._get_checkpoint(conn, migration)
+                    scanned = conn.execute(
+                        f"SELECT count(*) FROM {backfill.table} WHERE id > ?", (checkpoint,)
+                    ).fetchone()[0]
+                    try:
+                        estimate.rows = conn.execute(
+                            f"SELECT count(*) FROM {backfill.table} WHERE id > ? AND {backfill.pending}", (checkpoint,)
+                        ).fetchone()[0]
+                    except sqlite3.OperationalError:
+                        estimate.rows = scanned
+                        estimate.exact = False
+
+                    if estimate.rows:
+                        estimate.batches = -(-scanned // self.batch_size)
+                        count, high = self._next_batch(conn, backfill.table, checkpoint)
+                        started = time.perf_counter()
+                        conn.execute(
+                            f"SELECT * FROM {backfill.table} WHERE id > ? AND id <= ?", (checkpoint, high)
+                        ).fetchall()
+                        sample = time.perf_counter() - started
+                        estimate.seconds = estimate.batches * (sample + self.pause)
+
+                estimates.append(estimate)
+        finally:
+            conn.close()
+        return estimates
+
+    def run(self, target: Optional[int] = None) -> List[int]:
+        """Apply pending migrations up to `target`, returns the versions applied."""
+        conn = self._connect()
+        applied = []
+        try:
+            for migration in self._pending(conn, target):
+                logger.info(f"Applying migration {migration.version} ({migration.name})")
+
+                if migration.schema is not None:
+                    conn.execute("BEGIN IMMEDIATE")
+                    try:
+                        migration.schema(conn)
+                    except BaseException:
+                        conn.execute("ROLLBACK")
+                        raise
+                    conn.execute("COMMIT")
+
+                if migration.backfill is not None:
+                    self._run_backfill(conn, migration)
+
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute(f"INSERT INTO {VERSION_TABLE} (version, name) VALUES (?, ?)",
+                             (migration.version, migration.name))
+                conn.execute(f"DELETE FROM {STATE_TABLE} WHERE key = ?", (self._checkpoint_key(migration),))
+                conn.execute("COMMIT")
+                applied.append(migration.version)
+                logger.info(f"✓ Migration {migration.version} ({migration.name}) applied")
+        finally:
+            conn.close()
+        return applied
+
+    def _run_backfill(self, conn: sqlite3.Connection, migration: Migration) -> None:
+        backfill = migration.backfill
+        checkpoint = self._get_checkpoint(conn, migration)
+
+        if not conn.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {backfill.table} WHERE id > ? AND {backfill.pending})", (checkpoint,)
+        ).fetchone()[0]:
+            logger.info("Nothing to backfill")
+            return
+
+        if checkpoint:
+            logger.info(f"Resuming backfill after id {checkpoint}")
+        total = conn.execute(f"SELECT count(*) FROM {backfill.table} WHERE id > ?", (checkpoint,)).fetchone()[0]
+
+        started = time.perf_counter()
+        last_report = started
+        done = 0
+        while True:
+            count, high = self._next_batch(conn, backfill.table, checkpoint)
+            if not count:
+                break
+
+            # One short write transaction per batch, the bot's writes get in between
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(backfill.apply, {'low': checkpoint, 'high': high})
+                conn.execute(
+                    f"INSERT INTO {STATE_TABLE} (key, value) VALUES (?, ?) "
+                    f"ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    (self._checkpoint_key(migration), str(high))
+                )
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+            checkpoint = high
+            done += count
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_LOG_SECONDS:
+                last_report = now
+                rate = done / (now - started)
+                remaining = max(total - done, 0)
+                logger.info(f"Backfilled {done}/{total} rows ({rate:,.0f} rows/s, "
+                            f"about {remaining / rate if rate else 0:.0f}s left, last id {checkpoint})")
+            time.sleep(self.pause)
+
+        logger.info(f"Backfilled {done} rows in {time.perf_counter() - started:.1f}s")
+
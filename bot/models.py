@@ -1,7 +1,10 @@
+import sys
+import time
+from array import array
 from dataclasses import dataclass
-from datetime import datetime
-from typing import Dict, Optional
-from sqlalchemy import String, Integer, DateTime, Text, Index
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from sqlalchemy import String, Integer, DateTime, Text, Index, LargeBinary
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from sqlalchemy.sql import func
 
@@ -25,6 +28,13 @@ class Message(Base):
         Index('idx_chat_timestamp', 'chat_id', 'timestamp'),
     )
 
+    @classmethod
+    def chat_message_columns(cls, source=None) -> tuple:
+        # Column order matches ChatMessage.from_row; source may be any table or
+        # subquery with the messages columns (e.g. a partition)
+        columns = (source if source is not None else cls.__table__).c
+        return (columns.user_id, columns.message_text, columns.timestamp, columns.username, columns.chat_id)
+
     def to_chat_message(self) -> "ChatMessage":
         return ChatMessage(
             user_id=self.user_id,
@@ -68,7 +78,150 @@ class QuizScore(Base):
     )
 
 
+class ActivityHourly(Base):
+    __tablename__ = "activity_hourly"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    chat_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    username: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    hour_start: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    message_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('idx_activity_chat_user_hour', 'chat_id', 'user_id', 'hour_start', unique=True),
+        Index('idx_activity_chat_hour', 'chat_id', 'hour_start'),
+    )
+
+
+class ChatParticipant(Base):
+    __tablename__ = "chat_participants"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    chat_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    username: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    first_seen: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    last_seen: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    message_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('idx_participants_chat_user', 'chat_id', 'user_id', unique=True),
+        Index('idx_participants_chat_last_seen', 'chat_id', 'last_seen'),
+    )
+
+
+class QuizCandidate(Base):
+    __tablename__ = "quiz_pool"
+
+    # Dense per-insert ids make random probing by id range cheap
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    chat_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    message_id: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index('idx_quiz_pool_chat_id', 'chat_id', 'id'),
+        Index('idx_quiz_pool_message', 'message_id', unique=True),
+    )
+
+
+class MessagePartition(Base):
+    __tablename__ = "message_partitions"
+
+    # Registry of time-partitioned message tables, see partitions.py
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    period_start: Mapped[datetime] = mapped_column(DateTime, nullable=False, unique=True)
+    period_end: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+
+class ArchiveBlock(Base):
+    __tablename__ = "message_archive"
+
+    # Messages older than the retention period, one compressed block per chat and day, see archive.py
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    chat_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    day: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    first_timestamp: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    last_timestamp: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    message_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    raw_bytes: Mapped[int] = mapped_column(Integer, nullable=False)
+    payload: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+    __table_args__ = (
+        Index('idx_archive_chat_day', 'chat_id', 'day', unique=True),
+    )
+
+
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+
+    # Migrations from migrations.py that are fully applied, backfills included
+    version: Mapped[int] = mapped_column(Integer, primary_key=True)
+    name: Mapped[str] = mapped_column(String, nullable=False)
+    applied_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.current_timestamp())
+
+
+class StoredSummary(Base):
+    __tablename__ = "summaries"
+
+    # Generated summaries, keyed like the in-memory cache in summary_cache.py
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    chat_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    hours: Mapped[int] = mapped_column(Integer, nullable=False)
+    last_message_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    model: Mapped[str] = mapped_column(String, nullable=False)
+    summary: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('idx_summaries_key', 'chat_id', 'hours', 'last_message_id', 'model', unique=True),
+    )
+
+
+class ChunkSummary(Base):
+    __tablename__ = "chunk_summaries"
+
+    # Summaries of closed time chunks for hierarchical /summary, empty text = no messages
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    chat_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    chunk_hours: Mapped[int] = mapped_column(Integer, nullable=False)
+    model: Mapped[str] = mapped_column(String, nullable=False)
+    chunk_start: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    summary: Mapped[str] = mapped_column(Text, nullable=False)
+
+    __table_args__ = (
+        Index('idx_chunk_summaries_key', 'chat_id', 'chunk_hours', 'model', 'chunk_start', unique=True),
+    )
+
+
+class MaintenanceState(Base):
+    __tablename__ = "maintenance_state"
+
+    # Progress markers of resumable maintenance jobs (backfills, index builds)
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    value: Mapped[str] = mapped_column(String, nullable=False)
+
+
 @dataclass
+class MessageIngest:
+    chat_id: int
+    user_id: int
+    username: Optional[str]
+    message_text: str
+    timestamp: datetime
+    profanity_count: int = 0
+
+    def to_row(self) -> Dict:
+        return {
+            'chat_id': self.chat_id,
+            'user_id': self.user_id,
+            'username': self.username,
+            'message_text': self.message_text,
+            'timestamp': self.timestamp,
+        }
+
+
+@dataclass(slots=True)
 class ChatMessage:
     user_id: int
     message_text: str
@@ -84,6 +237,17 @@ class ChatMessage:
         display_name = self.get_display_name()
         return f"[{time_str}] {display_name}: {self.message_text}"
 
+    @classmethod
+    def from_row(cls, row: Sequence) -> "ChatMessage":
+        user_id, message_text, timestamp, username, chat_id = row
+        return cls(
+            user_id=user_id,
+            message_text=message_text,
+            timestamp=timestamp,
+            username=username,
+            chat_id=chat_id
+        )
+
     @classmethod
     def from_dict(cls, data: Dict) -> "ChatMessage":
         timestamp = data.get('timestamp')
@@ -111,3 +275,176 @@ class ChatMessage:
 
     def __str__(self) -> str:
         return self.format_for_summary()
+
+
+@dataclass(slots=True)
+class SearchResult:
+    message_id: int
+    user_id: int
+    username: Optional[str]
+    timestamp: datetime
+    snippet: str
+
+    def get_display_name(self) -> str:
+        return self.username if self.username else f"User{self.user_id}"
+
+
+# Naive timestamps are stored as seconds from this point, so no timezone is involved
+EPOCH = datetime(1970, 1, 1)
+
+
+class MessageBatch:
+    """
+    Columnar container for a run of chat messages.
+
+    Timestamps are epoch seconds in an array, each distinct author
+    (user_id, username, chat_id) is interned once together with its display
+    name, and all texts share one UTF-8 buffer addressed by offsets.
+    ChatMessage objects are only built when an item is accessed.
+    """
+
+    __slots__ = ('_timestamps', '_author_refs', '_authors', '_author_index', '_text', '_offsets')
+
+    def __init__(self) -> None:
+        self._timestamps = array('d')
+        self._author_refs = array('I')
+        # (user_id, username, chat_id, display name) per distinct author
+        self._authors: List[Tuple[int, Optional[str], Optional[int], str]] = []
+        self._author_index: Dict[Tuple[int, Optional[str], Optional[int]], int] = {}
+        self._text = bytearray()
+        self._offsets = array('Q', [0])
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Sequence]) -> "MessageBatch":
+        """Build a batch from rows in Message.chat_message_columns() order."""
+        batch = cls()
+        batch.extend_rows(rows)
+        return batch
+
+    @classmethod
+    def from_messages(cls, messages: Iterable[ChatMessage]) -> "MessageBatch":
+        batch = cls()
+        for msg in messages:
+            batch.append(msg.user_id, msg.message_text, msg.timestamp, msg.username, msg.chat_id)
+        return batch
+
+    def append(
+        self,
+        user_id: int,
+        message_text: str,
+        timestamp: datetime,
+        username: Optional[str] = None,
+        chat_id: Optional[int] = None
+    ) -> None:
+        key = (user_id, username, chat_id)
+        ref = self._author_index.get(key)
+        if ref is None:
+            ref = len(self._authors)
+            name = sys.intern(username) if username else None
+            self._authors.append((user_id, name, chat_id, name if name else f"User{user_id}"))
+            self._author_index[key] = ref
+
+        self._author_refs.append(ref)
+        self._timestamps.append((timestamp - EPOCH).total_seconds())
+        self._text += message_text.encode()
+        self._offsets.append(len(self._text))
+
+    def extend_rows(self, rows: Iterable[Sequence]) -> None:
+        append = self.append
+        for user_id, message_text, timestamp, username, chat_id in rows:
+            append(user_id, message_text, timestamp, username, chat_id)
+
+    def __len__(self) -> int:
+        return len(self._timestamps)
+
+    def __getitem__(self, index: int) -> ChatMessage:
+        index = self._check_index(index)
+        user_id, username, chat_id, _ = self._authors[self._author_refs[index]]
+        return ChatMessage(
+            user_id=user_id,
+            message_text=self.text(index),
+            timestamp=self.timestamp(index),
+            username=username,
+            chat_id=chat_id
+        )
+
+    def __iter__(self) -> Iterator[ChatMessage]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def _check_index(self, index: int) -> int:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("MessageBatch index out of range")
+        return index
+
+    def text(self, index: int) -> str:
+        index = self._check_index(index)
+        return self._text[self._offsets[index]:self._offsets[index + 1]].decode()
+
+    def timestamp(self, index: int) -> datetime:
+        return EPOCH + timedelta(seconds=self._timestamps[index])
+
+    def user_id(self, index: int) -> int:
+        return self._authors[self._author_refs[index]][0]
+
+    def display_name(self, index: int) -> str:
+        return self._authors[self._author_refs[index]][3]
+
+    def display_names(self) -> List[str]:
+        """Distinct display names in order of first appearance."""
+        return list(dict.fromkeys(author[3] for author in self._authors))
+
+    def format_for_summary(self, index: int) -> str:
+        """Same line as ChatMessage.format_for_summary() for the item."""
+        time_str = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(int(self._timestamps[index])))
+        return f"[{time_str}] {self.display_name(index)}: {self.text(index)}"
+
+    def summary_lines(self) -> Iterator[str]:
+        authors = self._authors
+        refs = self._author_refs
+        offsets = self._offsets
+        text = self._text
+        last_second = None
+        time_str = ""
+
+        for index, seconds in enumerate(self._timestamps):
+            second = int(seconds)
+            # Chat bursts share the same second, format it once
+            if second != last_second:
+                time_str = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(second))
+                last_second = second
+            body = text[offsets[index]:offsets[index + 1]].decode()
+            yield f"[{time_str}] {authors[refs[index]][3]}: {body}"
+
+    def count_by_user(self) -> Dict[int, int]:
+        counts_by_ref = [0] * len(self._authors)
+        for ref in self._author_refs:
+            counts_by_ref[ref] += 1
+
+        counts: Dict[int, int] = {}
+        for (user_id, _, _, _), count in zip(self._authors, counts_by_ref):
+            counts[user_id] = counts.get(user_id, 0) + count
+        return counts
+
+    def top_talkers(self, limit: int = 10) -> List[tuple[str, int]]:
+        """(display name, message count) pairs like Database.get_top_talkers()."""
+        latest_name: Dict[int, str] = {}
+        for ref in self._author_refs:
+            user_id, _, _, name = self._authors[ref]
+            latest_name[user_id] = name
+
+        counts = self.count_by_user()
+        ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(latest_name[user_id], count) for user_id, count in ranked]
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate size of the column storage."""
+        return (
+            self._timestamps.itemsize * len(self._timestamps)
+            + self._author_refs.itemsize * len(self._author_refs)
+            + self._offsets.itemsize * len(self._offsets)
+            + len(self._text)
+        )
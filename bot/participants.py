@@ -0,0 +1,52 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+
+@dataclass
+class Participant:
+    user_id: int
+    username: Optional[str]
+    last_seen: datetime
+
+    def get_display_name(self) -> str:
+        return self.username if self.username else f"User{self.user_id}"
+
+
+class ParticipantCache:
+    """
+    In-process copy of the chat_participants table.
+
+    A chat is loaded from the database on first use and afterwards kept up to
+    date by the ingest path, so lookups never touch SQLite again.
+    """
+
+    def __init__(self) -> None:
+        self._chats: Dict[int, Dict[int, Participant]] = {}
+
+    def get(self, chat_id: int) -> Optional[Dict[int, Participant]]:
+        return self._chats.get(chat_id)
+
+    def load(self, chat_id: int, participants: Iterable[Participant]) -> Dict[int, Participant]:
+        directory = {participant.user_id: participant for participant in participants}
+        self._chats[chat_id] = directory
+        return directory
+
+    def touch(self, chat_id: int, user_id: int, username: Optional[str], last_seen: datetime) -> None:
+        directory = self._chats.get(chat_id)
+        if directory is None:
+            # Not loaded yet; the next lookup reads the committed row
+            return
+
+        participant = directory.get(user_id)
+        if participant is None:
+            directory[user_id] = Participant(user_id=user_id, username=username, last_seen=last_seen)
+        else:
+            participant.username = username
+            participant.last_seen = max(participant.last_seen, last_seen)
+
+    def invalidate(self, chat_id: Optional[int] = None) -> None:
+        if chat_id is None:
+            self._chats.clear()
+        else:
+            self._chats.pop(chat_id, None)
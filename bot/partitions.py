@@ -0,0 +1,78 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, Text
+
+PARTITION_PERIODS = ("none", "day", "week", "month")
+
+# Partition tables are created on demand and never through Base.metadata.create_all
+partition_metadata = MetaData()
+
+
+def period_start(ts: datetime, period: str) -> datetime:
+    day = ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "day":
+        return day
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Unknown partition period: {period}")
+
+
+def period_end(start: datetime, period: str) -> datetime:
+    if period == "day":
+        return start + timedelta(days=1)
+    if period == "week":
+        return start + timedelta(days=7)
+    if period == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    raise ValueError(f"Unknown partition period: {period}")
+
+
+def partition_name(start: datetime) -> str:
+    return f"messages_{start:%Y%m%d}"
+
+
+def partition_table(name: str) -> Table:
+    """Table object for a partition, same columns as the messages table."""
+    if name in partition_metadata.tables:
+        return partition_metadata.tables[name]
+
+    return Table(
+        name,
+        partition_metadata,
+        Column('id', Integer, primary_key=True),
+        Column('chat_id', Integer, nullable=False),
+        Column('user_id', Integer, nullable=False),
+        Column('username', String, nullable=True),
+        Column('message_text', Text, nullable=False),
+        Column('timestamp', DateTime, nullable=False),
+        Index(f'idx_{name}_chat_timestamp', 'chat_id', 'timestamp'),
+        # AUTOINCREMENT keeps the sqlite_sequence seed, so ids stay unique across partitions
+        sqlite_autoincrement=True
+    )
+
+
+@dataclass
+class Partition:
+    """One time slice of the message history, [start, end)."""
+
+    name: str
+    start: datetime
+    end: datetime
+
+    @property
+    def table(self) -> Table:
+        return partition_table(self.name)
+
+    @property
+    def search_table(self) -> str:
+        return f"{self.name}_fts"
+
+    def covers(self, ts: datetime) -> bool:
+        return self.start <= ts < self.end
+
+    def overlaps(self, since: Optional[datetime], until: Optional[datetime]) -> bool:
+        return (since is None or self.end > since) and (until is None or self.start < until)
@@ -0,0 +1,398 @@
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from config import Config
+from games import is_quiz_eligible
+from models import ChatMessage, MessageIngest
+from storage import CleanupStats, Storage, truncate_to_hour
+
+try:
+    import asyncpg
+except ImportError:  # Optional dependency, only needed for postgres:// URLs
+    asyncpg = None
+
+logger = logging.getLogger(__name__)
+
+# Same tables as the SQLite schema; usernames in the stats tables follow the latest message
+SCHEMA_DDL = [
+    """CREATE TABLE IF NOT EXISTS messages (
+        id BIGSERIAL PRIMARY KEY,
+        chat_id BIGINT NOT NULL,
+        user_id BIGINT NOT NULL,
+        username TEXT,
+        message_text TEXT NOT NULL,
+        timestamp TIMESTAMP NOT NULL DEFAULT now()
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_chat_timestamp ON messages (chat_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_timestamp ON messages (timestamp)",
+    """CREATE TABLE IF NOT EXISTS quiz_pool (
+        id BIGSERIAL PRIMARY KEY,
+        chat_id BIGINT NOT NULL,
+        message_id BIGINT NOT NULL UNIQUE REFERENCES messages (id) ON DELETE CASCADE
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_quiz_pool_chat_id ON quiz_pool (chat_id, id)",
+    """CREATE TABLE IF NOT EXISTS activity_hourly (
+        chat_id BIGINT NOT NULL,
+        user_id BIGINT NOT NULL,
+        username TEXT,
+        hour_start TIMESTAMP NOT NULL,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (chat_id, user_id, hour_start)
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_activity_chat_hour ON activity_hourly (chat_id, hour_start)",
+    """CREATE TABLE IF NOT EXISTS chat_participants (
+        chat_id BIGINT NOT NULL,
+        user_id BIGINT NOT NULL,
+        username TEXT,
+        first_seen TIMESTAMP NOT NULL,
+        last_seen TIMESTAMP NOT NULL,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (chat_id, user_id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS profanity_stats (
+        chat_id BIGINT NOT NULL,
+        user_id BIGINT NOT NULL,
+        username TEXT,
+        profanity_count INTEGER NOT NULL DEFAULT 0,
+        last_updated TIMESTAMP NOT NULL DEFAULT now(),
+        PRIMARY KEY (chat_id, user_id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS summaries (
+        chat_id BIGINT NOT NULL,
+        hours INTEGER NOT NULL,
+        last_message_id BIGINT NOT NULL,
+        model TEXT NOT NULL,
+        summary TEXT NOT NULL,
+        created_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (chat_id, hours, last_message_id, model)
+    )""",
+    """CREATE TABLE IF NOT EXISTS chunk_summaries (
+        chat_id BIGINT NOT NULL,
+        chunk_hours INTEGER NOT NULL,
+        model TEXT NOT NULL,
+        chunk_start TIMESTAMP NOT NULL,
+        summary TEXT NOT NULL,
+        PRIMARY KEY (chat_id, chunk_hours, model, chunk_start)
+    )""",
+    """CREATE TABLE IF NOT EXISTS quiz_scores (
+        chat_id BIGINT NOT NULL,
+        user_id BIGINT NOT NULL,
+        username TEXT,
+        correct_answers INTEGER NOT NULL DEFAULT 0,
+        total_games INTEGER NOT NULL DEFAULT 0,
+        last_played TIMESTAMP NOT NULL DEFAULT now(),
+        PRIMARY KEY (chat_id, user_id)
+    )""",
+]
+
+TABLES = ('quiz_pool', 'messages', 'activity_hourly', 'chat_participants', 'profanity_stats', 'quiz_scores',
+          'summaries', 'chunk_summaries')
+
+MESSAGE_COLUMNS = "user_id, message_text, timestamp, username, chat_id"
+
+UPSERT_PROFANITY = """
+    INSERT INTO profanity_stats (chat_id, user_id, username, profanity_count, last_updated)
+    VALUES ($1, $2, $3, $4, $5)
+    ON CONFLICT (chat_id, user_id) DO UPDATE SET
+        profanity_count = profanity_stats.profanity_count + EXCLUDED.profanity_count,
+        username = EXCLUDED.username,
+        last_updated = EXCLUDED.last_updated
+"""
+
+
+def _rowcount(status: str) -> int:
+    # asyncpg returns the command tag, e.g. "DELETE 42"
+    return int(status.rsplit(' ', 1)[-1])
+
+
+class PostgresStorage(Storage):
+    """
+    Storage backend on PostgreSQL through an asyncpg connection pool.
+
+    Several bot processes can share one database: every write is a single
+    statement or transaction and counters are updated with upserts, so no
+    state is kept between calls besides the pool.
+    """
+
+    def __init__(self, url: str, pool_size: Optional[int] = None) -> None:
+        if asyncpg is None:
+            raise RuntimeError("PostgreSQL storage needs the asyncpg package: pip install asyncpg")
+
+        self.url = url
+        self.pool_size = Config.POSTGRES_POOL_SIZE if pool_size is None else pool_size
+        self.pool: Optional["asyncpg.Pool"] = None
+
+    async def init_db(self) -> None:
+        self.pool = await asyncpg.create_pool(self.url, min_size=1, max_size=self.pool_size)
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                for statement in SCHEMA_DDL:
+                    await conn.execute(statement)
+        logger.info("PostgreSQL storage initialized")
+
+    async def close(self) -> None:
+        if self.pool is not None:
+            await self.pool.close()
+        logger.info("Database connections closed")
+
+    async def ingest_message(self, record: MessageIngest) -> None:
+        # Message row, counters and username refreshes commit together
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                message_id = await conn.fetchval(
+                    "INSERT INTO messages (chat_id, user_id, username, message_text, timestamp) "
+                    "VALUES ($1, $2, $3, $4, $5) RETURNING id",
+                    record.chat_id, record.user_id, record.username, record.message_text, record.timestamp
+                )
+                if is_quiz_eligible(record.message_text):
+                    await conn.execute(
+                        "INSERT INTO quiz_pool (chat_id, message_id) VALUES ($1, $2)", record.chat_id, message_id
+                    )
+
+                await conn.execute("""
+                    INSERT INTO activity_hourly (chat_id, user_id, username, hour_start, message_count)
+                    VALUES ($1, $2, $3, $4, 1)
+                    ON CONFLICT (chat_id, user_id, hour_start) DO UPDATE SET
+                        message_count = activity_hourly.message_count + 1,
+                        username = EXCLUDED.username
+                """, record.chat_id, record.user_id, record.username, truncate_to_hour(record.timestamp))
+
+                await conn.execute("""
+                    INSERT INTO chat_participants (chat_id, user_id, username, first_seen, last_seen, message_count)
+                    VALUES ($1, $2, $3, $4, $4, 1)
+                    ON CONFLICT (chat_id, user_id) DO UPDATE SET
+                        username = EXCLUDED.username,
+                        first_seen = LEAST(chat_participants.first_seen, EXCLUDED.first_seen),
+                        last_seen = GREATEST(chat_participants.last_seen, EXCLUDED.last_seen),
+                        message_count = chat_participants.message_count + 1
+                """, record.chat_id, record.user_id, record.username, record.timestamp)
+
+                for table in ('profanity_stats', 'quiz_scores'):
+                    await conn.execute(
+                        f"UPDATE {table} SET username = $3 "
+                        f"WHERE chat_id = $1 AND user_id = $2 AND username IS DISTINCT FROM $3",
+                        record.chat_id, record.user_id, record.username
+                    )
+
+                if record.profanity_count > 0:
+                    await conn.execute(UPSERT_PROFANITY, record.chat_id, record.user_id, record.username,
+                                       record.profanity_count, record.timestamp)
+
+        logger.debug(f"Saved message from user {record.user_id} in chat {record.chat_id}")
+
+    async def get_messages_since(self, chat_id: int, hours: int) -> List[ChatMessage]:
+        since_time = datetime.now() - timedelta(hours=hours)
+        rows = await self.pool.fetch(
+            f"SELECT {MESSAGE_COLUMNS} FROM messages WHERE chat_id = $1 AND timestamp >= $2 ORDER BY timestamp, id",
+            chat_id, since_time
+        )
+        messages = [ChatMessage.from_row(row) for row in rows]
+        logger.info(f"Retrieved {len(messages)} messages from chat {chat_id} for last {hours} hours")
+        return messages
+
+    async def get_message_count(self, chat_id: Optional[int] = None) -> int:
+        if chat_id is None:
+            return await self.pool.fetchval("SELECT count(*) FROM messages")
+        return await self.pool.fetchval("SELECT count(*) FROM messages WHERE chat_id = $1", chat_id)
+
+    async def get_last_message_id(self, chat_id: int, hours: int) -> Optional[int]:
+        return await self.pool.fetchval(
+            "SELECT max(id) FROM messages WHERE chat_id = $1 AND timestamp >= $2",
+            chat_id, datetime.now() - timedelta(hours=hours)
+        )
+
+    async def get_stored_summary(
+        self,
+        chat_id: int,
+        hours: int,
+        last_message_id: int,
+        model: str,
+        created_after: datetime
+    ) -> Optional[str]:
+        return await self.pool.fetchval(
+            "SELECT summary FROM summaries "
+            "WHERE chat_id = $1 AND hours = $2 AND last_message_id = $3 AND model = $4 AND created_at >= $5",
+            chat_id, hours, last_message_id, model, created_after
+        )
+
+    async def store_summary(self, chat_id: int, hours: int, last_message_id: int, model: str, summary: str) -> None:
+        await self.pool.execute("""
+            INSERT INTO summaries (chat_id, hours, last_message_id, model, summary, created_at)
+            VALUES ($1, $2, $3, $4, $5, $6)
+            ON CONFLICT (chat_id, hours, last_message_id, model) DO UPDATE SET
+                summary = EXCLUDED.summary,
+                created_at = EXCLUDED.created_at
+        """, chat_id, hours, last_message_id, model, summary, datetime.now())
+
+    async def get_chunk_summaries(
+        self,
+        chat_id: int,
+        chunk_hours: int,
+        model: str,
+        since: datetime,
+        until: datetime
+    ) -> Dict[datetime, str]:
+        rows = await self.pool.fetch(
+            "SELECT chunk_start, summary FROM chunk_summaries "
+            "WHERE chat_id = $1 AND chunk_hours = $2 AND model = $3 AND chunk_start >= $4 AND chunk_start < $5",
+            chat_id, chunk_hours, model, since, until
+        )
+        return {row['chunk_start']: row['summary'] for row in rows}
+
+    async def store_chunk_summaries(self, chat_id: int, chunk_hours: int, model: str, chunks: Dict[datetime, str]) -> None:
+        await self.pool.executemany("""
+            INSERT INTO chunk_summaries (chat_id, chunk_hours, model, chunk_start, summary)
+            VALUES ($1, $2, $3, $4, $5)
+            ON CONFLICT (chat_id, chunk_hours, model, chunk_start) DO UPDATE SET summary = EXCLUDED.summary
+        """, [(chat_id, chunk_hours, model, start, summary) for start, summary in chunks.items()])
+
+    async def get_chat_participants(self, chat_id: int, active_within_hours: Optional[int] = None) -> List[str]:
+        since_time = None
+        if active_within_hours is not None:
+            since_time = datetime.now() - timedelta(hours=active_within_hours)
+
+        rows = await self.pool.fetch("""
+            SELECT DISTINCT username FROM chat_participants
+            WHERE chat_id = $1 AND username IS NOT NULL AND ($2::timestamp IS NULL OR last_seen >= $2)
+        """, chat_id, since_time)
+        return [row['username'] for row in rows]
+
+    async def update_profanity_count(self, user_id: int, username: str, chat_id: int, count: int) -> None:
+        if count == 0:
+            return
+        await self.pool.execute(UPSERT_PROFANITY, chat_id, user_id, username, count, datetime.now())
+        logger.debug(f"Updated profanity count for user {user_id} in chat {chat_id}: +{count}")
+
+    async def get_profanity_stats(self, chat_id: int, limit: int = 10) -> List[tuple[str, int]]:
+        rows = await self.pool.fetch(
+            "SELECT username, profanity_count FROM profanity_stats WHERE chat_id = $1 "
+            "ORDER BY profanity_count DESC LIMIT $2",
+            chat_id, limit
+        )
+        return [(row['username'], row['profanity_count']) for row in rows]
+
+    async def get_user_profanity_count(self, user_id: int, chat_id: int) -> int:
+        count = await self.pool.fetchval(
+            "SELECT profanity_count FROM profanity_stats WHERE chat_id = $1 AND user_id = $2", chat_id, user_id
+        )
+        return count if count else 0
+
+    async def get_random_message_for_quiz(self, chat_id: int) -> Optional[ChatMessage]:
+        async with self.pool.acquire() as conn:
+            low, high = await conn.fetchrow("SELECT min(id), max(id) FROM quiz_pool WHERE chat_id = $1", chat_id)
+            if low is None:
+                return None
+
+            # Random probe into the pool's id range, one index lookup instead of ORDER BY random()
+            row = await conn.fetchrow("""
+                SELECT m.user_id, m.message_text, m.timestamp, m.username, m.chat_id
+                FROM quiz_pool q JOIN messages m ON m.id = q.message_id
+                WHERE q.chat_id = $1 AND q.id >= $2
+                ORDER BY q.id LIMIT 1
+            """, chat_id, random.randint(low, high))
+            return ChatMessage.from_row(row) if row is not None else None
+
+    async def update_quiz_score(self, user_id: int, username: str, chat_id: int, correct: bool) -> None:
+        await self.pool.execute("""
+            INSERT INTO quiz_scores (chat_id, user_id, username, correct_answers, total_games, last_played)
+            VALUES ($1, $2, $3, $4, 1, $5)
+            ON CONFLICT (chat_id, user_id) DO UPDATE SET
+                correct_answers = quiz_scores.correct_answers + EXCLUDED.correct_answers,
+                total_games = quiz_scores.total_games + 1,
+                username = EXCLUDED.username,
+                last_played = EXCLUDED.last_played
+        """, chat_id, user_id, username, 1 if correct else 0, datetime.now())
+        logger.debug(f"Updated quiz score for user {user_id} in chat {chat_id}: correct={correct}")
+
+    async def get_quiz_leaderboard(self, chat_id: int, limit: int = 10) -> List[tuple[str, int, int]]:
+        rows = await self.pool.fetch(
+            "SELECT username, correct_answers, total_games FROM quiz_scores WHERE chat_id = $1 "
+            "ORDER BY correct_answers DESC LIMIT $2",
+            chat_id, limit
+        )
+        return [(row['username'], row['correct_answers'], row['total_games']) for row in rows]
+
+    async def get_activity_count(self, chat_id: int, hours: int) -> int:
+        since_time = datetime.now() - timedelta(hours=hours)
+        # Like SQLite: whole hours from the rollup, which outlives retention, the partial first hour from messages
+        first_full_hour = truncate_to_hour(since_time) + timedelta(hours=1)
+        return await self.pool.fetchval("""
+            SELECT (SELECT coalesce(sum(message_count), 0) FROM activity_hourly
+                    WHERE chat_id = $1 AND hour_start >= $3)
+                 + (SELECT count(*) FROM messages
+                    WHERE chat_id = $1 AND timestamp >= $2 AND timestamp < $3)
+        """, chat_id, since_time, first_full_hour)
+
+    async def get_activity_heatmap(self, chat_id: int, days: Optional[int] = None) -> List[List[int]]:
+        since_hour = truncate_to_hour(datetime.now() - timedelta(days=days)) if days is not None else None
+        rows = await self.pool.fetch("""
+            SELECT EXTRACT(ISODOW FROM hour_start)::int AS weekday, EXTRACT(HOUR FROM hour_start)::int AS hour,
+                   sum(message_count) AS total
+            FROM activity_hourly
+            WHERE chat_id = $1 AND ($2::timestamp IS NULL OR hour_start >= $2)
+            GROUP BY 1, 2
+        """, chat_id, since_hour)
+
+        # Rows are Monday..Sunday (ISO day 1..7), columns are hours 0..23
+        heatmap = [[0] * 24 for _ in range(7)]
+        for row in rows:
+            heatmap[row['weekday'] - 1][row['hour']] += row['total']
+        return heatmap
+
+    async def get_top_talkers(self, chat_id: int, hours: Optional[int] = None, limit: int = 10) -> List[tuple[str, int]]:
+        since_hour = truncate_to_hour(datetime.now() - timedelta(hours=hours)) if hours is not None else None
+        rows = await self.pool.fetch("""
+            SELECT user_id, (array_agg(username ORDER BY hour_start DESC))[1] AS username,
+                   sum(message_count) AS total
+            FROM activity_hourly
+            WHERE chat_id = $1 AND ($2::timestamp IS NULL OR hour_start >= $2)
+            GROUP BY user_id
+            ORDER BY total DESC
+            LIMIT $3
+        """, chat_id, since_hour, limit)
+        return [(row['username'] if row['username'] else f"User{row['user_id']}", row['total']) for row in rows]
+
+    async def cleanup_old_messages(
+        self,
+        days: int = 30,
+        batch_size: Optional[int] = None,
+        time_budget: Optional[float] = None
+    ) -> CleanupStats:
+        """Delete messages older than `days` in batches, oldest first, within `time_budget` seconds."""
+        batch_size = batch_size or Config.CLEANUP_BATCH_SIZE
+        time_budget = Config.CLEANUP_TIME_BUDGET_SECONDS if time_budget is None else time_budget
+        cutoff_date = datetime.now() - timedelta(days=days)
+
+        started = time.perf_counter()
+        deadline = started + time_budget
+        stats = CleanupStats()
+
+        while time.perf_counter() < deadline:
+            batch_started = time.perf_counter()
+            # quiz_pool rows go with their messages (ON DELETE CASCADE)
+            deleted = _rowcount(await self.pool.execute("""
+                DELETE FROM messages WHERE id IN (
+                    SELECT id FROM messages WHERE timestamp < $1 ORDER BY timestamp LIMIT $2
+                )
+            """, cutoff_date, batch_size))
+            stats.record_lock(batch_started)
+
+            stats.rows_deleted += deleted
+            stats.batches += 1
+            if deleted < batch_size:
+                stats.completed = True
+                break
+
+        # Stored summaries are keyed by message ids that no longer exist
+        await self.pool.execute("DELETE FROM summaries WHERE created_at < $1", cutoff_date)
+        await self.pool.execute("DELETE FROM chunk_summaries WHERE chunk_start < $1", cutoff_date)
+
+        stats.elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.info(
+            f"Cleaned up {stats.rows_deleted} old messages (older than {days} days) in {stats.batches} batches, "
+            f"took {stats.elapsed_ms:.0f} ms" + ("" if stats.completed else " (time budget exhausted)")
+        )
+        return stats
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Generic, Hashable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass
+class SingleFlightStats:
+    # Calls that actually ran
+    executions: int = 0
+    # Callers that joined a call already in flight instead of running their own
+    coalesced: int = 0
+    in_flight: int = 0
+
+    @property
+    def coalesced_ratio(self) -> float:
+        callers = self.executions + self.coalesced
+        return self.coalesced / callers if callers else 0.0
+
+
+class SingleFlight(Generic[T]):
+    """
+    Coalesces concurrent calls with the same key.
+
+    The first caller starts the call as a task; callers arriving while it
+    runs await the same task and get the same result or exception. A caller
+    that is cancelled only stops waiting, the shared call keeps running for
+    the others. Results are not kept once the call has finished.
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._executions = 0
+        self._coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is not None:
+            self._coalesced += 1
+            logger.debug(f"Joined in-flight call {key}")
+        else:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            self._executions += 1
+            task.add_done_callback(lambda done: self._finished(key, done))
+
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Every waiter may have been cancelled; retrieve the exception so it is not reported as unhandled
+        if not task.cancelled():
+            task.exception()
+
+    @property
+    def stats(self) -> SingleFlightStats:
+        return SingleFlightStats(
+            executions=self._executions,
+            coalesced=self._coalesced,
+            in_flight=len(self._calls)
+        )
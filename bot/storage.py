@@ -0,0 +1,198 @@
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+from models import ChatMessage, MessageBatch, MessageIngest, SearchResult
+
+MEMORY_URL_PREFIX = "memory://"
+POSTGRES_URL_PREFIXES = ("postgres://", "postgresql://")
+
+SEARCH_PAGE_SIZE = 5
+
+
+@dataclass
+class CleanupStats:
+    rows_deleted: int = 0
+    batches: int = 0
+    partitions_dropped: int = 0
+    rows_archived: int = 0
+    pages_freed: int = 0
+    vacuum_steps: int = 0
+    # Longest single write transaction of the run
+    max_lock_ms: float = 0.0
+    elapsed_ms: float = 0.0
+    # False when the time budget ran out before every old row was deleted
+    completed: bool = False
+
+    def record_lock(self, started: float) -> None:
+        self.max_lock_ms = max(self.max_lock_ms, (time.perf_counter() - started) * 1000)
+
+
+def truncate_to_hour(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+class Storage(ABC):
+    """
+    What the bot needs from its message store.
+
+    Handlers and the scheduled jobs only talk to this interface. Backends
+    keep the same semantics: messages are returned oldest first, stats are
+    per chat, usernames in leaderboards follow the user's latest message and
+    activity counters outlive the messages removed by cleanup.
+    """
+
+    # Set by backends that support /search once their index is ready
+    search_enabled: bool = False
+
+    @abstractmethod
+    async def init_db(self) -> None:
+        ...
+
+    @abstractmethod
+    async def close(self) -> None:
+        ...
+
+    async def save_message(
+        self,
+        user_id: int,
+        username: str,
+        message_text: str,
+        chat_id: int,
+        ts: Optional[datetime] = None
+    ) -> None:
+        await self.ingest_message(MessageIngest(
+            chat_id=chat_id,
+            user_id=user_id,
+            username=username,
+            message_text=message_text,
+            timestamp=datetime.now() if not ts else ts
+        ))
+
+    @abstractmethod
+    async def ingest_message(self, record: MessageIngest) -> None:
+        ...
+
+    @abstractmethod
+    async def get_messages_since(self, chat_id: int, hours: int) -> List[ChatMessage]:
+        ...
+
+    async def stream_messages_since(self, chat_id: int, hours: int) -> AsyncIterator[ChatMessage]:
+        for message in await self.get_messages_since(chat_id, hours):
+            yield message
+
+    async def get_message_batch(self, chat_id: int, hours: int) -> MessageBatch:
+        return MessageBatch.from_messages(await self.get_messages_since(chat_id, hours))
+
+    @abstractmethod
+    async def get_message_count(self, chat_id: Optional[int] = None) -> int:
+        ...
+
+    @abstractmethod
+    async def get_last_message_id(self, chat_id: int, hours: int) -> Optional[int]:
+        """Id of the newest message in the window, changes whenever the window gets a message."""
+
+    @abstractmethod
+    async def get_stored_summary(
+        self,
+        chat_id: int,
+        hours: int,
+        last_message_id: int,
+        model: str,
+        created_after: datetime
+    ) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    async def store_summary(self, chat_id: int, hours: int, last_message_id: int, model: str, summary: str) -> None:
+        ...
+
+    @abstractmethod
+    async def get_chunk_summaries(
+        self,
+        chat_id: int,
+        chunk_hours: int,
+        model: str,
+        since: datetime,
+        until: datetime
+    ) -> Dict[datetime, str]:
+        """Stored summaries of the chunks starting in [since, until), by chunk start."""
+
+    @abstractmethod
+    async def store_chunk_summaries(self, chat_id: int, chunk_hours: int, model: str, chunks: Dict[datetime, str]) -> None:
+        ...
+
+    @abstractmethod
+    async def get_chat_participants(self, chat_id: int, active_within_hours: Optional[int] = None) -> List[str]:
+        ...
+
+    @abstractmethod
+    async def update_profanity_count(self, user_id: int, username: str, chat_id: int, count: int) -> None:
+        ...
+
+    @abstractmethod
+    async def get_profanity_stats(self, chat_id: int, limit: int = 10) -> List[tuple[str, int]]:
+        ...
+
+    @abstractmethod
+    async def get_user_profanity_count(self, user_id: int, chat_id: int) -> int:
+        ...
+
+    @abstractmethod
+    async def get_random_message_for_quiz(self, chat_id: int) -> Optional[ChatMessage]:
+        ...
+
+    @abstractmethod
+    async def update_quiz_score(self, user_id: int, username: str, chat_id: int, correct: bool) -> None:
+        ...
+
+    @abstractmethod
+    async def get_quiz_leaderboard(self, chat_id: int, limit: int = 10) -> List[tuple[str, int, int]]:
+        ...
+
+    @abstractmethod
+    async def get_activity_count(self, chat_id: int, hours: int) -> int:
+        ...
+
+    @abstractmethod
+    async def get_activity_heatmap(self, chat_id: int, days: Optional[int] = None) -> List[List[int]]:
+        ...
+
+    @abstractmethod
+    async def get_top_talkers(self, chat_id: int, hours: Optional[int] = None, limit: int = 10) -> List[tuple[str, int]]:
+        ...
+
+    async def search_messages(self, chat_id: int, query: str, limit: int = SEARCH_PAGE_SIZE, offset: int = 0) -> List[SearchResult]:
+        return []
+
+    @abstractmethod
+    async def cleanup_old_messages(self, days: int = 30) -> CleanupStats:
+        ...
+
+    def log_hot_window_stats(self) -> None:
+        pass
+
+    def log_stats_cache_stats(self) -> None:
+        pass
+
+
+def create_storage(url: str) -> Storage:
+    """
+    Backend for a DB_PATH value.
+
+    memory:// keeps everything in process memory (tests, benchmarks),
+    postgres:// and postgresql:// URLs use PostgreSQL through asyncpg and
+    anything else is a SQLite file path or sqlite URL.
+    """
+    if url.startswith(MEMORY_URL_PREFIX):
+        from memory_storage import MemoryStorage
+        return MemoryStorage()
+
+    if url.startswith(POSTGRES_URL_PREFIXES):
+        from postgres_storage import PostgresStorage
+        return PostgresStorage(url)
+
+    from database import Database
+    return Database(url)
@@ -1,24 +1,58 @@
+import asyncio
 import logging
-from typing import List
+from datetime import datetime, timedelta
+from io import StringIO
+from typing import AsyncIterable, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
 
 from openai import AsyncOpenAI
 from anthropic import AsyncAnthropic
 from tenacity import (
     retry,
     stop_after_attempt,
-    wait_exponential,
-    retry_if_exception_type
+    wait_random_exponential,
+    retry_if_exception_type,
+    retry_if_not_exception_type
 )
 
 from config import Config
+from llm_scheduler import PRIORITY_INTERACTIVE, LLMRequest, LLMScheduler, SchedulerBusy, current_llm_request
 from messages import Messages
-from models import ChatMessage
+from models import EPOCH, ChatMessage
+from single_flight import SingleFlight
+from storage import Storage, truncate_to_hour
+from summary_cache import SummaryCache
+from tokens import estimate_tokens
 
 logger = logging.getLogger(__name__)
 
+SUMMARY_MODES = ("flat", "hierarchical", "map_reduce")
+# Output budget of one chunk or part summary
+CHUNK_SUMMARY_MAX_TOKENS = 300
+SUMMARY_MAX_TOKENS = 2000
+
+
+def chunk_start(ts: datetime, chunk_hours: int) -> datetime:
+    """Start of the `chunk_hours` long chunk containing ts; chunks are aligned to the epoch."""
+    hour = truncate_to_hour(ts)
+    offset = int((hour - EPOCH).total_seconds() // 3600) % chunk_hours
+    return hour - timedelta(hours=offset)
+
+
+def period_label(start: datetime, end: datetime) -> str:
+    if start.date() == end.date():
+        return f"[{start:%Y-%m-%d %H:%M}–{end:%H:%M}]"
+    return f"[{start:%Y-%m-%d %H:%M}–{end:%Y-%m-%d %H:%M}]"
+
 
 class Summarizer:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        cache: Optional[SummaryCache] = None,
+        mode: Optional[str] = None,
+        chunk_hours: Optional[int] = None,
+        chunk_tokens: Optional[int] = None,
+        scheduler: Optional[LLMScheduler] = None
+    ) -> None:
         self.provider = Config.AI_PROVIDER
 
         if self.provider == "openai":
@@ -40,45 +74,341 @@ class Summarizer:
             self.model = Config.YANDEX_MODEL
             logger.info(f"Initialized Yandex client with model: {self.model}")
 
+        if cache is None:
+            cache = SummaryCache(
+                max_entries=Config.SUMMARY_CACHE_ENTRIES,
+                ttl=Config.SUMMARY_CACHE_TTL_SECONDS,
+                persist=Config.SUMMARY_CACHE_PERSIST
+            )
+        self.cache = cache
+
+        if scheduler is None:
+            scheduler = LLMScheduler(
+                max_concurrency=Config.LLM_MAX_CONCURRENCY,
+                tokens_per_minute=Config.LLM_TOKENS_PER_MINUTE,
+                max_queue=Config.LLM_MAX_QUEUE
+            )
+        self.scheduler = scheduler
+
+        # Concurrent /summary requests for the same chat and window share one run
+        self.single_flight: SingleFlight[str] = SingleFlight()
+
+        if mode is None:
+            mode = Config.SUMMARY_MODE
+        if mode not in SUMMARY_MODES:
+            raise ValueError(f"SUMMARY_MODE must be one of {', '.join(SUMMARY_MODES)}")
+        self.mode = mode
+        self.chunk_hours = chunk_hours or Config.SUMMARY_CHUNK_HOURS
+        self.chunk_tokens = chunk_tokens or Config.SUMMARY_CHUNK_TOKENS
+        # Chunk summaries one request generates at once, each request gets its own semaphore;
+        # also keeps a single large history from filling the scheduler queue
+        self.chunk_concurrency = Config.SUMMARY_MAX_CONCURRENCY
+
+    @property
+    def model_key(self) -> str:
+        # Part of the summary cache key, a summary from another model is not a hit
+        return f"{self.provider}/{self.model}"
+
     def _format_messages(self, messages: List[ChatMessage]) -> str:
-        if not messages:
-            return ""
+        return "\n".join(msg.format_for_summary() for msg in messages)
 
-        formatted_lines = [msg.format_for_summary() for msg in messages]
-        return "\n".join(formatted_lines)
+    def build_prompt(self, lines: Iterable[str], hours: int) -> Tuple[str, int]:
+        """Prompt for formatted message lines and their count."""
+        # Lines are written straight into one buffer, the history is never held as a list of lines
+        buffer = StringIO()
+        buffer.write(Messages.ai_system_prompt(hours))
+        buffer.write("\n\n")
 
-    def _create_prompt(self, formatted_messages: str, hours: int) -> str:
-        system_prompt = Messages.ai_system_prompt(hours)
-        return f"{system_prompt}\n\n{formatted_messages}"
+        count = 0
+        for line in lines:
+            if count:
+                buffer.write("\n")
+            buffer.write(line)
+            count += 1
 
-    async def summarize(self, messages: List[ChatMessage], hours: int) -> str:
-        if not messages:
-            return Messages.no_messages(hours)
+        return buffer.getvalue(), count
+
+    async def summarize_chat(
+        self,
+        db: Storage,
+        chat_id: int,
+        hours: int,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> str:
+        """
+        Summary of a chat's last `hours`.
 
-        formatted_messages = self._format_messages(messages)
-        prompt = self._create_prompt(formatted_messages, hours)
+        Served from the cache while no new message arrived; concurrent
+        requests for the same chat and window wait for one shared run.
+        Raises SchedulerBusy when the LLM queue is full.
+        """
+        # The LLM calls of this run are scheduled for this chat and priority
+        token = current_llm_request.set(LLMRequest(chat_id, priority))
+        try:
+            return await self.single_flight.do((chat_id, hours), lambda: self._summarize_chat(db, chat_id, hours))
+        finally:
+            current_llm_request.reset(token)
 
-        logger.info(f"Generating summary for {len(messages)} messages using {self.provider}")
+    async def _summarize_chat(self, db: Storage, chat_id: int, hours: int) -> str:
+        last_message_id = await db.get_last_message_id(chat_id, hours)
+        if last_message_id is None:
+            return Messages.no_messages(hours)
 
+        key = (chat_id, hours, last_message_id, self.model_key)
+        cached = await self.cache.get(db, *key)
+        if cached is not None:
+            logger.info(f"Served summary for chat {chat_id} ({hours} hours) from the cache")
+            return cached
+
+        # Reject before reading the history when the call could not be queued anyway
+        self.scheduler.admit()
         try:
-            if self.provider == "openai" or self.provider == "yagpt":
-                return await self._summarize_openai(prompt)
-            elif self.provider == "anthropic":
-                return await self._summarize_anthropic(prompt)
+            if self.mode == "hierarchical":
+                prompt, count = await self.build_hierarchical_prompt(db, chat_id, hours)
+            elif self.mode == "map_reduce":
+                prompt, count = await self.build_map_reduce_prompt(db.stream_messages_since(chat_id, hours), hours)
             else:
-                raise ValueError(Messages.ai_unknown_provider_error(self.provider))
+                # Columnar batch: no ChatMessage per row while the history is read
+                batch = await db.get_message_batch(chat_id, hours)
+                prompt, count = self.build_prompt(batch.summary_lines(), hours)
+                # Only the prompt is kept while the provider call runs
+                del batch
+            if not count:
+                return Messages.no_messages(hours)
 
+            summary = await self._call_provider(prompt, count)
+        except SchedulerBusy:
+            raise
         except Exception as e:
+            # Failures are not cached, the next request tries again
             logger.error(f"Error generating summary: {e}", exc_info=True)
             return Messages.error_summary_generation(str(e))
 
+        await self.cache.put(db, *key, summary)
+        return summary
+
+    async def build_hierarchical_prompt(self, db: Storage, chat_id: int, hours: int) -> Tuple[str, int]:
+        """
+        Prompt made of stored chunk summaries plus the raw messages of the open chunk.
+
+        Closed chunks are summarized once and stored; only those not stored
+        yet are read and summarized here. The window is widened to whole
+        chunks, so it can start up to one chunk earlier than asked. Returns
+        the prompt and the number of chunk summaries and messages in it.
+        """
+        now = datetime.now()
+        step = timedelta(hours=self.chunk_hours)
+        window_start = chunk_start(now - timedelta(hours=hours), self.chunk_hours)
+        open_start = chunk_start(now, self.chunk_hours)
+
+        closed = []
+        start = window_start
+        while start < open_start:
+            closed.append(start)
+            start += step
+
+        chunks = await db.get_chunk_summaries(chat_id, self.chunk_hours, self.model_key, window_start, open_start)
+        missing: Dict[datetime, List[ChatMessage]] = {start: [] for start in closed if start not in chunks}
+
+        # One read covers the missing closed chunks and the open one
+        read_from = min(missing) if missing else open_start
+        read_hours = int((now - read_from).total_seconds() // 3600) + 1
+        recent: List[ChatMessage] = []
+        async for msg in db.stream_messages_since(chat_id, read_hours):
+            if msg.timestamp >= open_start:
+                recent.append(msg)
+            elif msg.timestamp >= read_from:
+                bucket = missing.get(chunk_start(msg.timestamp, self.chunk_hours))
+                if bucket is not None:
+                    bucket.append(msg)
+
+        if missing:
+            summarized, error = await self._summarize_chunks(missing)
+            # Chunks that succeeded are kept even when another one failed
+            await db.store_chunk_summaries(chat_id, self.chunk_hours, self.model_key, summarized)
+            if error is not None:
+                raise error
+            chunks.update(summarized)
+
+        parts = [(start, start + step, chunks[start]) for start in closed if chunks.get(start)]
+
+        logger.info(f"Hierarchical prompt for chat {chat_id}: {len(parts)} chunk summaries "
+                    f"({len(missing)} new), {len(recent)} recent messages")
+        return self._combined_prompt(hours, parts, recent), len(parts) + len(recent)
+
+    async def build_map_reduce_prompt(self, messages: AsyncIterable[ChatMessage], hours: int) -> Tuple[str, int]:
+        """
+        Prompt for a history of any size, built with map-reduce.
+
+        The formatted history is cut into parts of at most `chunk_tokens` on
+        message boundaries. Every part is summarized as soon as it is complete,
+        concurrently with reading the rest (map), and the prompt combines the
+        part summaries (reduce). A history that fits into one part is sent as
+        is, like in flat mode. Returns the prompt and the number of messages.
+        """
+        limit = asyncio.Semaphore(self.chunk_concurrency)
+        tasks: List[asyncio.Task] = []
+        lines: List[str] = []
+        part_tokens = 0
+        first = last = None
+        count = 0
+
+        try:
+            async for msg in messages:
+                line = msg.format_for_summary()
+                tokens = estimate_tokens(line) + 1
+                if lines and part_tokens + tokens > self.chunk_tokens:
+                    tasks.append(asyncio.create_task(self._summarize_part(first, last, lines, limit)))
+                    lines, part_tokens = [], 0
+
+                if not lines:
+                    first = msg.timestamp
+                lines.append(line)
+                part_tokens += tokens
+                last = msg.timestamp
+                count += 1
+
+            if not tasks:
+                return self.build_prompt(lines, hours)
+
+            tasks.append(asyncio.create_task(self._summarize_part(first, last, lines, limit)))
+            parts = list(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        mapped = len(parts)
+        parts = await self._reduce_parts(parts, limit)
+        logger.info(f"Map-reduce prompt: {count} messages in {mapped} parts, reduced to {len(parts)}")
+        return self._combined_prompt(hours, parts), count
+
+    async def _reduce_parts(
+        self,
+        parts: List[Tuple[datetime, datetime, str]],
+        limit: asyncio.Semaphore
+    ) -> List[Tuple[datetime, datetime, str]]:
+        # Part summaries that together exceed the budget are summarized again, in groups
+        while len(parts) > 1 and estimate_tokens(self._format_parts(parts)) > self.chunk_tokens:
+            groups: List[List[Tuple[datetime, datetime, str]]] = [[]]
+            group_tokens = 0
+            for part in parts:
+                tokens = estimate_tokens(self._format_parts([part]))
+                # At least two parts per group, so every round shrinks the list
+                if len(groups[-1]) >= 2 and group_tokens + tokens > self.chunk_tokens:
+                    groups.append([])
+                    group_tokens = 0
+                groups[-1].append(part)
+                group_tokens += tokens
+
+            parts = list(await asyncio.gather(*(
+                self._summarize_part(group[0][0], group[-1][1], [self._format_parts(group)], limit)
+                for group in groups
+            )))
+        return parts
+
+    async def _summarize_part(
+        self,
+        start: datetime,
+        end: datetime,
+        lines: List[str],
+        limit: asyncio.Semaphore
+    ) -> Tuple[datetime, datetime, str]:
+        prompt = f"{Messages.ai_chunk_prompt(start, end)}\n\n" + "\n".join(lines)
+        async with limit:
+            summary = await self._call_provider(prompt, len(lines), max_tokens=CHUNK_SUMMARY_MAX_TOKENS)
+        return start, end, summary
+
+    @staticmethod
+    def _format_parts(parts: List[Tuple[datetime, datetime, str]]) -> str:
+        return "\n\n".join(f"{period_label(start, end)} {summary}" for start, end, summary in parts)
+
+    def _combined_prompt(
+        self,
+        hours: int,
+        parts: List[Tuple[datetime, datetime, str]],
+        recent: Optional[List[ChatMessage]] = None
+    ) -> str:
+        sections = [Messages.ai_system_prompt(hours)]
+        if parts:
+            sections.append(Messages.ai_chunk_summaries_header() + "\n" + self._format_parts(parts))
+        if recent:
+            sections.append(Messages.ai_recent_messages_header() + "\n" + self._format_messages(recent))
+        return "\n\n".join(sections)
+
+    async def _summarize_chunks(
+        self,
+        pending: Dict[datetime, List[ChatMessage]]
+    ) -> Tuple[Dict[datetime, str], Optional[Exception]]:
+        step = timedelta(hours=self.chunk_hours)
+        limit = asyncio.Semaphore(self.chunk_concurrency)
+
+        async def summarize_chunk(start: datetime, messages: List[ChatMessage]) -> str:
+            # Empty chunks are stored too, so they are never read again
+            if not messages:
+                return ""
+            _, _, summary = await self._summarize_part(
+                start, start + step, [msg.format_for_summary() for msg in messages], limit
+            )
+            return summary
+
+        starts = list(pending)
+        results = await asyncio.gather(
+            *(summarize_chunk(start, pending[start]) for start in starts),
+            return_exceptions=True
+        )
+
+        summarized = {}
+        error = None
+        for start, result in zip(starts, results):
+            if isinstance(result, Exception):
+                error = error or result
+            else:
+                summarized[start] = result
+        return summarized, error
+
+    def log_stats(self) -> None:
+        self.cache.log_stats()
+        self.scheduler.log_stats()
+        stats = self.single_flight.stats
+        logger.info(
+            f"Summary requests: {stats.executions} runs, {stats.coalesced} coalesced waiters "
+            f"({stats.coalesced_ratio:.0%} of requests), {stats.in_flight} in flight"
+        )
+
+    async def _call_provider(self, prompt: str, message_count: int, max_tokens: int = SUMMARY_MAX_TOKENS) -> str:
+        logger.info(f"Generating summary for {message_count} messages (~{estimate_tokens(prompt)} tokens) "
+                    f"using {self.provider}")
+
+        if self.provider == "openai" or self.provider == "yagpt":
+            call = self._summarize_openai
+        elif self.provider == "anthropic":
+            call = self._summarize_anthropic
+        else:
+            raise ValueError(Messages.ai_unknown_provider_error(self.provider))
+
+        # Providers count the output budget against the rate limit too
+        tokens = estimate_tokens(prompt) + max_tokens
+        return await self._scheduled_call(call, prompt, max_tokens, tokens)
+
+    # Every attempt is admitted and charged by the scheduler on its own, and the backoff
+    # sleeps hold no slot; jittered, so calls that failed together do not retry together
     @retry(
         stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=10),
-        retry=retry_if_exception_type((Exception,)),
+        wait=wait_random_exponential(multiplier=1, min=2, max=10),
+        retry=retry_if_exception_type((Exception,)) & retry_if_not_exception_type(SchedulerBusy),
         reraise=True
     )
-    async def _summarize_openai(self, prompt: str) -> str:
+    async def _scheduled_call(
+        self,
+        call: Callable[..., Awaitable[str]],
+        prompt: str,
+        max_tokens: int,
+        tokens: int
+    ) -> str:
+        return await self.scheduler.run(tokens, lambda: call(prompt, max_tokens=max_tokens))
+
+    async def _summarize_openai(self, prompt: str, max_tokens: int = SUMMARY_MAX_TOKENS) -> str:
         logger.debug("Calling OpenAI API for summary generation")
         response = await self.client.chat.completions.create(
             model=self.model,
@@ -86,7 +416,7 @@ class Summarizer:
                 {"role": "user", "content": prompt}
             ],
             temperature=0.7,
-            max_tokens=2000
+            max_tokens=max_tokens
         )
 
         summary = response.choices[0].message.content
@@ -96,17 +426,11 @@ class Summarizer:
         logger.info(f"OpenAI summary generated successfully (tokens: {response.usage.total_tokens})")
         return summary
 
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=10),
-        retry=retry_if_exception_type((Exception,)),
-        reraise=True
-    )
-    async def _summarize_anthropic(self, prompt: str) -> str:
+    async def _summarize_anthropic(self, prompt: str, max_tokens: int = SUMMARY_MAX_TOKENS) -> str:
         logger.debug("Calling Anthropic API for summary generation")
         response = await self.client.messages.create(
             model=self.model,
-            max_tokens=2000,
+            max_tokens=max_tokens,
             temperature=0.7,
             messages=[
                 {"role": "user", "content": prompt}
@@ -122,7 +446,7 @@ class Summarizer:
     
     @retry(
         stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=10),
+        wait=wait_random_exponential(multiplier=1, min=2, max=10),
         retry=retry_if_exception_type((Exception,)),
         reraise=True
     )
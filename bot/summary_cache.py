@@ -0,0 +1,97 @@
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from cache import LRUCache
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SummaryCacheStats:
+    hits: int = 0
+    # Hits that had to be loaded from the summaries table
+    stored_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    entries: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class SummaryCache:
+    """
+    Generated summaries keyed by (chat_id, hours, last message id, model).
+
+    A new message in the window changes its last message id, so an entry
+    never has to be invalidated; it is only served for `ttl` seconds, while
+    the window's older edge has not moved much. With `persist` summaries are
+    also written to the storage's summaries table and survive restarts.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, persist: bool = False) -> None:
+        self.ttl = ttl
+        self.persist = persist
+        self._entries = LRUCache(max_entries=max_entries, ttl=ttl)
+        self._stored_hits = 0
+
+    async def get(
+        self,
+        storage: Storage,
+        chat_id: int,
+        hours: int,
+        last_message_id: int,
+        model: str
+    ) -> Optional[str]:
+        key = (chat_id, hours, last_message_id, model)
+        summary = self._entries.get(key)
+        if summary is not None or not self.persist:
+            return summary
+
+        summary = await storage.get_stored_summary(
+            chat_id, hours, last_message_id, model, created_after=datetime.now() - timedelta(seconds=self.ttl)
+        )
+        if summary is not None:
+            self._stored_hits += 1
+            self._entries.put(key, summary, tag=chat_id, version=self._entries.version(chat_id))
+        return summary
+
+    async def put(
+        self,
+        storage: Storage,
+        chat_id: int,
+        hours: int,
+        last_message_id: int,
+        model: str,
+        summary: str
+    ) -> None:
+        key = (chat_id, hours, last_message_id, model)
+        self._entries.put(key, summary, tag=chat_id, version=self._entries.version(chat_id))
+        if self.persist:
+            await storage.store_summary(chat_id, hours, last_message_id, model, summary)
+
+    @property
+    def stats(self) -> SummaryCacheStats:
+        stats = self._entries.stats
+        return SummaryCacheStats(
+            hits=stats.hits + self._stored_hits,
+            stored_hits=self._stored_hits,
+            misses=stats.misses - self._stored_hits,
+            evictions=stats.evictions,
+            expirations=stats.expirations,
+            entries=stats.entries
+        )
+
+    def log_stats(self) -> None:
+        stats = self.stats
+        logger.info(
+            f"Summary cache: {stats.hits} hits ({stats.stored_hits} from storage), {stats.misses} misses "
+            f"({stats.hit_ratio:.0%} hit ratio), {stats.entries} entries, {stats.evictions} evictions, "
+            f"{stats.expirations} expired"
+        )
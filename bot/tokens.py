@@ -0,0 +1,10 @@
+import math
+
+# Average UTF-8 bytes per token of current BPE tokenizers: close to 4 for English
+# text, Cyrillic letters take two bytes and come out near two letters per token
+BYTES_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of a text, without a tokenizer dependency."""
+    return math.ceil(len(text.encode('utf-8')) / BYTES_PER_TOKEN)
@@ -3,7 +3,7 @@ from typing import Any, Callable, Dict, Awaitable
 from aiogram.types import TelegramObject
 
 from transcription import Transcriber
-from database import Database
+from storage import Storage
 from summarizer import Summarizer
 
 
@@ -34,7 +34,7 @@ class AccessControlMiddleware(BaseMiddleware):
 
 
 class DependencyInjectionMiddleware(BaseMiddleware):
-    def __init__(self, db: Database, summarizer: Summarizer, transcriber: Transcriber):
+    def __init__(self, db: Storage, summarizer: Summarizer, transcriber: Transcriber):
         super().__init__()
         self.db = db
         self.summarizer = summarizer
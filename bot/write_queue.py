@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Generic, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass
+class WriteQueueStats:
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    flush_count: int = 0
+    flushed_rows: int = 0
+    failed_flushes: int = 0
+    last_flush_ms: float = 0.0
+    max_flush_ms: float = 0.0
+    total_flush_ms: float = 0.0
+
+    @property
+    def avg_flush_ms(self) -> float:
+        return self.total_flush_ms / self.flush_count if self.flush_count else 0.0
+
+    @property
+    def avg_batch_size(self) -> float:
+        return self.flushed_rows / self.flush_count if self.flush_count else 0.0
+
+
+class WriteBehindQueue(Generic[T]):
+    """
+    In-process write-behind buffer.
+
+    Items are collected in memory and handed to ``flush_callback`` as one batch
+    whenever ``batch_size`` items are pending or ``flush_interval_ms`` has passed,
+    whichever comes first. ``stop()`` drains whatever is left.
+    """
+
+    def __init__(
+        self,
+        flush_callback: Callable[[List[T]], Awaitable[None]],
+        batch_size: int = 100,
+        flush_interval_ms: int = 500
+    ):
+        self._flush_callback = flush_callback
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(1, flush_interval_ms) / 1000
+        self._pending: List[T] = []
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.stats = WriteQueueStats()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def put(self, item: T) -> None:
+        self._pending.append(item)
+        self.stats.queue_depth = len(self._pending)
+        self.stats.max_queue_depth = max(self.stats.max_queue_depth, self.stats.queue_depth)
+
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush failed, will retry: {e}", exc_info=True)
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+
+            batch = self._pending
+            self._pending = []
+
+            started = time.perf_counter()
+            try:
+                await self._flush_callback(batch)
+            except BaseException:
+                # Put the batch back in front of anything queued meanwhile, also when cancelled
+                self._pending = batch + self._pending
+                self.stats.failed_flushes += 1
+                raise
+            finally:
+                self.stats.queue_depth = len(self._pending)
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.stats.flush_count += 1
+            self.stats.flushed_rows += len(batch)
+            self.stats.last_flush_ms = elapsed_ms
+            self.stats.max_flush_ms = max(self.stats.max_flush_ms, elapsed_ms)
+            self.stats.total_flush_ms += elapsed_ms
+
+            logger.debug(f"Flushed {len(batch)} queued writes in {elapsed_ms:.1f} ms")
+            return len(batch)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            # Let a running flush finish instead of cancelling it halfway through the batch
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+        await self.flush()
@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+"""
+Backfill script for legacy messages with chat_id = 0.
+
+Messages saved before the chat_id column existed were migrated with
+chat_id = 0 and show up in every chat. This script assigns them to real
+chats using the configured rules, or moves them to a quarantine table.
+It works in small batches and records its progress, so it can be stopped
+and resumed at any time, also while the bot is running.
+
+Rules are applied in this order:
+    1. --map-user USER_ID=CHAT_ID     explicit assignment for a user
+    2. --infer-from-history           the only chat the user has written in
+    3. --default-chat-id CHAT_ID      everything else goes to one chat
+    4. --quarantine                   everything else is moved out of messages
+
+Rows that match no rule are left untouched. The activity rollup and the
+participants directory are moved along by user, so hourly buckets whose
+messages are already past retention keep counting in the right chat.
+
+Usage:
+    python scripts/backfill_legacy_chat_id.py --infer-from-history --quarantine [--db-path data/messages.db]
+"""
+
+import argparse
+import logging
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+QUARANTINE_TABLE = 'messages_legacy_quarantine'
+STATE_TABLE = 'maintenance_state'
+CHECKPOINT_KEY = 'legacy_backfill_last_id'
+
+
+def parse_user_map(pairs) -> Dict[int, int]:
+    user_map = {}
+    for pair in pairs or []:
+        try:
+            user_id, chat_id = pair.split('=', 1)
+            user_map[int(user_id)] = int(chat_id)
+        except ValueError:
+            raise ValueError(f"Invalid --map-user value '{pair}', expected USER_ID=CHAT_ID")
+    return user_map
+
+
+def table_exists(cursor: sqlite3.Cursor, table: str) -> bool:
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
+    return cursor.fetchone() is not None
+
+
+def ensure_tables(conn: sqlite3.Connection) -> None:
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    """)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {QUARANTINE_TABLE} (
+            id INTEGER PRIMARY KEY,
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            username VARCHAR,
+            message_text TEXT NOT NULL,
+            timestamp DATETIME NOT NULL,
+            quarantined_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+
+
+def get_checkpoint(cursor: sqlite3.Cursor) -> int:
+    cursor.execute(f"SELECT value FROM {STATE_TABLE} WHERE key = ?", (CHECKPOINT_KEY,))
+    row = cursor.fetchone()
+    return int(row[0]) if row else 0
+
+
+def infer_user_chats(cursor: sqlite3.Cursor) -> Dict[int, int]:
+    """Map each user who has written in exactly one real chat to that chat."""
+    if table_exists(cursor, 'chat_participants'):
+        source = "SELECT user_id, chat_id FROM chat_participants WHERE chat_id != 0"
+    else:
+        source = "SELECT DISTINCT user_id, chat_id FROM messages WHERE chat_id != 0"
+
+    cursor.execute(f"""
+        SELECT user_id, MIN(chat_id), COUNT(DISTINCT chat_id)
+        FROM ({source})
+        GROUP BY user_id
+    """)
+    return {user_id: chat_id for user_id, chat_id, chats in cursor.fetchall() if chats == 1}
+
+
+def resolve_chat(
+    user_id: int,
+    user_map: Dict[int, int],
+    inferred: Dict[int, int],
+    default_chat_id: Optional[int]
+) -> Optional[int]:
+    if user_id in user_map:
+        return user_map[user_id]
+    if user_id in inferred:
+        return inferred[user_id]
+    return default_chat_id
+
+
+def backfill(
+    db_path: str,
+    user_map: Dict[int, int],
+    infer_from_history: bool,
+    default_chat_id: Optional[int],
+    quarantine: bool,
+    batch_size: int,
+    pause: float,
+    dry_run: bool
+) -> Optional[Dict[str, int]]:
+    db_file = Path(db_path)
+
+    if not db_file.exists():
+        logger.error(f"Database file not found: {db_path}")
+        return None
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("SELECT COUNT(*) FROM messages WHERE chat_id = 0")
+        remaining = cursor.fetchone()[0]
+        logger.info(f"Legacy messages with chat_id = 0: {remaining}")
+
+        inferred = infer_user_chats(cursor) if infer_from_history else {}
+        if infer_from_history:
+            logger.info(f"Inferred a unique chat for {len(inferred)} users")
+
+        stats = {'assigned': 0, 'quarantined': 0, 'skipped': 0}
+
+        if dry_run:
+            cursor.execute("SELECT user_id, COUNT(*) FROM messages WHERE chat_id = 0 GROUP BY user_id")
+            for user_id, count in cursor.fetchall():
+                if resolve_chat(user_id, user_map, inferred, default_chat_id) is not None:
+                    stats['assigned'] += count
+                elif quarantine:
+                    stats['quarantined'] += count
+                else:
+                    stats['skipped'] += count
+            logger.info(f"Dry run: would assign {stats['assigned']}, quarantine {stats['quarantined']}, "
+                        f"leave {stats['skipped']} rows")
+            return stats
+
+        ensure_tables(conn)
+        last_id = get_checkpoint(cursor)
+        if last_id:
+            logger.info(f"Resuming after message id {last_id}")
+
+        has_quiz_pool = table_exists(cursor, 'quiz_pool')
+
+        while True:
+            cursor.execute(
+                "SELECT id, user_id FROM messages WHERE chat_id = 0 AND id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            # One short transaction per batch keeps the write lock brief for the bot
+            with conn:
+                for message_id, user_id in rows:
+                    chat_id = resolve_chat(user_id, user_map, inferred, default_chat_id)
+
+                    if chat_id is not None:
+                        conn.execute("UPDATE messages SET chat_id = ? WHERE id = ?", (chat_id, message_id))
+                        if has_quiz_pool:
+                            conn.execute("UPDATE quiz_pool SET chat_id = ? WHERE message_id = ?", (chat_id, message_id))
+                        stats['assigned'] += 1
+                    elif quarantine:
+                        conn.execute(f"""
+                            INSERT INTO {QUARANTINE_TABLE} (id, chat_id, user_id, username, message_text, timestamp)
+                            SELECT id, chat_id, user_id, username, message_text, timestamp FROM messages WHERE id = ?
+                        """, (message_id,))
+                        if has_quiz_pool:
+                            conn.execute("DELETE FROM quiz_pool WHERE message_id = ?", (message_id,))
+                        conn.execute("DELETE FROM messages WHERE id = ?", (message_id,))
+                        stats['quarantined'] += 1
+                    else:
+                        stats['skipped'] += 1
+
+                last_id = rows[-1][0]
+                conn.execute(
+                    f"INSERT INTO {STATE_TABLE} (key, value) VALUES (?, ?) "
+                    f"ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    (CHECKPOINT_KEY, str(last_id))
+                )
+
+            done = stats['assigned'] + stats['quarantined'] + stats['skipped']
+            logger.info(f"Processed {done}/{remaining} rows (last id {last_id})")
+            time.sleep(pause)
+
+        # A full pass is done; the next run starts over so rows skipped now
+        # can be picked up by new rules
+        with conn:
+            conn.execute(f"DELETE FROM {STATE_TABLE} WHERE key = ?", (CHECKPOINT_KEY,))
+
+        reattribute_derived_rows(conn, user_map, inferred, default_chat_id, quarantine, pause)
+
+        logger.info(f"✓ Assigned {stats['assigned']}, quarantined {stats['quarantined']}, "
+                    f"left {stats['skipped']} rows")
+        return stats
+
+    finally:
+        conn.close()
+
+
+def reattribute_derived_rows(
+    conn: sqlite3.Connection,
+    user_map: Dict[int, int],
+    inferred: Dict[int, int],
+    default_chat_id: Optional[int],
+    quarantine: bool,
+    pause: float
+) -> Dict[str, int]:
+    """
+    Move the chat 0 activity buckets and participant rows to the chat their
+    user's messages went to.
+
+    Rules resolve per user, so every legacy message of a user ends up in the
+    same chat and whole rows can be merged into that chat's rows. Buckets
+    older than the message retention have no messages left to recount and
+    are kept this way. Rows of quarantined users are dropped like their
+    messages, rows of users no rule matched stay under chat 0.
+    """
+    cursor = conn.cursor()
+    has_rollup = table_exists(cursor, 'activity_hourly')
+    has_participants = table_exists(cursor, 'chat_participants')
+    stats = {'moved': 0, 'dropped': 0}
+
+    sources = []
+    if has_rollup:
+        sources.append("SELECT user_id FROM activity_hourly WHERE chat_id = 0")
+    if has_participants:
+        sources.append("SELECT user_id FROM chat_participants WHERE chat_id = 0")
+    if not sources:
+        return stats
+
+    cursor.execute(" UNION ".join(sources))
+    user_ids = [user_id for user_id, in cursor.fetchall()]
+
+    for user_id in user_ids:
+        chat_id = resolve_chat(user_id, user_map, inferred, default_chat_id)
+        if chat_id is None and not quarantine:
+            continue
+
+        # One short transaction per user, like the message batches
+        with conn:
+            if chat_id is not None and has_rollup:
+                conn.execute("""
+                    INSERT INTO activity_hourly (chat_id, user_id, username, hour_start, message_count)
+                    SELECT ?, user_id, username, hour_start, message_count
+                    FROM activity_hourly WHERE chat_id = 0 AND user_id = ?
+                    ON CONFLICT(chat_id, user_id, hour_start) DO UPDATE SET
+                        message_count = message_count + excluded.message_count,
+                        username = COALESCE(username, excluded.username)
+                """, (chat_id, user_id))
+            if chat_id is not None and has_participants:
+                conn.execute("""
+                    INSERT INTO chat_participants (chat_id, user_id, username, first_seen, last_seen, message_count)
+                    SELECT ?, user_id, username, first_seen, last_seen, message_count
+                    FROM chat_participants WHERE chat_id = 0 AND user_id = ?
+                    ON CONFLICT(chat_id, user_id) DO UPDATE SET
+                        username = CASE WHEN excluded.last_seen > last_seen THEN excluded.username ELSE username END,
+                        first_seen = MIN(first_seen, excluded.first_seen),
+                        last_seen = MAX(last_seen, excluded.last_seen),
+                        message_count = message_count + excluded.message_count
+                """, (chat_id, user_id))
+            if has_rollup:
+                conn.execute("DELETE FROM activity_hourly WHERE chat_id = 0 AND user_id = ?", (user_id,))
+            if has_participants:
+                conn.execute("DELETE FROM chat_participants WHERE chat_id = 0 AND user_id = ?", (user_id,))
+
+        stats['moved' if chat_id is not None else 'dropped'] += 1
+        time.sleep(pause)
+
+    logger.info(f"Moved the activity rollup and participants of {stats['moved']} users, "
+                f"dropped those of {stats['dropped']} quarantined users")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Assign legacy chat_id = 0 messages to real chats'
+    )
+    parser.add_argument(
+        '--db-path',
+        default='data/messages.db',
+        help='Path to database file (default: data/messages.db)'
+    )
+    parser.add_argument(
+        '--map-user',
+        action='append',
+        metavar='USER_ID=CHAT_ID',
+        help='Assign all legacy messages of a user to a chat (repeatable)'
+    )
+    parser.add_argument(
+        '--infer-from-history',
+        action='store_true',
+        help='Assign messages of users who have written in exactly one chat to that chat'
+    )
+    parser.add_argument(
+        '--default-chat-id',
+        type=int,
+        help='Assign all remaining legacy messages to this chat'
+    )
+    parser.add_argument(
+        '--quarantine',
+        action='store_true',
+        help=f'Move messages no rule matched into {QUARANTINE_TABLE}'
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=1000,
+        help='Rows per transaction (default: 1000)'
+    )
+    parser.add_argument(
+        '--pause',
+        type=float,
+        default=0.05,
+        help='Seconds to sleep between batches (default: 0.05)'
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='Only report what would happen'
+    )
+
+    args = parser.parse_args()
+
+    logger.info("=" * 60)
+    logger.info("Legacy chat_id backfill")
+    logger.info("=" * 60)
+
+    try:
+        user_map = parse_user_map(args.map_user)
+    except ValueError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+    try:
+        stats = backfill(
+            args.db_path,
+            user_map=user_map,
+            infer_from_history=args.infer_from_history,
+            default_chat_id=args.default_chat_id,
+            quarantine=args.quarantine,
+            batch_size=args.batch_size,
+            pause=args.pause,
+            dry_run=args.dry_run
+        )
+    except sqlite3.Error as e:
+        logger.error(f"❌ Database error during backfill: {e}")
+        logger.error("Progress is saved, re-run the script to resume.")
+        sys.exit(1)
+
+    if stats is None:
+        sys.exit(1)
+
+    if args.dry_run:
+        sys.exit(0)
+
+    logger.info("=" * 60)
+    if stats['skipped']:
+        logger.warning(f"{stats['skipped']} legacy rows matched no rule and still have chat_id = 0.")
+        logger.warning("Add rules (or --quarantine) and run the script again.")
+    else:
+        logger.info("Backfill complete: no legacy rows left.")
+        logger.info("Restart the bot so chat queries drop the chat_id = 0 fallback.")
+    logger.info("=" * 60)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,19 +2,29 @@
 """
 Database backup script.
 
-Creates a timestamped backup copy of the database before migration.
+Creates a consistent, timestamped backup of the database with the SQLite
+online backup API, also while the bot is running. Every backup is checked
+with PRAGMA integrity_check before it is kept. Incremental backups only
+store the pages that changed since the latest full backup.
 
 Usage:
-    python scripts/backup_db.py [--db-path data/messages.db] [--backup-dir backups]
+    python scripts/backup_db.py [--db-path data/messages.db] [--backup-dir backups] [--incremental]
+    python scripts/backup_db.py --restore backups/messages_backup_YYYYMMDD_HHMMSS.incr.gz --to restored.db
 """
 
 import argparse
 import logging
-import shutil
 import sys
+import tempfile
 from pathlib import Path
 from datetime import datetime
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'bot'))
+
+from backup import (  # noqa: E402
+    BACKUP_PAGES_PER_STEP, BACKUP_STEP_PAUSE_SECONDS, create_backup, list_backup_files, restore_backup
+)
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
@@ -22,63 +32,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def create_backup(db_path: str, backup_dir: str = 'backups') -> bool:
-    """
-    Create a backup copy of the database.
-
-    Args:
-        db_path: Path to database file
-        backup_dir: Directory to store backups
-
-    Returns:
-        True if backup was successful, False otherwise
-    """
-    db_file = Path(db_path)
-
-    if not db_file.exists():
-        logger.error(f"Database file not found: {db_path}")
-        return False
-
-    # Create backup directory if it doesn't exist
-    backup_path = Path(backup_dir)
-    backup_path.mkdir(exist_ok=True)
-
-    # Generate timestamped backup filename
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    backup_filename = f"{db_file.stem}_backup_{timestamp}{db_file.suffix}"
-    backup_file = backup_path / backup_filename
-
-    logger.info(f"Creating backup: {db_path} -> {backup_file}")
-
-    try:
-        shutil.copy2(db_path, backup_file)
-
-        # Verify backup
-        if backup_file.exists():
-            original_size = db_file.stat().st_size
-            backup_size = backup_file.stat().st_size
-
-            if original_size == backup_size:
-                logger.info(f"✅ Backup created successfully!")
-                logger.info(f"   Original: {original_size} bytes")
-                logger.info(f"   Backup:   {backup_size} bytes")
-                logger.info(f"   Location: {backup_file}")
-                return True
-            else:
-                logger.error("❌ Backup size mismatch!")
-                logger.error(f"   Original: {original_size} bytes")
-                logger.error(f"   Backup:   {backup_size} bytes")
-                return False
-        else:
-            logger.error("❌ Backup file was not created")
-            return False
-
-    except Exception as e:
-        logger.error(f"❌ Error creating backup: {e}")
-        return False
-
-
-def list_backups(backup_dir: str = 'backups'):
+def list_backups(db_path: str, backup_dir: str = 'backups'):
     """List all existing backups."""
     backup_path = Path(backup_dir)
 
@@ -86,7 +40,7 @@ def list_backups(backup_dir: str = 'backups'):
         logger.info(f"No backups directory found at: {backup_dir}")
         return
 
-    backups = sorted(backup_path.glob('*_backup_*.db'), reverse=True)
+    backups = list(reversed(list_backup_files(backup_path, db_path)))
 
     if not backups:
         logger.info(f"No backups found in: {backup_dir}")
@@ -98,16 +52,23 @@ def list_backups(backup_dir: str = 'backups'):
     for backup in backups:
         size = backup.stat().st_size
         mtime = datetime.fromtimestamp(backup.stat().st_mtime)
-        logger.info(f"  {backup.name}")
+        kind = "incremental" if '.incr' in backup.suffixes else "full"
+        logger.info(f"  {backup.name} ({kind})")
         logger.info(f"    Size: {size:,} bytes")
         logger.info(f"    Date: {mtime.strftime('%Y-%m-%d %H:%M:%S')}")
         logger.info("")
 
 
+def verify_backup(backup_file: str) -> bool:
+    """Restore a backup into a temporary file and run the integrity check on it."""
+    with tempfile.TemporaryDirectory() as tmp:
+        return restore_backup(backup_file, str(Path(tmp) / 'verify.db'))
+
+
 def main():
     """Main entry point for backup script."""
     parser = argparse.ArgumentParser(
-        description='Create database backup before migration'
+        description='Create, verify or restore database backups'
     )
     parser.add_argument(
         '--db-path',
@@ -119,28 +80,91 @@ def main():
         default='backups',
         help='Directory to store backups (default: backups)'
     )
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Only store pages changed since the latest full backup'
+    )
+    parser.add_argument(
+        '--no-compress',
+        action='store_true',
+        help='Store the backup without gzip compression'
+    )
+    parser.add_argument(
+        '--pages-per-step',
+        type=int,
+        default=BACKUP_PAGES_PER_STEP,
+        help=f'Pages copied per backup step (default: {BACKUP_PAGES_PER_STEP})'
+    )
+    parser.add_argument(
+        '--pause',
+        type=float,
+        default=BACKUP_STEP_PAUSE_SECONDS,
+        help=f'Seconds to sleep between steps (default: {BACKUP_STEP_PAUSE_SECONDS})'
+    )
     parser.add_argument(
         '--list',
         action='store_true',
         help='List existing backups'
     )
+    parser.add_argument(
+        '--verify',
+        metavar='BACKUP_FILE',
+        help='Restore a backup into a temporary file and check its integrity'
+    )
+    parser.add_argument(
+        '--restore',
+        metavar='BACKUP_FILE',
+        help='Rebuild a database file from a full or incremental backup (see --to)'
+    )
+    parser.add_argument(
+        '--to',
+        metavar='PATH',
+        help='Where --restore writes the database; must not exist'
+    )
 
     args = parser.parse_args()
 
     if args.list:
-        list_backups(args.backup_dir)
+        list_backups(args.db_path, args.backup_dir)
         sys.exit(0)
 
+    if args.verify:
+        ok = verify_backup(args.verify)
+        logger.info(f"✅ {args.verify} is intact" if ok else f"❌ {args.verify} is damaged")
+        sys.exit(0 if ok else 1)
+
+    if args.restore:
+        if not args.to or Path(args.to).exists():
+            logger.error("--restore needs a --to path that does not exist yet")
+            sys.exit(1)
+        ok = restore_backup(args.restore, args.to)
+        logger.info(f"✅ Restored {args.restore} to {args.to}" if ok else "❌ Restored database failed the integrity check")
+        sys.exit(0 if ok else 1)
+
+    if not Path(args.db_path).exists():
+        logger.error(f"Database file not found: {args.db_path}")
+        sys.exit(1)
+
     logger.info("=" * 60)
     logger.info("Database Backup")
     logger.info("=" * 60)
 
-    success = create_backup(args.db_path, args.backup_dir)
+    result = create_backup(
+        args.db_path,
+        args.backup_dir,
+        incremental=args.incremental,
+        compress=not args.no_compress,
+        pages_per_step=args.pages_per_step,
+        pause=args.pause
+    )
 
-    if success:
+    if result is not None:
         logger.info("=" * 60)
-        logger.info("Backup completed successfully!")
-        logger.info("You can now proceed with migration.")
+        logger.info(f"✅ Backup completed successfully ({result.kind})")
+        logger.info(f"   Pages:    {result.pages_written} of {result.page_count}")
+        logger.info(f"   Size:     {result.bytes_written:,} bytes")
+        logger.info(f"   Location: {result.path}")
         logger.info("=" * 60)
         sys.exit(0)
     else:
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""
+Benchmark for the bulk message read path.
+
+Builds a synthetic messages table in a temporary database and measures how
+many rows per second each read strategy turns into ChatMessage objects:
+
+    orm    select(Message) with ORM entities, then to_chat_message()
+    core   column select on a plain connection (what Database uses)
+    raw    hand-written SQL on the aiosqlite driver connection
+
+Usage:
+    python scripts/benchmark_reads.py [--rows 1000000] [--chats 1] [--repeat 3]
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'bot'))
+
+from sqlalchemy import select  # noqa: E402
+
+from database import Database  # noqa: E402
+from models import ChatMessage, Message  # noqa: E402
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+INSERT_CHUNK_SIZE = 50_000
+
+
+async def populate(db: Database, rows: int, chats: int) -> datetime:
+    """Insert `rows` messages spread over `chats` chats, one second apart."""
+    now = datetime.now()
+    start = now - timedelta(seconds=rows)
+
+    async with db.async_engine.begin() as conn:
+        for offset in range(0, rows, INSERT_CHUNK_SIZE):
+            batch = [
+                {
+                    'chat_id': i % chats + 1,
+                    'user_id': i % 50,
+                    'username': f"user{i % 50}",
+                    'message_text': f"synthetic message number {i} with some filler text",
+                    'timestamp': start + timedelta(seconds=i)
+                }
+                for i in range(offset, min(offset + INSERT_CHUNK_SIZE, rows))
+            ]
+            await conn.execute(Message.__table__.insert(), batch)
+
+    return start
+
+
+async def read_orm(db: Database, chat_id: int, since: datetime) -> int:
+    async with db.read_session() as session:
+        stmt = select(Message).where(
+            Message.chat_id == chat_id,
+            Message.timestamp >= since
+        ).order_by(Message.timestamp.asc())
+        messages = (await session.execute(stmt)).scalars().all()
+        return len([msg.to_chat_message() for msg in messages])
+
+
+async def read_core(db: Database, chat_id: int, since: datetime) -> int:
+    async with db.read_engine.connect() as conn:
+        result = await conn.execute(db._messages_since_stmt(chat_id, since))
+        return len([ChatMessage.from_row(row) for row in result])
+
+
+async def read_raw(db: Database, chat_id: int, since: datetime) -> int:
+    async with db.read_engine.connect() as conn:
+        raw = await conn.get_raw_connection()
+        cursor = await raw.driver_connection.execute(
+            "SELECT user_id, message_text, timestamp, username, chat_id FROM messages "
+            "WHERE chat_id = ? AND timestamp >= ? ORDER BY timestamp",
+            (chat_id, since.isoformat(' '))
+        )
+        rows = await cursor.fetchall()
+        await cursor.close()
+
+    parse = datetime.fromisoformat
+    return len([ChatMessage(user_id, text, parse(ts), username, chat)
+                for user_id, text, ts, username, chat in rows])
+
+
+async def run(rows: int, chats: int, repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(str(Path(tmp) / 'bench.db'), write_behind=False, profanity_flush_seconds=0)
+        await db.init_db()
+
+        try:
+            logger.info(f"Populating {rows} rows over {chats} chats...")
+            started = time.perf_counter()
+            since = await populate(db, rows, chats)
+            logger.info(f"Populated in {time.perf_counter() - started:.1f}s")
+
+            # Read the whole history of the largest chat
+            for name, reader in (('orm', read_orm), ('core', read_core), ('raw', read_raw)):
+                best = None
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    count = await reader(db, 1, since)
+                    elapsed = time.perf_counter() - started
+                    best = elapsed if best is None else min(best, elapsed)
+                logger.info(f"{name:>5}: {count} rows in {best:.3f}s ({count / best:,.0f} rows/s)")
+        finally:
+            await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure rows/s of the message read strategies'
+    )
+    parser.add_argument(
+        '--rows',
+        type=int,
+        default=1_000_000,
+        help='Number of synthetic messages (default: 1000000)'
+    )
+    parser.add_argument(
+        '--chats',
+        type=int,
+        default=1,
+        help='Number of chats the messages are spread over (default: 1)'
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='Runs per strategy, the best one is reported (default: 3)'
+    )
+
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.chats, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+Schema migration runner.
+
+Applies the pending migrations from bot/migrations.py in version order and
+records them in the schema_version table. Data backfills run in short
+batches and record their progress, so the script can run while the bot is
+ingesting and can be stopped and resumed at any time.
+
+Usage:
+    python scripts/migrate.py [--db-path data/messages.db] [--dry-run] [--status] [--target N]
+"""
+
+import argparse
+import logging
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'bot'))
+
+from migrations import (  # noqa: E402
+    MIGRATION_BATCH_PAUSE_SECONDS, MIGRATION_BATCH_SIZE, MigrationRunner, latest_version
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Apply pending database migrations'
+    )
+    parser.add_argument(
+        '--db-path',
+        default='data/messages.db',
+        help='Path to database file (default: data/messages.db)'
+    )
+    parser.add_argument(
+        '--target',
+        type=int,
+        help='Stop after this version (default: latest)'
+    )
+    parser.add_argument(
+        '--status',
+        action='store_true',
+        help='Show the current version and pending migrations'
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='Estimate rows and time of the pending migrations without applying them'
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=MIGRATION_BATCH_SIZE,
+        help=f'Rows per backfill transaction (default: {MIGRATION_BATCH_SIZE})'
+    )
+    parser.add_argument(
+        '--pause',
+        type=float,
+        default=MIGRATION_BATCH_PAUSE_SECONDS,
+        help=f'Seconds to sleep between batches (default: {MIGRATION_BATCH_PAUSE_SECONDS})'
+    )
+
+    args = parser.parse_args()
+
+    if not Path(args.db_path).exists():
+        logger.error(f"Database file not found: {args.db_path}")
+        sys.exit(1)
+
+    runner = MigrationRunner(args.db_path, batch_size=args.batch_size, pause=args.pause)
+
+    logger.info("=" * 60)
+    logger.info("Database Migration")
+    logger.info("=" * 60)
+
+    try:
+        pending = runner.pending(args.target)
+        logger.info(f"Current version: {runner.current_version()}, latest: {latest_version()}")
+
+        if args.status:
+            for migration in pending:
+                logger.info(f"  pending: {migration.version} {migration.name}")
+            sys.exit(0)
+
+        if not pending:
+            logger.info("✓ Database is up to date")
+            sys.exit(0)
+
+        if args.dry_run:
+            total = 0.0
+            for estimate in runner.estimate(args.target):
+                rows = f"{estimate.rows}" if estimate.exact else f"up to {estimate.rows}"
+                logger.info(f"  {estimate.version} {estimate.name}: {rows} rows to change, "
+                            f"{estimate.batches} batches, about {estimate.seconds:.0f}s")
+                total += estimate.seconds
+            logger.info(f"Dry run: at least {total:.0f}s in total (writes are not timed), nothing was changed")
+            sys.exit(0)
+
+        applied = runner.run(args.target)
+    except sqlite3.Error as e:
+        logger.error(f"❌ Database error during migration: {e}")
+        logger.error("Progress is saved, re-run the script to resume.")
+        sys.exit(1)
+
+    logger.info("=" * 60)
+    logger.info(f"✅ Applied {len(applied)} migrations, now at version {runner.current_version()}")
+    logger.info("=" * 60)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Build the full-text search index used by /search.
+
+The bot creates the index on startup and keeps it in sync with triggers,
+but messages that were stored before the index existed are only indexed by
+this script. It works in short batches and records its progress, so it can
+be stopped and resumed at any time, also while the bot is running. With
+--full the index of every message partition is rebuilt as well, one
+partition per transaction.
+
+Usage:
+    python scripts/rebuild_search_index.py [--db-path data/messages.db] [--full]
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'bot'))
+
+from sqlalchemy.exc import SQLAlchemyError  # noqa: E402
+
+from database import Database, SEARCH_INDEX_BATCH_SIZE  # noqa: E402
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+async def rebuild(db_path: str, full: bool, batch_size: int, pause: float) -> bool:
+    db = Database(db_path, write_behind=False, profanity_flush_seconds=0, hot_window_mb=0)
+    try:
+        await db.init_db()
+        if not db.search_enabled:
+            logger.error("❌ This SQLite build has no FTS5 support")
+            return False
+
+        if full:
+            logger.info("Dropping the existing index, every message will be indexed again")
+            if db.partitions:
+                logger.info(f"Rebuilding the indexes of {len(db.partitions)} partitions")
+            await db.reset_search_index()
+
+        pending = await db.get_search_backlog()
+        logger.info(f"Messages to index: {pending}")
+
+        indexed = await db.index_search_backlog(batch_size=batch_size, pause=pause)
+        logger.info(f"✓ Indexed {indexed} messages")
+        return True
+    finally:
+        await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Index stored messages for /search'
+    )
+    parser.add_argument(
+        '--db-path',
+        default='data/messages.db',
+        help='Path to database file (default: data/messages.db)'
+    )
+    parser.add_argument(
+        '--full',
+        action='store_true',
+        help='Drop the index and rebuild it from all messages, partitions included'
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=SEARCH_INDEX_BATCH_SIZE,
+        help=f'Messages per transaction (default: {SEARCH_INDEX_BATCH_SIZE})'
+    )
+    parser.add_argument(
+        '--pause',
+        type=float,
+        default=0.05,
+        help='Seconds to sleep between batches (default: 0.05)'
+    )
+
+    args = parser.parse_args()
+
+    if not Path(args.db_path).exists():
+        logger.error(f"Database file not found: {args.db_path}")
+        sys.exit(1)
+
+    logger.info("=" * 60)
+    logger.info("Search index rebuild")
+    logger.info("=" * 60)
+
+    try:
+        ok = asyncio.run(rebuild(args.db_path, args.full, args.batch_size, args.pause))
+    except SQLAlchemyError as e:
+        logger.error(f"❌ Database error during indexing: {e}")
+        logger.error("Progress is saved, re-run the script to resume.")
+        sys.exit(1)
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
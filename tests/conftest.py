@@ -0,0 +1,7 @@
+"""Shared pytest configuration."""
+
+import sys
+from pathlib import Path
+
+# Bot modules import each other by bare module name (they run from bot/)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "bot"))
@@ -0,0 +1,45 @@
+"""Unit tests for archive module."""
+
+import pytest
+from datetime import datetime, timedelta
+from bot.archive import archive_day, decode_block, encode_block
+from bot.models import ChatMessage
+
+
+class TestBlocks:
+    """Test compressed archive blocks."""
+
+    def test_round_trip(self):
+        """Test that a block decodes to the messages it was built from."""
+        day = datetime(2024, 3, 4)
+        messages = [
+            ChatMessage(1, "привет", day + timedelta(hours=9, microseconds=123), "Alice", 100),
+            ChatMessage(2, "hello", day + timedelta(hours=23, minutes=59, seconds=59), None, 100),
+        ]
+
+        payload, raw_bytes = encode_block(day, messages)
+        decoded = decode_block(100, day, payload)
+
+        assert [(m.user_id, m.message_text, m.timestamp, m.username, m.chat_id) for m in decoded] == \
+            [(m.user_id, m.message_text, m.timestamp, m.username, m.chat_id) for m in messages]
+        assert raw_bytes > 0
+
+    def test_repetitive_text_compresses(self):
+        """Test that chat-like text shrinks well below its raw size."""
+        day = datetime(2024, 3, 4)
+        messages = [ChatMessage(i % 5, f"message number {i} in the chat", day + timedelta(seconds=i), "User", 1)
+                    for i in range(500)]
+
+        payload, raw_bytes = encode_block(day, messages)
+
+        assert len(payload) * 3 < raw_bytes
+
+    def test_unknown_version_rejected(self):
+        import json
+        import zlib
+
+        with pytest.raises(ValueError):
+            decode_block(1, datetime(2024, 3, 4), zlib.compress(json.dumps({'v': 99, 'rows': []}).encode()))
+
+    def test_archive_day(self):
+        assert archive_day(datetime(2024, 3, 4, 17, 5, 1)) == datetime(2024, 3, 4)
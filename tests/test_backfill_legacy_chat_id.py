@@ -0,0 +1,122 @@
+"""Unit tests for the legacy chat_id backfill script."""
+
+import sqlite3
+import pytest
+from bot.database import Database
+from scripts.backfill_legacy_chat_id import backfill, parse_user_map
+
+
+async def make_legacy_db(path):
+    db = Database(path, write_behind=False)
+    await db.init_db()
+    await db.save_message(user_id=1, username="Alice", message_text="alice in her only chat", chat_id=100)
+    await db.save_message(user_id=2, username="Bob", message_text="bob in chat one", chat_id=100)
+    await db.save_message(user_id=2, username="Bob", message_text="bob in chat two", chat_id=200)
+    for user_id, name in [(1, "Alice"), (2, "Bob"), (3, "Carol")]:
+        await db.save_message(user_id=user_id, username=name, message_text=f"legacy message by {name}", chat_id=0)
+    await db.close()
+
+
+def chat_ids_by_text(path):
+    conn = sqlite3.connect(path)
+    rows = dict(conn.execute("SELECT message_text, chat_id FROM messages").fetchall())
+    conn.close()
+    return rows
+
+
+class TestBackfill:
+    """Test the batched legacy backfill."""
+
+    def test_parse_user_map(self):
+        """Test USER_ID=CHAT_ID parsing."""
+        assert parse_user_map(["1=100", "2=-200"]) == {1: 100, 2: -200}
+        with pytest.raises(ValueError):
+            parse_user_map(["oops"])
+
+    async def test_rules_and_quarantine(self, tmp_path):
+        """Test rule precedence and quarantining unmatched rows."""
+        path = str(tmp_path / "legacy.db")
+        await make_legacy_db(path)
+
+        stats = backfill(path, user_map={2: 200}, infer_from_history=True, default_chat_id=None,
+                         quarantine=True, batch_size=1, pause=0, dry_run=False)
+
+        assert stats == {'assigned': 2, 'quarantined': 1, 'skipped': 0}
+        chats = chat_ids_by_text(path)
+        assert chats["legacy message by Alice"] == 100  # inferred
+        assert chats["legacy message by Bob"] == 200    # explicit map wins over ambiguity
+        assert "legacy message by Carol" not in chats
+
+        conn = sqlite3.connect(path)
+        assert conn.execute("SELECT COUNT(*) FROM messages_legacy_quarantine").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(*) FROM quiz_pool WHERE chat_id = 0").fetchone()[0] == 0
+        conn.close()
+
+    async def test_dry_run_changes_nothing(self, tmp_path):
+        """Test that a dry run only reports."""
+        path = str(tmp_path / "legacy.db")
+        await make_legacy_db(path)
+
+        stats = backfill(path, user_map={}, infer_from_history=True, default_chat_id=None,
+                         quarantine=False, batch_size=10, pause=0, dry_run=True)
+
+        assert stats == {'assigned': 1, 'quarantined': 0, 'skipped': 2}
+        assert list(chat_ids_by_text(path).values()).count(0) == 3
+
+    async def test_queries_drop_legacy_rows_after_backfill(self, tmp_path):
+        """Test that the bot stops mixing chat 0 rows in once none are left."""
+        path = str(tmp_path / "legacy.db")
+        await make_legacy_db(path)
+
+        db = Database(path, write_behind=False)
+        await db.init_db()
+        assert db.include_legacy_rows
+        assert len(await db.get_messages_since(100, 1)) == 5
+        await db.close()
+
+        backfill(path, user_map={}, infer_from_history=False, default_chat_id=100,
+                 quarantine=False, batch_size=2, pause=0, dry_run=False)
+
+        db = Database(path, write_behind=False)
+        await db.init_db()
+        assert not db.include_legacy_rows
+        assert len(await db.get_messages_since(100, 1)) == 5
+        assert len(await db.get_messages_since(200, 1)) == 1
+        assert sorted(await db.get_chat_participants(200)) == ["Bob"]
+        await db.close()
+
+    async def test_rollup_history_survives_backfill(self, tmp_path):
+        """Test that chat 0 buckets are moved, not recounted from the remaining messages."""
+        path = str(tmp_path / "legacy.db")
+        await make_legacy_db(path)
+
+        # Buckets whose messages are already past retention
+        conn = sqlite3.connect(path)
+        with conn:
+            conn.executemany(
+                "INSERT INTO activity_hourly (chat_id, user_id, username, hour_start, message_count) "
+                "VALUES (?, ?, ?, '2020-01-01 10:00:00.000000', ?)",
+                [(0, 1, "Alice", 5), (100, 1, "Alice", 2), (0, 3, "Carol", 4), (100, 2, "Bob", 7)]
+            )
+        conn.close()
+
+        backfill(path, user_map={}, infer_from_history=True, default_chat_id=None,
+                 quarantine=True, batch_size=2, pause=0, dry_run=False)
+
+        conn = sqlite3.connect(path)
+        old_buckets = dict(conn.execute(
+            "SELECT chat_id || ':' || user_id, message_count FROM activity_hourly "
+            "WHERE hour_start < '2021-01-01'"
+        ).fetchall())
+        alice = conn.execute(
+            "SELECT message_count FROM chat_participants WHERE chat_id = 100 AND user_id = 1"
+        ).fetchone()[0]
+        legacy_rows = conn.execute(
+            "SELECT (SELECT COUNT(*) FROM activity_hourly WHERE chat_id = 0), "
+            "(SELECT COUNT(*) FROM chat_participants WHERE chat_id = 0)"
+        ).fetchone()
+        conn.close()
+
+        assert old_buckets == {"100:1": 7, "100:2": 7}  # Alice merged, Carol quarantined
+        assert alice == 2
+        assert legacy_rows == (0, 0)
@@ -0,0 +1,113 @@
+"""Unit tests for backup module."""
+
+import sqlite3
+import threading
+from pathlib import Path
+from bot.backup import (
+    create_backup, integrity_check, list_backup_files, online_copy, prune_backups, restore_backup,
+    run_scheduled_backup
+)
+
+
+def make_db(path, rows=2000):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("CREATE TABLE messages (id INTEGER PRIMARY KEY, message_text TEXT)")
+    conn.executemany("INSERT INTO messages (message_text) VALUES (?)", [(f"message {i} " * 20,) for i in range(rows)])
+    conn.commit()
+    return conn
+
+
+def count_rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT count(*) FROM messages").fetchone()[0]
+    finally:
+        conn.close()
+
+
+class TestOnlineCopy:
+    """Test the stepped online backup."""
+
+    def test_snapshot_is_consistent_while_writing(self, tmp_path):
+        """Test that commits during the copy neither restart nor tear it."""
+        db_path = str(tmp_path / "live.db")
+        writer = make_db(db_path)
+        writer.close()
+
+        stop = threading.Event()
+
+        def write():
+            conn = sqlite3.connect(db_path, check_same_thread=False)
+            while not stop.is_set():
+                conn.execute("INSERT INTO messages (message_text) VALUES ('concurrent')")
+                conn.commit()
+            conn.close()
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        try:
+            steps = online_copy(db_path, tmp_path / "copy.db", pages_per_step=20, pause=0.001)
+        finally:
+            stop.set()
+            thread.join()
+
+        assert steps > 1
+        assert integrity_check(tmp_path / "copy.db")
+        assert count_rows(tmp_path / "copy.db") >= 2000
+
+
+class TestBackups:
+    """Test full and incremental backups."""
+
+    def test_full_backup_restores(self, tmp_path):
+        db_path = str(tmp_path / "messages.db")
+        make_db(db_path).close()
+
+        result = create_backup(db_path, str(tmp_path / "backups"), pause=0)
+
+        assert result.kind == "full"
+        assert result.path.name.endswith(".db.gz")
+        assert result.bytes_written < Path(db_path).stat().st_size
+        assert restore_backup(str(result.path), str(tmp_path / "restored.db"))
+        assert count_rows(tmp_path / "restored.db") == 2000
+
+    def test_incremental_stores_changed_pages(self, tmp_path):
+        """Test that an incremental backup holds only changed pages and restores fully."""
+        db_path = str(tmp_path / "messages.db")
+        conn = make_db(db_path)
+        backups = str(tmp_path / "backups")
+        full = create_backup(db_path, backups, pause=0)
+
+        conn.execute("INSERT INTO messages (message_text) VALUES ('after the full backup')")
+        conn.commit()
+        incremental = create_backup(db_path, backups, incremental=True, pause=0)
+        conn.close()
+
+        assert incremental.kind == "incremental"
+        assert incremental.base == full.path.name
+        assert 0 < incremental.pages_written < full.pages_written
+        assert restore_backup(str(incremental.path), str(tmp_path / "restored.db"))
+        assert count_rows(tmp_path / "restored.db") == 2001
+
+    def test_incremental_without_full_falls_back(self, tmp_path):
+        db_path = str(tmp_path / "messages.db")
+        make_db(db_path).close()
+
+        result = create_backup(db_path, str(tmp_path / "backups"), incremental=True, compress=False, pause=0)
+
+        assert result.kind == "full"
+        assert result.path.suffix == ".db"
+
+    def test_scheduled_runs_and_pruning(self, tmp_path):
+        """Test the full/incremental rotation and that old chains are pruned."""
+        db_path = str(tmp_path / "messages.db")
+        make_db(db_path, rows=100).close()
+        backups = str(tmp_path / "backups")
+
+        kinds = [run_scheduled_backup(db_path, backups, full_every=2, keep_full=1).kind for _ in range(4)]
+
+        assert kinds == ["full", "incremental", "full", "incremental"]
+        remaining = list_backup_files(Path(backups), db_path)
+        assert len(remaining) == 2
+        assert prune_backups(backups, db_path, keep_full=1) == 0
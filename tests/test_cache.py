@@ -0,0 +1,77 @@
+"""Unit tests for cache module."""
+
+from bot.cache import LRUCache
+
+
+class TestLRUCache:
+    """Test the bounded, tag-invalidated cache."""
+
+    def test_hit_and_miss_counters(self):
+        cache = LRUCache(max_entries=10)
+
+        assert cache.get("a") is None
+        cache.put("a", 1, tag="chat", version=cache.version("chat"))
+
+        assert cache.get("a") == 1
+        assert cache.stats.hits == 1
+        assert cache.stats.misses == 1
+        assert cache.stats.hit_ratio == 0.5
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_entries=2)
+        for key in ("a", "b"):
+            cache.put(key, key, tag=key, version=0)
+        cache.get("a")
+        cache.put("c", "c", tag="c", version=0)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == "a"
+        assert cache.stats.evictions == 1
+        assert cache.stats.entries == 2
+
+    def test_invalidate_drops_tag(self):
+        cache = LRUCache(max_entries=10)
+        cache.put("top", [1], tag="chat1", version=0)
+        cache.put("other", [2], tag="chat2", version=0)
+
+        cache.invalidate("chat1")
+
+        assert cache.get("top") is None
+        assert cache.get("other") == [2]
+        assert cache.stats.invalidations == 1
+
+    def test_stale_read_is_not_stored(self):
+        """Test that a result read before a write does not outlive it."""
+        cache = LRUCache(max_entries=10)
+        version = cache.version("chat")
+        cache.invalidate("chat")
+
+        cache.put("top", "stale", tag="chat", version=version)
+
+        assert cache.get("top") is None
+
+    def test_update_in_place(self):
+        cache = LRUCache(max_entries=10)
+        cache.put("count", 3, tag="chat", version=0)
+
+        cache.update("count", lambda value: value + 2, tag="chat")
+        cache.update("missing", lambda value: value + 2, tag="chat")
+
+        assert cache.get("count") == 5
+        assert cache.get("missing") is None
+
+    def test_disabled(self):
+        cache = LRUCache(max_entries=0)
+        cache.put("a", 1, tag="chat", version=0)
+        assert cache.get("a") is None
+
+    def test_entries_expire_after_ttl(self):
+        fresh = LRUCache(max_entries=10, ttl=60)
+        fresh.put("a", 1, tag="chat", version=0)
+        assert fresh.get("a") == 1
+
+        expired = LRUCache(max_entries=10, ttl=0)
+        expired.put("a", 1, tag="chat", version=0)
+        assert expired.get("a") is None
+        assert expired.stats.expirations == 1
+        assert expired.stats.entries == 0
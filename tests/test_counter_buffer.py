@@ -0,0 +1,72 @@
+"""Unit tests for counter_buffer module."""
+
+import asyncio
+
+import pytest
+
+from bot.counter_buffer import CounterBuffer
+
+
+class TestCounterBuffer:
+    """Test aggregation and flushing of counter deltas."""
+
+    async def test_deltas_are_summed_per_user(self):
+        flushed = []
+
+        async def sink(rows):
+            flushed.extend(rows)
+
+        buffer = CounterBuffer(sink, flush_interval=60)
+        buffer.add(100, 1, "Alice", 2)
+        buffer.add(100, 1, "Alicia", 3)
+        buffer.add(100, 2, "Bob", 1)
+
+        assert buffer.pending(100, 1) == 5
+        assert await buffer.flush() == 2
+        assert {(row['user_id'], row['username'], row['count']) for row in flushed} == {(1, "Alicia", 5), (2, "Bob", 1)}
+        assert len(buffer) == 0
+
+    async def test_failed_flush_keeps_deltas(self):
+        async def failing_sink(rows):
+            raise RuntimeError("database is locked")
+
+        buffer = CounterBuffer(failing_sink, flush_interval=60)
+        buffer.add(100, 1, "Alice", 2)
+        with pytest.raises(RuntimeError):
+            await buffer.flush()
+
+        assert buffer.pending(100, 1) == 2
+
+    async def test_stop_during_slow_flush_keeps_deltas(self):
+        stored = []
+        flushing = asyncio.Event()
+
+        async def slow_sink(rows):
+            flushing.set()
+            await asyncio.sleep(0.05)
+            stored.extend((row['user_id'], row['count']) for row in rows)
+
+        buffer = CounterBuffer(slow_sink, flush_interval=0.01)
+        buffer.start()
+        buffer.add(100, 1, "Alice", 2)
+        await flushing.wait()
+        buffer.add(100, 1, "Alice", 1)
+        await buffer.stop()
+
+        assert stored == [(1, 2), (1, 1)]
+        assert len(buffer) == 0
+
+    async def test_cancelled_flush_keeps_deltas(self):
+        async def hanging_sink(rows):
+            await asyncio.sleep(60)
+
+        buffer = CounterBuffer(hanging_sink, flush_interval=60)
+        buffer.add(100, 1, "Alice", 2)
+        flush = asyncio.ensure_future(buffer.flush())
+        await asyncio.sleep(0.01)
+        buffer.add(100, 1, "Alice", 1)
+        flush.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await flush
+
+        assert buffer.pending(100, 1) == 3
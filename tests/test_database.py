@@ -0,0 +1,911 @@
+"""Unit tests for database module."""
+
+import pytest
+from bot.database import Database
+
+
+@pytest.fixture
+async def db(tmp_path):
+    database = Database(str(tmp_path / "test.db"), write_behind=False)
+    await database.init_db()
+    yield database
+    await database.close()
+
+
+@pytest.fixture
+async def wb_db(tmp_path):
+    database = Database(str(tmp_path / "test_wb.db"), write_behind=True)
+    database.write_queue.batch_size = 1000
+    database.write_queue.flush_interval = 60
+    await database.init_db()
+    yield database
+    await database.close()
+
+
+class TestSaveMessage:
+    """Test message persistence."""
+
+    async def test_save_and_read(self, db):
+        """Test that saved messages are returned by get_messages_since."""
+        await db.save_message(user_id=1, username="Alice", message_text="hello", chat_id=100)
+        await db.save_message(user_id=2, username="Bob", message_text="hi", chat_id=100)
+        await db.save_message(user_id=3, username="Eve", message_text="other chat", chat_id=200)
+
+        messages = await db.get_messages_since(100, 1)
+        assert [m.message_text for m in messages] == ["hello", "hi"]
+        assert await db.get_message_count(100) == 2
+
+
+class TestWriteBehind:
+    """Test write-behind ingestion mode."""
+
+    async def test_messages_buffered_until_flush(self, wb_db):
+        """Test that queued messages are persisted in one flush."""
+        for i in range(5):
+            await wb_db.save_message(user_id=1, username="Alice", message_text=f"msg {i}", chat_id=100)
+
+        assert await wb_db.get_message_count(100) == 0
+        assert wb_db.get_write_queue_stats().queue_depth == 5
+
+        flushed = await wb_db.flush_writes()
+        assert flushed == 5
+        assert await wb_db.get_message_count(100) == 5
+
+        stats = wb_db.get_write_queue_stats()
+        assert stats.flush_count == 1
+        assert stats.queue_depth == 0
+
+    async def test_close_flushes_pending(self, tmp_path):
+        """Test that closing the database drains the queue."""
+        path = str(tmp_path / "drain.db")
+        database = Database(path, write_behind=True)
+        await database.init_db()
+        await database.save_message(user_id=1, username="Alice", message_text="last words", chat_id=100)
+        await database.close()
+
+        reopened = Database(path, write_behind=False)
+        await reopened.init_db()
+        assert await reopened.get_message_count(100) == 1
+        await reopened.close()
+
+
+class TestStorageProfile:
+    """Test the SQLite storage profile and reader/writer split."""
+
+    async def test_wal_and_pragmas(self, db):
+        """Test that connections use WAL, mmap and the configured cache size."""
+        from sqlalchemy import text
+        from bot.config import Config
+
+        async with db.read_engine.connect() as conn:
+            assert (await conn.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+            assert (await conn.execute(text("PRAGMA cache_size"))).scalar() == Config.SQLITE_CACHE_SIZE
+            assert (await conn.execute(text("PRAGMA mmap_size"))).scalar() == Config.SQLITE_MMAP_SIZE
+
+    async def test_reader_pool_is_read_only(self, db):
+        """Test that the reader engine refuses writes."""
+        from sqlalchemy import text
+
+        assert db.read_engine is not db.async_engine
+        async with db.read_engine.connect() as conn:
+            with pytest.raises(Exception, match="readonly|read-only|query_only"):
+                await conn.execute(text("DELETE FROM messages"))
+
+    async def test_reads_not_blocked_by_open_write(self, db):
+        """Test that a reader sees committed data while a write transaction is open."""
+        from sqlalchemy import text
+
+        await db.save_message(user_id=1, username="Alice", message_text="committed", chat_id=100)
+
+        async with db.async_engine.connect() as writer:
+            await writer.execute(text(
+                "INSERT INTO messages (chat_id, user_id, username, message_text, timestamp) "
+                "VALUES (100, 2, 'Bob', 'uncommitted', CURRENT_TIMESTAMP)"
+            ))
+            messages = await db.get_messages_since(100, 1)
+            assert [m.message_text for m in messages] == ["committed"]
+            await writer.rollback()
+
+
+class TestProfanityAggregation:
+    """Test buffered profanity counters."""
+
+    @pytest.fixture
+    async def agg_db(self, tmp_path):
+        database = Database(str(tmp_path / "agg.db"), write_behind=False, profanity_flush_seconds=3600)
+        await database.init_db()
+        yield database
+        await database.close()
+
+    async def test_counts_merge_unflushed_deltas(self, agg_db):
+        """Test that reads include deltas that are not yet flushed."""
+        await agg_db.update_profanity_count(user_id=1, username="Alice", chat_id=100, count=2)
+        await agg_db.update_profanity_count(user_id=1, username="Alice", chat_id=100, count=3)
+
+        assert await agg_db._get_stored_user_profanity_count(1, 100) == 0
+        assert await agg_db.get_user_profanity_count(1, 100) == 5
+
+        await agg_db.flush_profanity_counts()
+        assert await agg_db._get_stored_user_profanity_count(1, 100) == 5
+        assert await agg_db.get_user_profanity_count(1, 100) == 5
+
+    async def test_flush_upserts_existing_rows(self, agg_db):
+        """Test that repeated flushes add to stored counts."""
+        await agg_db.update_profanity_count(user_id=1, username="Alice", chat_id=100, count=4)
+        await agg_db.flush_profanity_counts()
+        await agg_db.update_profanity_count(user_id=1, username="Alice2", chat_id=100, count=1)
+        await agg_db.flush_profanity_counts()
+
+        assert await agg_db.get_profanity_stats(100) == [("Alice2", 5)]
+
+    async def test_leaderboard_exact_with_pending(self, agg_db):
+        """Test that pending deltas can reorder the leaderboard."""
+        for user_id, name, count in [(1, "A", 10), (2, "B", 8), (3, "C", 1)]:
+            await agg_db.update_profanity_count(user_id=user_id, username=name, chat_id=100, count=count)
+        await agg_db.flush_profanity_counts()
+
+        await agg_db.update_profanity_count(user_id=3, username="C", chat_id=100, count=20)
+        await agg_db.update_profanity_count(user_id=4, username="D", chat_id=100, count=9)
+
+        assert await agg_db.get_profanity_stats(100, limit=3) == [("C", 21), ("A", 10), ("D", 9)]
+        assert await agg_db.get_profanity_stats(200) == []
+
+    async def test_close_flushes_deltas(self, tmp_path):
+        """Test that shutdown persists pending deltas."""
+        path = str(tmp_path / "agg_close.db")
+        database = Database(path, write_behind=False, profanity_flush_seconds=3600)
+        await database.init_db()
+        await database.update_profanity_count(user_id=1, username="Alice", chat_id=100, count=7)
+        await database.close()
+
+        reopened = Database(path, write_behind=False, profanity_flush_seconds=0)
+        await reopened.init_db()
+        assert await reopened.get_user_profanity_count(1, 100) == 7
+        await reopened.close()
+
+
+class TestIngest:
+    """Test the single-transaction ingest path."""
+
+    @staticmethod
+    def make_record(text="hello", user_id=1, username="Alice", chat_id=100, profanity=0):
+        from datetime import datetime
+        from models import MessageIngest
+
+        return MessageIngest(
+            chat_id=chat_id,
+            user_id=user_id,
+            username=username,
+            message_text=text,
+            timestamp=datetime.now(),
+            profanity_count=profanity
+        )
+
+    async def test_message_and_profanity_saved_together(self, db):
+        """Test that one ingest stores the message and its counter delta."""
+        await db.ingest_message(self.make_record(profanity=2))
+        await db.ingest_message(self.make_record(profanity=1))
+
+        assert await db.get_message_count(100) == 2
+        assert await db.get_user_profanity_count(1, 100) == 3
+
+    async def test_failed_side_effect_rolls_back_message(self, db, monkeypatch):
+        """Test that a failing side effect does not leave an orphan message."""
+        async def broken(session, rows):
+            raise RuntimeError("boom")
+
+        monkeypatch.setattr(db, "_upsert_profanity_rows", broken)
+        with pytest.raises(RuntimeError):
+            await db.ingest_message(self.make_record(profanity=1))
+
+        assert await db.get_message_count(100) == 0
+
+    async def test_username_refresh(self, db):
+        """Test that a new display name propagates to quiz and profanity stats."""
+        await db.update_quiz_score(user_id=1, username="Alice", chat_id=100, correct=True)
+        await db.update_profanity_count(user_id=1, username="Alice", chat_id=100, count=1)
+
+        await db.ingest_message(self.make_record(username="Alicia"))
+
+        assert await db.get_quiz_leaderboard(100) == [("Alicia", 1, 1)]
+        assert await db.get_profanity_stats(100) == [("Alicia", 1)]
+
+    async def test_quiz_score_upsert(self, db):
+        """Test that quiz scores accumulate through the upsert."""
+        await db.update_quiz_score(user_id=1, username="Alice", chat_id=100, correct=True)
+        await db.update_quiz_score(user_id=1, username="Alice", chat_id=100, correct=False)
+        await db.update_quiz_score(user_id=1, username="Alice", chat_id=100, correct=True)
+
+        assert await db.get_quiz_leaderboard(100) == [("Alice", 2, 3)]
+
+    async def test_write_behind_batch_is_one_transaction(self, wb_db):
+        """Test that queued ingests apply messages and counters in one flush."""
+        await wb_db.ingest_message(self.make_record(profanity=2))
+        await wb_db.ingest_message(self.make_record(user_id=2, username="Bob", profanity=1))
+        await wb_db.ingest_message(self.make_record(profanity=3))
+
+        assert await wb_db.get_user_profanity_count(1, 100) == 0
+        await wb_db.flush_writes()
+
+        assert await wb_db.get_message_count(100) == 3
+        assert await wb_db.get_profanity_stats(100) == [("Alice", 5), ("Bob", 1)]
+
+
+class TestActivityRollup:
+    """Test the hourly activity rollup."""
+
+    async def test_rollup_maintained_on_ingest(self, db):
+        """Test that counts come from the rollup and match the raw messages."""
+        from datetime import datetime, timedelta
+
+        now = datetime.now()
+        for hours_ago, user_id, name in [(0, 1, "Alice"), (0, 1, "Alice"), (2, 2, "Bob"), (30, 1, "Alice"), (200, 2, "Bob")]:
+            await db.save_message(user_id=user_id, username=name, message_text="x", chat_id=100,
+                                  ts=now - timedelta(hours=hours_ago))
+
+        assert await db.get_activity_count(100, 24) == len(await db.get_messages_since(100, 24)) == 3
+        assert await db.get_activity_count(100, 168) == 4
+        assert await db.get_activity_count(200, 24) == 0
+
+    async def test_rebuild_matches_incremental(self, db):
+        """Test that rebuilding from history yields the same buckets."""
+        from datetime import datetime, timedelta
+
+        now = datetime.now()
+        for i in range(10):
+            await db.save_message(user_id=i % 3, username=f"U{i % 3}", message_text="x", chat_id=100,
+                                  ts=now - timedelta(minutes=37 * i))
+
+        before_top = await db.get_top_talkers(100)
+        before_heatmap = await db.get_activity_heatmap(100)
+
+        await db.rebuild_activity_rollup()
+
+        assert await db.get_top_talkers(100) == before_top
+        assert await db.get_activity_heatmap(100) == before_heatmap
+        assert sum(map(sum, before_heatmap)) == 10
+
+    async def test_top_talkers_and_heatmap(self, db):
+        """Test top talkers ordering and heatmap placement."""
+        from datetime import datetime
+
+        ts = datetime(2025, 1, 6, 9, 15)  # Monday 09:15
+        for _ in range(3):
+            await db.save_message(user_id=1, username="Alice", message_text="x", chat_id=100, ts=ts)
+        await db.save_message(user_id=2, username="Bob", message_text="x", chat_id=100, ts=ts)
+        await db.save_message(user_id=1, username="Alicia", message_text="x", chat_id=100,
+                              ts=datetime(2025, 1, 12, 23, 59))  # Sunday 23:59
+
+        assert await db.get_top_talkers(100) == [("Alicia", 4), ("Bob", 1)]
+
+        heatmap = await db.get_activity_heatmap(100)
+        assert heatmap[0][9] == 4
+        assert heatmap[6][23] == 1
+
+
+class TestParticipants:
+    """Test the chat participants directory."""
+
+    async def test_directory_follows_ingest(self, db):
+        """Test that the cached directory sees new members without reloading."""
+        await db.save_message(user_id=1, username="Alice", message_text="x", chat_id=100)
+        assert await db.get_chat_participants(100) == ["Alice"]
+
+        await db.save_message(user_id=2, username="Bob", message_text="x", chat_id=100)
+        await db.save_message(user_id=1, username="Alicia", message_text="x", chat_id=100)
+        assert sorted(await db.get_chat_participants(100)) == ["Alicia", "Bob"]
+        assert await db.get_chat_participants(200) == []
+
+    async def test_cache_serves_lookups(self, db, monkeypatch):
+        """Test that a loaded chat is answered without touching the database."""
+        await db.save_message(user_id=1, username="Alice", message_text="x", chat_id=100)
+        await db.get_chat_participants(100)
+
+        async def fail(chat_id):
+            raise AssertionError("directory reloaded")
+
+        monkeypatch.setattr(db, "_load_participants", fail)
+        assert await db.get_chat_participants(100) == ["Alice"]
+
+    async def test_active_filter(self, db):
+        """Test filtering members by last-seen time."""
+        from datetime import datetime, timedelta
+
+        await db.save_message(user_id=1, username="Old", message_text="x", chat_id=100,
+                              ts=datetime.now() - timedelta(days=10))
+        await db.save_message(user_id=2, username="New", message_text="x", chat_id=100)
+
+        assert await db.get_chat_participants(100, active_within_hours=24) == ["New"]
+        assert sorted(await db.get_chat_participants(100)) == ["New", "Old"]
+
+    async def test_rebuild_from_history(self, db):
+        """Test rebuilding the directory from stored messages."""
+        await db.save_message(user_id=1, username="Alice", message_text="x", chat_id=100)
+        await db.save_message(user_id=1, username="Alicia", message_text="x", chat_id=100)
+        await db.save_message(user_id=2, username="Bob", message_text="x", chat_id=100)
+
+        assert await db.rebuild_participants() == 2
+        directory = {p.user_id: p.username for p in await db.get_participant_directory(100)}
+        assert directory == {1: "Alicia", 2: "Bob"}
+
+
+class TestQuizPool:
+    """Test the quiz eligibility index."""
+
+    async def test_only_eligible_messages_sampled(self, db):
+        """Test that commands, short texts and photo stubs are never picked."""
+        from consts import PHOTO_PLACEHOLDER_TEXT
+
+        await db.save_message(user_id=1, username="Alice", message_text="/whosaid is a fun command", chat_id=100)
+        await db.save_message(user_id=1, username="Alice", message_text="short", chat_id=100)
+        await db.save_message(user_id=1, username="Alice", message_text=PHOTO_PLACEHOLDER_TEXT, chat_id=100)
+        await db.save_message(user_id=2, username="Bob", message_text="this one is long enough to ask about", chat_id=100)
+
+        for _ in range(20):
+            picked = await db.get_random_message_for_quiz(100)
+            assert picked.message_text == "this one is long enough to ask about"
+            assert picked.username == "Bob"
+
+        assert await db.get_random_message_for_quiz(200) is None
+
+    async def test_sampling_covers_pool(self, db):
+        """Test that random probing reaches every candidate."""
+        texts = {f"candidate message number {i:02d}" for i in range(5)}
+        for text in sorted(texts):
+            await db.save_message(user_id=1, username="Alice", message_text=text, chat_id=100)
+            await db.save_message(user_id=2, username="Bob", message_text=f"{text} in another chat", chat_id=200)
+
+        seen = {(await db.get_random_message_for_quiz(100)).message_text for _ in range(200)}
+        assert seen == texts
+
+    async def test_rebuild_matches_ingest(self, db):
+        """Test that the SQL rebuild applies the same eligibility rules."""
+        await db.save_message(user_id=1, username="Alice", message_text="/command that is long enough", chat_id=100)
+        await db.save_message(user_id=1, username="Alice", message_text="a perfectly fine quiz message", chat_id=100)
+        await db.save_message(user_id=1, username="Alice", message_text="tiny", chat_id=100)
+
+        assert await db.rebuild_quiz_pool() == 1
+
+    async def test_cleanup_removes_candidates(self, db):
+        """Test that retention cleanup also prunes the pool."""
+        from datetime import datetime, timedelta
+
+        await db.save_message(user_id=1, username="Alice", message_text="an old message long enough", chat_id=100,
+                              ts=datetime.now() - timedelta(days=60))
+        await db.cleanup_old_messages(30)
+
+        assert await db.get_random_message_for_quiz(100) is None
+
+
+class TestLegacyScope:
+    """Test chat scoping with and without legacy chat_id = 0 rows."""
+
+    @staticmethod
+    async def query_plan(db, stmt):
+        from sqlalchemy import text
+
+        sql = str(stmt.compile(db.async_engine.sync_engine, compile_kwargs={"literal_binds": True}))
+        async with db.read_engine.connect() as conn:
+            return [row[3] for row in (await conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))).all()]
+
+    async def test_or_free_plan_without_legacy_rows(self, db):
+        """Test that chat queries are a single range scan once no legacy rows exist."""
+        from datetime import datetime
+
+        assert not db.include_legacy_rows
+        plan = await self.query_plan(db, db._messages_since_stmt(100, datetime(2025, 1, 1)))
+
+        assert plan == ["SEARCH messages USING INDEX idx_chat_timestamp (chat_id=? AND timestamp>?)"]
+
+    async def test_legacy_rows_detected(self, tmp_path):
+        """Test that chat 0 rows are included while they exist."""
+        path = str(tmp_path / "legacy_scope.db")
+        database = Database(path, write_behind=False)
+        await database.init_db()
+        await database.save_message(user_id=1, username="Old", message_text="from before chat ids", chat_id=0)
+        await database.save_message(user_id=2, username="New", message_text="hello", chat_id=100)
+        await database.close()
+
+        database = Database(path, write_behind=False)
+        await database.init_db()
+        assert database.include_legacy_rows
+        assert len(await database.get_messages_since(100, 1)) == 2
+        assert sorted(await database.get_chat_participants(100)) == ["New", "Old"]
+        await database.close()
+
+
+class TestStreaming:
+    """Test streaming history reads."""
+
+    async def test_stream_matches_list(self, db):
+        """Test that streaming yields the same messages in order."""
+        from datetime import datetime, timedelta
+
+        now = datetime.now()
+        for i in range(25):
+            await db.save_message(user_id=i % 4, username=f"U{i % 4}", message_text=f"m{i}", chat_id=100,
+                                  ts=now - timedelta(minutes=60 - i))
+
+        streamed = [msg async for msg in db.stream_messages_since(100, 2, chunk_size=7)]
+        listed = await db.get_messages_since(100, 2)
+
+        assert [m.message_text for m in streamed] == [m.message_text for m in listed]
+        assert len(streamed) == 25
+
+        batch = await db.get_message_batch(100, 2, chunk_size=7)
+        assert list(batch) == listed
+
+    async def test_rows_map_to_chat_message_fields(self, db):
+        """Test that column rows land in the matching ChatMessage fields."""
+        from datetime import datetime
+
+        ts = datetime.now().replace(microsecond=0)
+        await db.save_message(user_id=7, username="Seven", message_text="hello there", chat_id=100, ts=ts)
+
+        [msg] = await db.get_messages_since(100, 1)
+
+        assert (msg.user_id, msg.message_text, msg.timestamp, msg.username, msg.chat_id) == \
+            (7, "hello there", ts, "Seven", 100)
+
+
+class TestHotWindow:
+    """Test serving recent history from the in-memory hot window."""
+
+    async def test_warm_and_ingest_match_database(self, tmp_path):
+        """Test that warmed and ingested messages equal the database result."""
+        from datetime import datetime, timedelta
+
+        path = str(tmp_path / "hot.db")
+        now = datetime.now()
+
+        seed = Database(path, write_behind=False)
+        await seed.init_db()
+        for i in range(10):
+            await seed.save_message(user_id=i % 3, username=f"U{i % 3}", message_text=f"old {i}", chat_id=100,
+                                    ts=now - timedelta(hours=30 - i))
+        await seed.close()
+
+        database = Database(path, write_behind=False, hot_window_mb=16)
+        await database.init_db()
+        try:
+            assert database.get_hot_window_stats().messages == 10
+
+            await database.save_message(user_id=1, username="U1", message_text="new", chat_id=100)
+            await database.save_message(user_id=1, username="U1", message_text="elsewhere", chat_id=200)
+
+            cached = await database.get_messages_since(100, 48)
+            assert [m.message_text for m in cached][-1] == "new"
+            assert database.get_hot_window_stats().hits == 1
+
+            database.hot_window = None
+            assert cached == await database.get_messages_since(100, 48)
+        finally:
+            await database.close()
+
+    async def test_miss_beyond_window(self, tmp_path):
+        """Test that windows longer than the cached range go to the database."""
+        database = Database(str(tmp_path / "hot.db"), write_behind=False, hot_window_mb=16)
+        await database.init_db()
+        try:
+            await database.save_message(user_id=1, username="A", message_text="hello", chat_id=100)
+
+            assert len(await database.get_messages_since(100, database.hot_window.hours + 1)) == 1
+            assert [m async for m in database.stream_messages_since(100, 1)][0].message_text == "hello"
+
+            stats = database.get_hot_window_stats()
+            assert (stats.hits, stats.misses) == (1, 1)
+        finally:
+            await database.close()
+
+
+class TestSearch:
+    """Test the FTS5 message index and search."""
+
+    async def test_search_is_per_chat_with_snippets(self, db):
+        """Test that results come from the requested chat only and carry marked snippets."""
+        await db.save_message(user_id=1, username="Ann", message_text="Кто идет на шашлыки в субботу?", chat_id=100)
+        await db.save_message(user_id=2, username="Bob", message_text="шашлыки отменяются", chat_id=200)
+        await db.save_message(user_id=3, username="Cat", message_text="просто сообщение", chat_id=100)
+
+        results = await db.search_messages(100, "шашлык")
+
+        assert [r.username for r in results] == ["Ann"]
+        assert "\x02шашлыки\x03" in results[0].snippet
+
+    async def test_pagination(self, db):
+        """Test that limit and offset page through all matches."""
+        for i in range(7):
+            await db.save_message(user_id=1, username="Ann", message_text=f"пицца номер {i}", chat_id=100)
+
+        first = await db.search_messages(100, "пицца", limit=5)
+        second = await db.search_messages(100, "пицца", limit=5, offset=5)
+
+        assert len(first) == 5 and len(second) == 2
+        assert not {r.message_id for r in first} & {r.message_id for r in second}
+
+    async def test_query_syntax_is_escaped(self, db):
+        """Test that FTS5 operators in user input are treated as plain words."""
+        await db.save_message(user_id=1, username="Ann", message_text="NOT a problem", chat_id=100)
+
+        assert len(await db.search_messages(100, 'NOT "a')) == 1
+        assert await db.search_messages(100, "***") == []
+
+    async def test_cleanup_removes_from_index(self, db):
+        """Test that deleted messages disappear from search."""
+        from datetime import datetime, timedelta
+
+        await db.save_message(user_id=1, username="Ann", message_text="старое сообщение", chat_id=100,
+                              ts=datetime.now() - timedelta(days=40))
+        await db.cleanup_old_messages(30)
+
+        assert await db.search_messages(100, "старое") == []
+
+    async def test_backlog_is_indexed_in_batches(self, tmp_path):
+        """Test that messages stored before the index existed are indexed by the backlog job."""
+        import sqlite3
+
+        path = tmp_path / "legacy.db"
+        conn = sqlite3.connect(path)
+        conn.execute(
+            "CREATE TABLE messages (id INTEGER PRIMARY KEY, chat_id INTEGER NOT NULL, user_id INTEGER NOT NULL, "
+            "username VARCHAR, message_text TEXT NOT NULL, timestamp DATETIME NOT NULL)"
+        )
+        conn.executemany(
+            "INSERT INTO messages (chat_id, user_id, username, message_text, timestamp) "
+            "VALUES (100, 1, 'Ann', ?, '2025-01-01 12:00:00.000000')",
+            [(f"архив {i}",) for i in range(12)]
+        )
+        conn.commit()
+        conn.close()
+
+        database = Database(str(path), write_behind=False)
+        await database.init_db()
+        try:
+            assert await database.get_search_backlog() == 12
+
+            await database.save_message(user_id=1, username="Ann", message_text="архив свежий", chat_id=100)
+            assert len(await database.search_messages(100, "архив", limit=50)) == 1
+
+            assert await database.index_search_backlog(batch_size=5) == 12
+            assert await database.get_search_backlog() == 0
+            assert len(await database.search_messages(100, "архив", limit=50)) == 13
+        finally:
+            await database.close()
+
+
+class TestCleanup:
+    """Test batched retention cleanup."""
+
+    async def _seed_old(self, db, count):
+        from datetime import datetime, timedelta
+        from models import Message
+
+        old = datetime.now() - timedelta(days=40)
+        async with db.async_engine.begin() as conn:
+            await conn.execute(Message.__table__.insert(), [
+                {'chat_id': 100, 'user_id': 1, 'username': 'A', 'message_text': 'x' * 300,
+                 'timestamp': old + timedelta(seconds=i)}
+                for i in range(count)
+            ])
+
+    async def test_deletes_in_batches_and_frees_pages(self, db):
+        """Test that all old rows go in several batches and the file shrinks."""
+        await self._seed_old(db, 2500)
+        await db.save_message(user_id=2, username="B", message_text="fresh", chat_id=100)
+
+        stats = await db.cleanup_old_messages(30, batch_size=1000)
+
+        assert stats.completed
+        assert stats.rows_deleted == 2500
+        assert stats.batches == 3
+        assert stats.pages_freed > 0
+        assert stats.max_lock_ms > 0
+        assert await db.get_message_count(100) == 1
+
+    async def test_writes_get_through_during_vacuum(self, db, monkeypatch):
+        """Test that the incremental vacuum releases the writer connection between steps."""
+        import asyncio
+        import time
+
+        monkeypatch.setattr("bot.database.Config.CLEANUP_VACUUM_PAGES", 10)
+        await self._seed_old(db, 2500)
+        cleanup = asyncio.create_task(db.cleanup_old_messages(30, batch_size=5000))
+
+        waits = []
+        while not cleanup.done():
+            started = time.perf_counter()
+            await db.save_message(user_id=2, username="B", message_text="during cleanup", chat_id=100)
+            waits.append(time.perf_counter() - started)
+            await asyncio.sleep(0.01)
+        stats = await cleanup
+
+        assert stats.vacuum_steps > 5
+        # A write waits for one step at most, not for the whole vacuum
+        assert max(waits) < stats.elapsed_ms / 1000 / 2
+        assert stats.max_lock_ms < stats.elapsed_ms / 2
+
+    async def test_time_budget_stops_early(self, db):
+        """Test that an exhausted budget leaves the rest for the next run."""
+        await self._seed_old(db, 300)
+
+        stats = await db.cleanup_old_messages(30, batch_size=100, time_budget=0)
+
+        assert not stats.completed
+        assert stats.rows_deleted == 0
+        assert await db.get_message_count(100) == 300
+
+
+class TestPartitions:
+    """Test time-partitioned message storage."""
+
+    @pytest.fixture
+    async def part_db(self, tmp_path):
+        database = Database(str(tmp_path / "test_part.db"), write_behind=False, partition_period="day")
+        await database.init_db()
+        yield database
+        await database.close()
+
+    async def test_rejects_unknown_period(self, tmp_path):
+        """Test that a typo in the period fails early."""
+        with pytest.raises(ValueError):
+            Database(str(tmp_path / "bad.db"), write_behind=False, partition_period="year")
+
+    async def test_reads_span_partitions(self, part_db):
+        """Test that reads merge the partitions overlapping the window."""
+        from datetime import datetime, timedelta
+
+        now = datetime.now()
+        for days in (3, 1, 0):
+            await part_db.save_message(user_id=1, username="Alice", message_text=f"{days} days ago",
+                                       chat_id=100, ts=now - timedelta(days=days))
+
+        assert len(part_db.partitions) == 3
+        messages = await part_db.get_messages_since(100, 72 + 1)
+        assert [m.message_text for m in messages] == ["3 days ago", "1 days ago", "0 days ago"]
+        assert [m.message_text for m in await part_db.get_messages_since(100, 36)] == ["1 days ago", "0 days ago"]
+        assert await part_db.get_message_count(100) == 3
+
+        stmt = part_db._messages_since_stmt(100, now - timedelta(hours=36))
+        assert "messages_" + (now - timedelta(days=3)).strftime("%Y%m%d") not in str(stmt)
+
+    async def test_ids_unique_across_partitions(self, part_db):
+        """Test that partitions continue one id sequence."""
+        from datetime import datetime, timedelta
+        from sqlalchemy import select
+
+        await part_db.save_message(user_id=1, username="Alice", message_text="old", chat_id=100,
+                                   ts=datetime.now() - timedelta(days=2))
+        await part_db.save_message(user_id=1, username="Alice", message_text="new", chat_id=100)
+
+        async with part_db.read_session() as session:
+            source = part_db._message_source()
+            ids = (await session.execute(select(source.c.id))).scalars().all()
+        assert len(ids) == len(set(ids)) == 2
+
+    async def test_quiz_and_search(self, part_db):
+        """Test that quiz candidates and the search index cover partitions."""
+        text = "a sufficiently long message about partitioned storage"
+        await part_db.save_message(user_id=1, username="Alice", message_text=text, chat_id=100)
+
+        quiz = await part_db.get_random_message_for_quiz(100)
+        assert quiz is not None and quiz.message_text == text
+
+        if part_db.search_enabled:
+            results = await part_db.search_messages(100, "partitioned")
+            assert len(results) == 1
+
+    async def test_full_search_rebuild_covers_partitions(self, part_db):
+        """Test that resetting the search index also rebuilds the partition indexes."""
+        from sqlalchemy import text
+
+        if not part_db.search_enabled:
+            pytest.skip("SQLite built without FTS5")
+        await part_db.save_message(user_id=1, username="Alice", message_text="partitioned words", chat_id=100)
+        search_table = part_db.partitions[0].search_table
+        async with part_db.async_engine.begin() as conn:
+            await conn.execute(text(f"INSERT INTO {search_table}({search_table}) VALUES ('delete-all')"))
+        assert await part_db.search_messages(100, "partitioned") == []
+
+        await part_db.reset_search_index()
+        await part_db.index_search_backlog()
+
+        assert len(await part_db.search_messages(100, "partitioned")) == 1
+
+    async def test_cleanup_drops_expired_partitions(self, part_db):
+        """Test that retention drops whole partitions and keeps current ones."""
+        from datetime import datetime, timedelta
+
+        now = datetime.now()
+        await part_db.save_message(user_id=1, username="Alice", message_text="expired message text here",
+                                   chat_id=100, ts=now - timedelta(days=40))
+        await part_db.save_message(user_id=1, username="Alice", message_text="fresh", chat_id=100)
+
+        stats = await part_db.cleanup_old_messages(30)
+
+        assert stats.partitions_dropped == 1
+        assert stats.rows_deleted == 1
+        assert len(part_db.partitions) == 1
+        assert await part_db.get_message_count(100) == 1
+        assert await part_db.get_random_message_for_quiz(100) is None
+
+    async def test_ids_not_reused_after_partitions_dropped(self, part_db):
+        """Test that a new partition continues after the ids of dropped ones."""
+        from datetime import datetime, timedelta
+
+        await part_db.save_message(user_id=1, username="Alice", message_text="expired", chat_id=100,
+                                   ts=datetime.now() - timedelta(days=40))
+        expired_id = await part_db.get_last_message_id(100, 24 * 41)
+
+        await part_db.cleanup_old_messages(30)
+        assert part_db.partitions == []
+
+        await part_db.save_message(user_id=1, username="Alice", message_text="fresh", chat_id=100)
+        assert await part_db.get_last_message_id(100, 1) > expired_id
+
+    async def test_partitions_reload(self, tmp_path):
+        """Test that a restart picks up the partition registry."""
+        path = str(tmp_path / "reload.db")
+        first = Database(path, write_behind=False, partition_period="week")
+        await first.init_db()
+        await first.save_message(user_id=1, username="Alice", message_text="hello", chat_id=100)
+        await first.close()
+
+        second = Database(path, write_behind=False, partition_period="none")
+        await second.init_db()
+        try:
+            assert len(second.partitions) == 1
+            assert second.partition_period == "month"
+            assert await second.get_message_count(100) == 1
+        finally:
+            await second.close()
+
+
+class TestArchive:
+    """Test the compressed cold archive."""
+
+    @pytest.fixture
+    async def archive_db(self, tmp_path):
+        database = Database(str(tmp_path / "test_archive.db"), write_behind=False, archive_enabled=True)
+        await database.init_db()
+        yield database
+        await database.close()
+
+    async def _seed_old(self, db, count, days=40):
+        from datetime import datetime, timedelta
+
+        old = datetime.now().replace(hour=12) - timedelta(days=days)
+        for i in range(count):
+            await db.save_message(user_id=i % 3, username=f"U{i % 3}", chat_id=100,
+                                  message_text=f"archived message number {i}", ts=old + timedelta(seconds=i))
+
+    async def test_cleanup_moves_rows_into_blocks(self, archive_db):
+        """Test that expired rows end up in one block per chat and day."""
+        await self._seed_old(archive_db, 25)
+        await archive_db.save_message(user_id=1, username="A", message_text="fresh", chat_id=100)
+
+        stats = await archive_db.cleanup_old_messages(30, batch_size=10)
+
+        assert stats.completed
+        assert stats.rows_archived == 25
+        assert await archive_db.get_message_count(100) == 1
+
+        archive = await archive_db.get_archive_stats()
+        assert archive.blocks == 1
+        assert archive.messages == 25
+
+    async def test_long_range_reads_include_archive(self, archive_db):
+        """Test that reads reaching into the archive return archived rows first."""
+        await self._seed_old(archive_db, 5)
+        await archive_db.save_message(user_id=1, username="A", message_text="fresh", chat_id=100)
+        await archive_db.cleanup_old_messages(30)
+
+        messages = await archive_db.get_messages_since(100, 41 * 24)
+        assert [m.message_text for m in messages] == [f"archived message number {i}" for i in range(5)] + ["fresh"]
+
+        streamed = [m.message_text async for m in archive_db.stream_messages_since(100, 41 * 24)]
+        assert streamed == [m.message_text for m in messages]
+
+        batch = await archive_db.get_message_batch(100, 41 * 24)
+        assert len(batch) == 6
+
+        # Short windows never touch the archive
+        blocks_read = (await archive_db.get_archive_stats()).blocks_read
+        assert [m.message_text for m in await archive_db.get_messages_since(100, 24)] == ["fresh"]
+        assert (await archive_db.get_archive_stats()).blocks_read == blocks_read
+
+    async def test_quiz_draws_from_archive(self, archive_db):
+        """Test that the quiz still finds messages after they were archived."""
+        await self._seed_old(archive_db, 5)
+        await archive_db.cleanup_old_messages(30)
+
+        message = await archive_db.get_random_message_for_quiz(100)
+        assert message is not None
+        assert message.message_text.startswith("archived message number")
+
+    async def test_archive_survives_restart(self, tmp_path):
+        """Test that the archive high-water mark is reloaded."""
+        path = str(tmp_path / "restart.db")
+        first = Database(path, write_behind=False, archive_enabled=True)
+        await first.init_db()
+        await self._seed_old(first, 3)
+        await first.cleanup_old_messages(30)
+        await first.close()
+
+        second = Database(path, write_behind=False, archive_enabled=False)
+        await second.init_db()
+        try:
+            assert len(await second.get_messages_since(100, 41 * 24)) == 3
+        finally:
+            await second.close()
+
+    async def test_partition_drop_archives(self, tmp_path):
+        """Test that dropping a partition archives its rows."""
+        database = Database(str(tmp_path / "part_archive.db"), write_behind=False,
+                            partition_period="day", archive_enabled=True)
+        await database.init_db()
+        try:
+            await self._seed_old(database, 4)
+            stats = await database.cleanup_old_messages(30)
+
+            assert stats.partitions_dropped == 1
+            assert stats.rows_archived == 4
+            assert len(await database.get_messages_since(100, 41 * 24)) == 4
+        finally:
+            await database.close()
+
+
+class TestStatsCache:
+    """Test the leaderboard and per-user counter cache."""
+
+    async def test_repeated_reads_hit(self, db):
+        await db.update_profanity_count(user_id=1, username="Alice", chat_id=100, count=2)
+
+        assert await db.get_profanity_stats(100) == [("Alice", 2)]
+        assert await db.get_profanity_stats(100) == [("Alice", 2)]
+
+        stats = db.get_stats_cache_stats()
+        assert stats.hits == 1
+        assert stats.misses == 1
+
+    async def test_profanity_writes_refresh_results(self, db):
+        """Test that counter writes invalidate the leaderboard and adjust the user count."""
+        await db.update_profanity_count(user_id=1, username="Alice", chat_id=100, count=2)
+        await db.update_profanity_count(user_id=2, username="Bob", chat_id=200, count=1)
+        assert await db.get_profanity_stats(100) == [("Alice", 2)]
+        assert await db.get_user_profanity_count(1, 100) == 2
+        assert await db.get_profanity_stats(200) == [("Bob", 1)]
+
+        from bot.models import MessageIngest
+        from datetime import datetime
+        await db.ingest_message(MessageIngest(chat_id=100, user_id=1, username="Alice", message_text="swear",
+                                              timestamp=datetime.now(), profanity_count=3))
+
+        hits = db.get_stats_cache_stats().hits
+        assert await db.get_user_profanity_count(1, 100) == 5
+        assert db.get_stats_cache_stats().hits == hits + 1
+        assert await db.get_profanity_stats(100) == [("Alice", 5)]
+        assert await db.get_profanity_stats(200) == [("Bob", 1)]
+        assert db.get_stats_cache_stats().hits == hits + 2
+
+    async def test_quiz_score_invalidates_leaderboard(self, db):
+        await db.update_quiz_score(user_id=1, username="Alice", chat_id=100, correct=True)
+        assert await db.get_quiz_leaderboard(100) == [("Alice", 1, 1)]
+
+        await db.update_quiz_score(user_id=1, username="Alice", chat_id=100, correct=False)
+
+        assert await db.get_quiz_leaderboard(100) == [("Alice", 1, 2)]
+
+    async def test_buffered_deltas_visible(self, tmp_path):
+        """Test that buffered counters reach cached results before they are flushed."""
+        database = Database(str(tmp_path / "cache_buffer.db"), write_behind=False, profanity_flush_seconds=3600)
+        await database.init_db()
+        try:
+            assert await database.get_user_profanity_count(1, 100) == 0
+            assert await database.get_profanity_stats(100) == []
+
+            await database.update_profanity_count(user_id=1, username="Alice", chat_id=100, count=4)
+
+            assert await database.get_user_profanity_count(1, 100) == 4
+            assert await database.get_profanity_stats(100) == [("Alice", 4)]
+        finally:
+            await database.close()
@@ -0,0 +1,46 @@
+"""Unit tests for games module."""
+
+import pytest
+from datetime import datetime
+from bot.games import create_quiz_question, is_quiz_eligible
+from bot.consts import PHOTO_PLACEHOLDER_TEXT
+from bot.models import ChatMessage
+
+
+class TestQuizEligibility:
+    """Test is_quiz_eligible."""
+
+    def test_long_message_is_eligible(self):
+        """Test that a normal long message qualifies."""
+        assert is_quiz_eligible("Кто-нибудь идет сегодня в бар?")
+
+    def test_short_message_is_not_eligible(self):
+        """Test that short messages are rejected."""
+        assert not is_quiz_eligible("ок")
+
+    def test_command_is_not_eligible(self):
+        """Test that bot commands are rejected."""
+        assert not is_quiz_eligible("/summary 48 please do it now")
+
+    def test_photo_placeholder_is_not_eligible(self):
+        """Test that the photo stub is rejected."""
+        assert not is_quiz_eligible(PHOTO_PLACEHOLDER_TEXT)
+
+
+class TestCreateQuizQuestion:
+    """Test create_quiz_question."""
+
+    def test_options_contain_correct_answer(self):
+        """Test that the author is always among four options."""
+        msg = ChatMessage(
+            user_id=1,
+            message_text="Кто-нибудь идет сегодня в бар?",
+            timestamp=datetime(2025, 1, 1, 12, 0, 0),
+            username="Alice"
+        )
+        question, options, correct = create_quiz_question(msg, ["Alice", "Bob", "Carol", "Dave", "Eve"])
+
+        assert correct == "Alice"
+        assert len(options) == 4
+        assert "Alice" in options
+        assert msg.message_text in question
@@ -0,0 +1,93 @@
+"""Unit tests for hot_window module."""
+
+from datetime import datetime, timedelta
+from bot.hot_window import HotWindowCache, message_size
+from bot.models import ChatMessage
+
+
+def make_message(chat_id, minutes_ago, text="hello", now=None):
+    now = now or datetime.now()
+    return ChatMessage(
+        user_id=1,
+        message_text=text,
+        timestamp=now - timedelta(minutes=minutes_ago),
+        username="Alice",
+        chat_id=chat_id
+    )
+
+
+class TestHotWindowCache:
+    """Test the per-chat hot window."""
+
+    def test_cold_cache_misses(self):
+        """Test that nothing is served before the cache is warm."""
+        cache = HotWindowCache(hours=24, max_bytes=10 ** 6)
+
+        assert cache.get(1, datetime.now() - timedelta(hours=1)) is None
+        assert cache.stats.misses == 1
+
+    def test_warm_chat_without_messages_hits(self):
+        """Test that a chat unseen since warm-up is known to be empty."""
+        cache = HotWindowCache(hours=24, max_bytes=10 ** 6)
+        cache.mark_warm(cache.horizon())
+
+        assert cache.get(1, datetime.now() - timedelta(hours=1)) == []
+        assert cache.stats.hits == 1
+
+    def test_serves_tail_in_order(self):
+        """Test that only messages inside the requested range come back, oldest first."""
+        cache = HotWindowCache(hours=24, max_bytes=10 ** 6)
+        cache.mark_warm(cache.horizon())
+        now = datetime.now()
+        for minutes_ago in (90, 10, 50, 30):
+            cache.add(make_message(1, minutes_ago, text=str(minutes_ago), now=now))
+
+        result = cache.get(1, now - timedelta(minutes=60))
+        assert [m.message_text for m in result] == ["50", "30", "10"]
+
+    def test_partial_window_after_eviction(self):
+        """Test that a dropped chat is only served from its first new message on."""
+        cache = HotWindowCache(hours=24, max_bytes=10 ** 6)
+        now = datetime.now()
+        cache.add(make_message(1, 30, now=now))
+
+        assert cache.get(1, now - timedelta(minutes=60)) is None
+        assert len(cache.get(1, now - timedelta(minutes=30))) == 1
+
+    def test_expired_messages_are_trimmed(self):
+        """Test that messages older than the window are dropped."""
+        cache = HotWindowCache(hours=1, max_bytes=10 ** 6)
+        cache.mark_warm(cache.horizon())
+        now = datetime.now()
+        cache.add(make_message(1, 120, now=now))
+        cache.add(make_message(1, 5, now=now))
+
+        assert cache.stats.messages == 1
+        assert cache.get(1, now - timedelta(hours=3)) is None
+
+    def test_full_window_query_hits(self):
+        """Test that a query for exactly `hours` back is served from the window."""
+        cache = HotWindowCache(hours=1, max_bytes=10 ** 6)
+        cache.load(1, [make_message(1, 30)], covered_since=cache.horizon())
+        since_time = datetime.now() - timedelta(hours=1)
+
+        assert [m.message_text for m in cache.get(1, since_time)] == ["hello"]
+        assert cache.stats.hits == 1
+
+    def test_lru_eviction(self):
+        """Test that the least recently used chat goes when the cap is exceeded."""
+        size = message_size(make_message(1, 0))
+        cache = HotWindowCache(hours=24, max_bytes=size * 2)
+        cache.mark_warm(cache.horizon())
+        now = datetime.now()
+
+        cache.add(make_message(1, 3, now=now))
+        cache.add(make_message(2, 2, now=now))
+        cache.get(1, now - timedelta(hours=1))
+        cache.add(make_message(3, 1, now=now))
+
+        stats = cache.stats
+        assert stats.evictions == 1
+        assert stats.chats == 2
+        assert cache.get(2, now - timedelta(hours=1)) is None
+        assert len(cache.get(1, now - timedelta(hours=1))) == 1
@@ -0,0 +1,149 @@
+"""Unit tests for llm_scheduler module."""
+
+import asyncio
+
+import pytest
+
+from bot.llm_scheduler import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    LLMRequest,
+    LLMScheduler,
+    SchedulerBusy
+)
+
+
+async def started(count=1):
+    # Lets queued calls reach their first await
+    for _ in range(count):
+        await asyncio.sleep(0)
+
+
+class TestLLMScheduler:
+    """Test concurrency, ordering and backpressure of LLM calls."""
+
+    async def test_concurrency_limit(self):
+        scheduler = LLMScheduler(max_concurrency=2)
+        running = []
+        peak = 0
+
+        async def call():
+            nonlocal peak
+            running.append(1)
+            peak = max(peak, len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+            return "ok"
+
+        results = await asyncio.gather(*(scheduler.run(10, call) for _ in range(5)))
+
+        assert results == ["ok"] * 5
+        assert peak == 2
+        assert scheduler.stats.started == 5
+        assert scheduler.stats.running == 0
+
+    async def test_round_robin_between_chats_and_priority(self):
+        scheduler = LLMScheduler(max_concurrency=1)
+        release = asyncio.Event()
+        order = []
+
+        async def blocker():
+            await release.wait()
+
+        def call(name):
+            async def run():
+                order.append(name)
+            return run
+
+        first = asyncio.ensure_future(scheduler.run(1, blocker, LLMRequest(1, PRIORITY_INTERACTIVE)))
+        await started()
+        queued = [
+            scheduler.run(1, call("a1"), LLMRequest(1, PRIORITY_INTERACTIVE)),
+            scheduler.run(1, call("a2"), LLMRequest(1, PRIORITY_INTERACTIVE)),
+            scheduler.run(1, call("a3"), LLMRequest(1, PRIORITY_INTERACTIVE)),
+            scheduler.run(1, call("b1"), LLMRequest(2, PRIORITY_INTERACTIVE)),
+            scheduler.run(1, call("bg"), LLMRequest(3, PRIORITY_BACKGROUND)),
+            scheduler.run(1, call("c1"), LLMRequest(4, PRIORITY_INTERACTIVE)),
+        ]
+        tasks = [asyncio.ensure_future(coro) for coro in queued]
+        await started()
+        assert scheduler.stats.queued == 6
+
+        release.set()
+        await asyncio.gather(first, *tasks)
+
+        assert order == ["a1", "b1", "c1", "a2", "a3", "bg"]
+
+    async def test_full_queue_rejects(self):
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=1)
+        release = asyncio.Event()
+
+        async def blocker():
+            await release.wait()
+
+        running = asyncio.ensure_future(scheduler.run(1, blocker))
+        waiting = asyncio.ensure_future(scheduler.run(1, blocker))
+        await started()
+
+        assert scheduler.saturated
+        with pytest.raises(SchedulerBusy):
+            await scheduler.run(1, blocker)
+        with pytest.raises(SchedulerBusy):
+            scheduler.admit()
+        assert scheduler.stats.rejected == 2
+
+        release.set()
+        await asyncio.gather(running, waiting)
+        assert not scheduler.saturated
+
+    async def test_token_budget_delays_calls(self, monkeypatch):
+        monkeypatch.setattr("bot.llm_scheduler.TOKEN_WINDOW_SECONDS", 0.05)
+        scheduler = LLMScheduler(max_concurrency=4, tokens_per_minute=100)
+        loop = asyncio.get_running_loop()
+        starts = []
+
+        async def call():
+            starts.append(loop.time())
+
+        await asyncio.gather(scheduler.run(80, call), scheduler.run(80, call))
+
+        # The second call waits for the first one's tokens to leave the window
+        assert starts[1] - starts[0] >= 0.04
+        assert scheduler.stats.started == 2
+
+    async def test_oversized_call_runs_when_window_is_empty(self):
+        scheduler = LLMScheduler(max_concurrency=1, tokens_per_minute=100)
+
+        async def call():
+            return "ok"
+
+        assert await scheduler.run(500, call) == "ok"
+        assert scheduler.stats.tokens_last_minute == 500
+
+    async def test_cancelled_waiter_leaves_queue(self):
+        scheduler = LLMScheduler(max_concurrency=1)
+        release = asyncio.Event()
+
+        async def blocker():
+            await release.wait()
+
+        running = asyncio.ensure_future(scheduler.run(1, blocker))
+        waiting = asyncio.ensure_future(scheduler.run(1, blocker))
+        await started()
+        waiting.cancel()
+        await started()
+
+        assert scheduler.stats.queued == 0
+        release.set()
+        await running
+        assert scheduler.stats.running == 0
+
+    async def test_failed_call_frees_its_slot(self):
+        scheduler = LLMScheduler(max_concurrency=1)
+
+        async def fail():
+            raise RuntimeError("rate limited")
+
+        with pytest.raises(RuntimeError):
+            await scheduler.run(1, fail)
+        assert scheduler.stats.running == 0
@@ -66,3 +66,53 @@ class TestMessages:
         """Test unknown provider error."""
         msg = Messages.ai_unknown_provider_error("invalid_provider")
         assert "invalid_provider" in msg
+
+    def test_top_talkers(self):
+        """Test top talkers formatting."""
+        msg = Messages.top_talkers([("Alice", 42), ("Bob", 7)], 24)
+        assert "Alice" in msg
+        assert "42" in msg
+        assert "24" in msg
+
+    def test_activity_heatmap(self):
+        """Test heatmap rendering."""
+        heatmap = [[0] * 24 for _ in range(7)]
+        heatmap[0][9] = 10
+        heatmap[6][23] = 1
+        msg = Messages.activity_heatmap(heatmap, 30)
+        grid_rows = msg.split("```")[1].strip("\n").split("\n")
+        assert len(grid_rows) == 8
+        assert grid_rows[1][3 + 9] == "█"
+        assert grid_rows[7][3 + 23] == "░"
+        assert "10" in msg
+
+    def test_activity_heatmap_empty(self):
+        """Test heatmap without any activity."""
+        msg = Messages.activity_heatmap([[0] * 24 for _ in range(7)], 30)
+        assert "30" in msg
+
+
+class TestSearchResults:
+    """Test search result rendering."""
+
+    def test_snippet_markup_is_escaped(self):
+        """Test that message text is escaped and matches are bold."""
+        from datetime import datetime
+        from bot.models import SearchResult
+
+        result = SearchResult(
+            message_id=1,
+            user_id=5,
+            username=None,
+            timestamp=datetime(2025, 1, 1, 12, 0),
+            snippet="a <b> & \x02match\x03"
+        )
+        text = Messages.search_results("match", [result], 0)
+
+        assert "a &lt;b&gt; &amp; <b>match</b>" in text
+        assert "User5" in text
+
+    def test_empty_pages(self):
+        """Test messages for no results and for running past the last page."""
+        assert "ничего не найдено" in Messages.search_results("x", [], 0)
+        assert "Больше результатов" in Messages.search_results("x", [], 2)
@@ -0,0 +1,179 @@
+"""Unit tests for migrations module."""
+
+import sqlite3
+import pytest
+from bot.database import Database
+from bot.migrations import MIGRATIONS, Backfill, Migration, MigrationRunner, latest_version
+
+
+def make_pre_chat_id_db(path, rows=50):
+    """A database from before chat_id and the quiz pool existed."""
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            username VARCHAR,
+            message_text TEXT NOT NULL,
+            timestamp DATETIME NOT NULL
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO messages (user_id, username, message_text, timestamp) VALUES (?, ?, ?, datetime('now'))",
+        [(1, "Alice", f"a long enough message number {i}" if i % 2 else "short") for i in range(rows)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def query(path, sql):
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute(sql).fetchall()
+        conn.commit()
+        return rows
+    finally:
+        conn.close()
+
+
+class TestMigrationRunner:
+    """Test versioned migrations and batched backfills."""
+
+    def test_applies_in_order_and_records_versions(self, tmp_path):
+        path = str(tmp_path / "old.db")
+        make_pre_chat_id_db(path)
+        runner = MigrationRunner(path, batch_size=7, pause=0)
+
+        assert [m.version for m in runner.pending()] == [1, 2, 3, 4]
+        assert runner.run() == [1, 2, 3, 4]
+
+        assert runner.current_version() == latest_version()
+        assert runner.pending() == []
+        assert query(path, "SELECT count(*) FROM messages WHERE chat_id = 0") == [(50,)]
+        assert query(path, "SELECT count(*) FROM quiz_pool") == [(25,)]
+        assert query(path, "SELECT sum(message_count) FROM activity_hourly") == [(50,)]
+        assert query(path, "SELECT chat_id, user_id, username, message_count FROM chat_participants") == [(0, 1, "Alice", 50)]
+        assert runner.run() == []
+
+    def test_target_stops_early(self, tmp_path):
+        path = str(tmp_path / "old.db")
+        make_pre_chat_id_db(path)
+
+        assert MigrationRunner(path, pause=0).run(target=1) == [1]
+        assert [m.version for m in MigrationRunner(path).pending()] == [2, 3, 4]
+
+    def test_dry_run_estimates_without_changes(self, tmp_path):
+        """Test that the dry run counts rows and leaves the database untouched."""
+        path = str(tmp_path / "old.db")
+        make_pre_chat_id_db(path)
+        runner = MigrationRunner(path, batch_size=10, pause=0)
+
+        estimates = runner.estimate()
+
+        # The derived tables do not exist yet, so every message is counted
+        assert [(e.version, e.rows, e.batches, e.exact) for e in estimates] == [
+            (1, 0, 0, True), (2, 50, 5, False), (3, 50, 5, True), (4, 50, 5, True)
+        ]
+        assert estimates[1].seconds > 0
+        assert "chat_id" not in [row[1] for row in query(path, "PRAGMA table_info(messages)")]
+        assert runner.current_version() == 0
+        assert [m.version for m in runner.pending()] == [1, 2, 3, 4]
+        # Not even the bookkeeping tables were created
+        assert query(path, "SELECT name FROM sqlite_master WHERE name IN ('schema_version', 'maintenance_state')") == []
+
+    def test_dry_run_counts_pending_rows(self, tmp_path):
+        """Test that the dry run counts exactly once the pending clause can be evaluated."""
+        path = str(tmp_path / "old.db")
+        make_pre_chat_id_db(path)
+        query(path, "ALTER TABLE messages ADD COLUMN flagged INTEGER NOT NULL DEFAULT 0")
+        query(path, "UPDATE messages SET flagged = 1 WHERE id <= 20")
+        flag = Backfill(
+            table='messages',
+            apply="UPDATE messages SET flagged = 1 WHERE id > :low AND id <= :high",
+            pending="flagged = 0"
+        )
+        runner = MigrationRunner(path, migrations=[Migration(10, 'flag', backfill=flag)], batch_size=10)
+
+        [estimate] = runner.estimate()
+
+        assert (estimate.rows, estimate.batches, estimate.exact) == (30, 5, True)
+
+    async def test_rollup_backfill_keeps_live_counts(self, tmp_path):
+        """Test that messages the bot already counted are not counted again."""
+        path = str(tmp_path / "old.db")
+        make_pre_chat_id_db(path)
+        MigrationRunner(path, pause=0).run(target=2)
+
+        # The bot starts before the backfill and counts its own message
+        db = Database(path, write_behind=False)
+        await db.init_db()
+        await db.save_message(user_id=1, username="Alice", message_text="written while migrating", chat_id=0)
+        await db.close()
+        assert query(path, "SELECT sum(message_count) FROM activity_hourly") == [(1,)]
+
+        assert MigrationRunner(path, batch_size=7, pause=0).run() == [3, 4]
+
+        assert query(path, "SELECT sum(message_count) FROM activity_hourly") == [(51,)]
+        assert query(path, "SELECT message_count FROM chat_participants WHERE user_id = 1") == [(51,)]
+
+    def test_backfill_resumes_after_interruption(self, tmp_path):
+        """Test that a failed batch keeps the checkpoint of the ones before it."""
+        path = str(tmp_path / "old.db")
+        make_pre_chat_id_db(path)
+        MigrationRunner(path, pause=0).run(target=1)
+
+        query(path, "ALTER TABLE messages ADD COLUMN flagged INTEGER NOT NULL DEFAULT 0")
+
+        calls = []
+
+        def schema(conn):
+            calls.append(1)
+
+        flag = Backfill(
+            table='messages',
+            apply="UPDATE messages SET flagged = 1 WHERE id > :low AND id <= :high",
+            pending="flagged = 0"
+        )
+        # Fail from the third batch on, inside the batch transaction
+        query(path, """
+            CREATE TRIGGER interrupt BEFORE UPDATE OF flagged ON messages WHEN new.id > 20
+            BEGIN SELECT RAISE(ABORT, 'interrupted'); END
+        """)
+
+        runner = MigrationRunner(path, migrations=[Migration(10, 'flag', schema=schema, backfill=flag)],
+                                 batch_size=10, pause=0)
+        with pytest.raises(sqlite3.Error):
+            runner.run()
+
+        assert query(path, "SELECT count(*) FROM messages WHERE flagged = 1") == [(20,)]
+        assert query(path, "SELECT value FROM maintenance_state WHERE key = 'migration_10_last_id'") == [("20",)]
+
+        query(path, "DROP TRIGGER interrupt")
+        assert runner.run() == [10]
+        assert query(path, "SELECT count(*) FROM messages WHERE flagged = 1") == [(50,)]
+        assert query(path, "SELECT count(*) FROM maintenance_state WHERE key = 'migration_10_last_id'") == [(0,)]
+        assert len(calls) == 2
+
+
+class TestDatabaseVersion:
+    """Test how the bot treats schema_version on startup."""
+
+    async def test_fresh_database_is_stamped(self, tmp_path):
+        path = str(tmp_path / "fresh.db")
+        db = Database(path, write_behind=False)
+        await db.init_db()
+        await db.close()
+
+        assert MigrationRunner(path).current_version() == max(m.version for m in MIGRATIONS)
+
+    async def test_migrated_database_starts(self, tmp_path):
+        path = str(tmp_path / "old.db")
+        make_pre_chat_id_db(path)
+        MigrationRunner(path, pause=0).run()
+
+        db = Database(path, write_behind=False)
+        await db.init_db()
+        try:
+            assert await db.get_message_count(0) == 50
+        finally:
+            await db.close()
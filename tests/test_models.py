@@ -1,8 +1,8 @@
 """Unit tests for models module."""
 
 import pytest
-from datetime import datetime
-from bot.models import ChatMessage
+from datetime import datetime, timedelta
+from bot.models import ChatMessage, MessageBatch
 
 
 class TestChatMessage:
@@ -96,3 +96,67 @@ class TestChatMessage:
         str_repr = str(msg)
         assert "Dave" in str_repr
         assert "Test" in str_repr
+
+
+def make_messages():
+    start = datetime(2025, 1, 1, 12, 0, 0, 250000)
+    return [
+        ChatMessage(
+            user_id=i % 3,
+            message_text=f"сообщение {i} 🙂",
+            timestamp=start + timedelta(seconds=i // 2),
+            username=f"User{i % 3}" if i % 3 else None,
+            chat_id=456
+        )
+        for i in range(10)
+    ]
+
+
+class TestMessageBatch:
+    """Test the columnar MessageBatch container."""
+
+    def test_slotted_chat_message(self):
+        """Test that ChatMessage has no per-instance __dict__."""
+        assert not hasattr(make_messages()[0], "__dict__")
+
+    def test_round_trip(self):
+        """Test that items come back equal to the appended messages."""
+        messages = make_messages()
+        batch = MessageBatch.from_messages(messages)
+
+        assert len(batch) == 10
+        assert list(batch) == messages
+        assert batch[-1] == messages[-1]
+        with pytest.raises(IndexError):
+            batch[10]
+
+    def test_from_rows(self):
+        """Test building from rows in chat_message_columns order."""
+        ts = datetime(2025, 1, 1, 12, 0, 0)
+        batch = MessageBatch.from_rows([(1, "hi", ts, "Ann", 5), (2, "yo", ts, None, 5)])
+
+        assert batch.text(1) == "yo"
+        assert batch.timestamp(0) == ts
+        assert batch.display_name(1) == "User2"
+
+    def test_authors_are_interned(self):
+        """Test that repeated authors are stored once."""
+        batch = MessageBatch.from_messages(make_messages())
+
+        assert len(batch._authors) == 3
+        assert batch.display_names() == ["User0", "User1", "User2"]
+
+    def test_summary_lines_match_chat_message(self):
+        """Test that batch formatting matches ChatMessage.format_for_summary."""
+        messages = make_messages()
+        batch = MessageBatch.from_messages(messages)
+
+        assert list(batch.summary_lines()) == [msg.format_for_summary() for msg in messages]
+        assert batch.format_for_summary(3) == messages[3].format_for_summary()
+
+    def test_top_talkers(self):
+        """Test per-user counts and ranking."""
+        batch = MessageBatch.from_messages(make_messages())
+
+        assert batch.count_by_user() == {0: 4, 1: 3, 2: 3}
+        assert batch.top_talkers(limit=2) == [("User0", 4), ("User1", 3)]
@@ -0,0 +1,42 @@
+"""Unit tests for partitions module."""
+
+from datetime import datetime
+from bot.partitions import Partition, partition_name, period_end, period_start
+
+
+class TestPeriods:
+    """Test partition period boundaries."""
+
+    def test_day(self):
+        start = period_start(datetime(2024, 3, 5, 17, 30), "day")
+        assert start == datetime(2024, 3, 5)
+        assert period_end(start, "day") == datetime(2024, 3, 6)
+
+    def test_week_starts_on_monday(self):
+        start = period_start(datetime(2024, 3, 7, 9), "week")
+        assert start == datetime(2024, 3, 4)
+        assert period_end(start, "week") == datetime(2024, 3, 11)
+
+    def test_month_rolls_over_year(self):
+        start = period_start(datetime(2024, 12, 31, 23, 59), "month")
+        assert start == datetime(2024, 12, 1)
+        assert period_end(start, "month") == datetime(2025, 1, 1)
+
+    def test_name(self):
+        assert partition_name(datetime(2024, 3, 4)) == "messages_20240304"
+
+
+class TestPartition:
+    """Test partition range checks."""
+
+    def test_covers_is_half_open(self):
+        partition = Partition("messages_20240304", datetime(2024, 3, 4), datetime(2024, 3, 5))
+        assert partition.covers(datetime(2024, 3, 4))
+        assert not partition.covers(datetime(2024, 3, 5))
+
+    def test_overlaps(self):
+        partition = Partition("messages_20240304", datetime(2024, 3, 4), datetime(2024, 3, 5))
+        assert partition.overlaps(None, None)
+        assert partition.overlaps(datetime(2024, 3, 4, 12), None)
+        assert not partition.overlaps(datetime(2024, 3, 5), None)
+        assert not partition.overlaps(None, datetime(2024, 3, 4))
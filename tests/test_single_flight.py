@@ -0,0 +1,74 @@
+"""Unit tests for single_flight module."""
+
+import asyncio
+
+import pytest
+
+from bot.single_flight import SingleFlight
+
+
+class TestSingleFlight:
+    """Test coalescing of concurrent calls."""
+
+    async def test_concurrent_callers_share_result(self):
+        flight = SingleFlight()
+        runs = []
+
+        async def work():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            return "done"
+
+        results = await asyncio.gather(*(flight.do("key", work) for _ in range(4)))
+
+        assert results == ["done"] * 4
+        assert len(runs) == 1
+        assert flight.stats.executions == 1
+        assert flight.stats.coalesced == 3
+        assert flight.stats.coalesced_ratio == 0.75
+        assert flight.stats.in_flight == 0
+
+    async def test_distinct_keys_and_later_calls_run_again(self):
+        flight = SingleFlight()
+        runs = []
+
+        async def work():
+            runs.append(1)
+            await asyncio.sleep(0)
+            return len(runs)
+
+        await asyncio.gather(flight.do("a", work), flight.do("b", work))
+        await flight.do("a", work)
+
+        assert len(runs) == 3
+        assert flight.stats.coalesced == 0
+
+    async def test_exception_reaches_every_caller(self):
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("boom")
+
+        results = await asyncio.gather(flight.do("key", fail), flight.do("key", fail), return_exceptions=True)
+
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert flight.stats.in_flight == 0
+
+    async def test_cancelled_caller_does_not_cancel_others(self):
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return "done"
+
+        first = asyncio.ensure_future(flight.do("key", work))
+        second = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+
+        assert await second == "done"
+        with pytest.raises(asyncio.CancelledError):
+            await first
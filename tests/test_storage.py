@@ -0,0 +1,253 @@
+"""Conformance tests shared by every storage backend."""
+
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from bot.models import MessageIngest
+from bot.storage import create_storage
+
+# PostgreSQL runs only against a database given here, e.g. postgresql://postgres@localhost/bot_test
+POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+
+@pytest.fixture(params=["sqlite", "memory", "postgres"])
+async def storage(request, tmp_path):
+    if request.param == "sqlite":
+        from bot.database import Database
+        backend = Database(str(tmp_path / "conformance.db"), write_behind=False)
+    elif request.param == "memory":
+        backend = create_storage("memory://")
+    else:
+        if not POSTGRES_URL:
+            pytest.skip("TEST_POSTGRES_URL is not set")
+        pytest.importorskip("asyncpg")
+        backend = create_storage(POSTGRES_URL)
+
+    await backend.init_db()
+    if request.param == "postgres":
+        from bot.postgres_storage import TABLES
+        await backend.pool.execute(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY")
+
+    yield backend
+    await backend.close()
+
+
+def ago(**kwargs) -> datetime:
+    return datetime.now() - timedelta(**kwargs)
+
+
+class TestCreateStorage:
+    """Test backend selection from DB_PATH."""
+
+    # create_storage imports backends by bare module name, so compare class names
+
+    def test_memory_url(self):
+        assert type(create_storage("memory://")).__name__ == "MemoryStorage"
+
+    def test_file_path_is_sqlite(self, tmp_path):
+        assert type(create_storage(str(tmp_path / "bot.db"))).__name__ == "Database"
+
+    def test_postgres_url_needs_asyncpg(self):
+        try:
+            import asyncpg  # noqa: F401
+        except ImportError:
+            with pytest.raises(RuntimeError, match="asyncpg"):
+                create_storage("postgresql://localhost/bot")
+        else:
+            assert type(create_storage("postgresql://localhost/bot")).__name__ == "PostgresStorage"
+
+
+class TestMessages:
+    """Test message storage and history reads."""
+
+    async def test_messages_oldest_first_per_chat(self, storage):
+        await storage.save_message(1, "Alice", "second", 100, ts=ago(minutes=10))
+        await storage.save_message(2, "Bob", "first", 100, ts=ago(minutes=20))
+        await storage.save_message(3, "Eve", "other chat", 200, ts=ago(minutes=5))
+
+        messages = await storage.get_messages_since(100, 1)
+        assert [m.message_text for m in messages] == ["first", "second"]
+        assert [m.username for m in messages] == ["Bob", "Alice"]
+        assert all(m.chat_id == 100 for m in messages)
+        assert await storage.get_message_count(100) == 2
+        assert await storage.get_message_count() == 3
+
+    async def test_window_excludes_older_messages(self, storage):
+        await storage.save_message(1, "Alice", "old", 100, ts=ago(hours=5))
+        await storage.save_message(1, "Alice", "new", 100, ts=ago(minutes=5))
+
+        assert [m.message_text for m in await storage.get_messages_since(100, 2)] == ["new"]
+
+    async def test_stream_and_batch_match_list(self, storage):
+        for i in range(5):
+            await storage.save_message(1, "Alice", f"msg {i}", 100, ts=ago(minutes=30 - i))
+
+        listed = [m.message_text for m in await storage.get_messages_since(100, 1)]
+        streamed = [m.message_text async for m in storage.stream_messages_since(100, 1)]
+        batch = await storage.get_message_batch(100, 1)
+
+        assert streamed == listed
+        assert [m.message_text for m in batch] == listed
+
+
+class TestSummaries:
+    """Test the newest-message marker and stored summaries."""
+
+    async def test_last_message_id_changes_with_new_message(self, storage):
+        assert await storage.get_last_message_id(100, 1) is None
+        await storage.save_message(1, "Alice", "old", 100, ts=ago(hours=5))
+        assert await storage.get_last_message_id(100, 1) is None
+
+        await storage.save_message(1, "Alice", "first", 100, ts=ago(minutes=5))
+        first = await storage.get_last_message_id(100, 1)
+        await storage.save_message(2, "Bob", "other chat", 200, ts=ago(minutes=4))
+        assert await storage.get_last_message_id(100, 1) == first
+
+        await storage.save_message(1, "Alice", "second", 100, ts=ago(minutes=3))
+        assert await storage.get_last_message_id(100, 1) not in (None, first)
+
+    async def test_stored_summary(self, storage):
+        await storage.store_summary(100, 24, 7, "openai/gpt", "old")
+        await storage.store_summary(100, 24, 7, "openai/gpt", "summary")
+
+        assert await storage.get_stored_summary(100, 24, 7, "openai/gpt", created_after=ago(minutes=1)) == "summary"
+        assert await storage.get_stored_summary(100, 24, 8, "openai/gpt", created_after=ago(minutes=1)) is None
+        assert await storage.get_stored_summary(100, 24, 7, "openai/gpt", created_after=ago(minutes=-1)) is None
+
+
+    async def test_chunk_summaries(self, storage):
+        start = datetime(2025, 1, 1, 10)
+        await storage.store_chunk_summaries(100, 1, "openai/gpt", {start: "ten", start + timedelta(hours=1): ""})
+        await storage.store_chunk_summaries(100, 1, "openai/gpt", {start: "ten o'clock"})
+        await storage.store_chunk_summaries(100, 2, "openai/gpt", {start: "two hours"})
+
+        chunks = await storage.get_chunk_summaries(100, 1, "openai/gpt", start, start + timedelta(hours=2))
+        assert chunks == {start: "ten o'clock", start + timedelta(hours=1): ""}
+        assert await storage.get_chunk_summaries(100, 1, "openai/gpt", start, start) == {}
+        assert await storage.get_chunk_summaries(200, 1, "openai/gpt", start, start + timedelta(hours=2)) == {}
+
+class TestParticipants:
+    """Test the participant directory."""
+
+    async def test_unique_usernames_within_window(self, storage):
+        await storage.save_message(1, "Alice", "hi", 100, ts=ago(minutes=5))
+        await storage.save_message(1, "Alice", "again", 100, ts=ago(minutes=4))
+        await storage.save_message(2, "Bob", "long ago", 100, ts=ago(days=10))
+        await storage.save_message(3, "Eve", "elsewhere", 200, ts=ago(minutes=5))
+
+        assert sorted(await storage.get_chat_participants(100)) == ["Alice", "Bob"]
+        assert await storage.get_chat_participants(100, active_within_hours=24) == ["Alice"]
+
+
+class TestProfanity:
+    """Test profanity counters."""
+
+    async def test_counts_from_ingest_and_updates(self, storage):
+        await storage.ingest_message(MessageIngest(100, 1, "Alice", "text", ago(minutes=5), profanity_count=2))
+        await storage.update_profanity_count(1, "Alice", 100, 3)
+        await storage.update_profanity_count(2, "Bob", 100, 1)
+        await storage.update_profanity_count(3, "Eve", 200, 9)
+
+        assert await storage.get_profanity_stats(100) == [("Alice", 5), ("Bob", 1)]
+        assert await storage.get_profanity_stats(100, limit=1) == [("Alice", 5)]
+        assert await storage.get_user_profanity_count(1, 100) == 5
+        assert await storage.get_user_profanity_count(1, 200) == 0
+
+    async def test_username_follows_latest_message(self, storage):
+        await storage.update_profanity_count(1, "Alice", 100, 1)
+        await storage.update_quiz_score(1, "Alice", 100, correct=True)
+        await storage.save_message(1, "Alicia", "renamed", 100, ts=ago(minutes=1))
+
+        assert await storage.get_profanity_stats(100) == [("Alicia", 1)]
+        assert await storage.get_quiz_leaderboard(100) == [("Alicia", 1, 1)]
+
+
+class TestQuiz:
+    """Test quiz candidates and scores."""
+
+    async def test_random_message_is_eligible(self, storage):
+        await storage.save_message(1, "Alice", "/start", 100, ts=ago(minutes=3))
+        await storage.save_message(1, "Alice", "ok", 100, ts=ago(minutes=2))
+        await storage.save_message(2, "Bob", "a message long enough for the quiz", 100, ts=ago(minutes=1))
+
+        for _ in range(5):
+            message = await storage.get_random_message_for_quiz(100)
+            assert message.message_text == "a message long enough for the quiz"
+            assert message.username == "Bob"
+
+        assert await storage.get_random_message_for_quiz(200) is None
+
+    async def test_leaderboard(self, storage):
+        await storage.update_quiz_score(1, "Alice", 100, correct=True)
+        await storage.update_quiz_score(1, "Alice", 100, correct=False)
+        await storage.update_quiz_score(2, "Bob", 100, correct=True)
+        await storage.update_quiz_score(2, "Bob", 100, correct=True)
+        await storage.update_quiz_score(3, "Eve", 200, correct=True)
+
+        assert await storage.get_quiz_leaderboard(100) == [("Bob", 2, 2), ("Alice", 1, 2)]
+
+
+class TestActivity:
+    """Test activity counters, top talkers and the heatmap."""
+
+    async def test_activity_count(self, storage):
+        await storage.save_message(1, "Alice", "recent", 100, ts=ago(minutes=30))
+        await storage.save_message(2, "Bob", "recent too", 100, ts=ago(hours=2))
+        await storage.save_message(1, "Alice", "yesterday", 100, ts=ago(hours=30))
+
+        assert await storage.get_activity_count(100, 1) == 1
+        assert await storage.get_activity_count(100, 24) == 2
+        assert await storage.get_activity_count(200, 24) == 0
+
+    async def test_activity_count_outlives_retention(self, storage):
+        await storage.save_message(1, "Alice", "old", 100, ts=ago(days=40))
+        await storage.save_message(2, "Bob", "new", 100, ts=ago(minutes=5))
+        await storage.cleanup_old_messages(days=30)
+
+        # Counted from the hourly rollup, like the heatmap and top talkers
+        assert await storage.get_activity_count(100, 24 * 50) == 2
+
+    async def test_top_talkers_use_latest_username(self, storage):
+        for i in range(3):
+            await storage.save_message(1, "Alice", f"msg {i}", 100, ts=ago(hours=5, minutes=i))
+        await storage.save_message(1, "Alicia", "renamed", 100, ts=ago(minutes=1))
+        await storage.save_message(2, "Bob", "hi", 100, ts=ago(minutes=1))
+        await storage.save_message(2, "Bob", "old", 100, ts=ago(days=3))
+
+        assert await storage.get_top_talkers(100) == [("Alicia", 4), ("Bob", 2)]
+        assert await storage.get_top_talkers(100, limit=1) == [("Alicia", 4)]
+        assert await storage.get_top_talkers(100, hours=24) == [("Alicia", 4), ("Bob", 1)]
+
+    async def test_heatmap(self, storage):
+        monday_morning = datetime(2024, 1, 1, 9, 15)
+        sunday_night = datetime(2024, 1, 7, 23, 40)
+        await storage.save_message(1, "Alice", "a", 100, ts=monday_morning)
+        await storage.save_message(1, "Alice", "b", 100, ts=monday_morning + timedelta(minutes=5))
+        await storage.save_message(2, "Bob", "c", 100, ts=sunday_night)
+
+        heatmap = await storage.get_activity_heatmap(100)
+        assert len(heatmap) == 7 and all(len(row) == 24 for row in heatmap)
+        assert heatmap[0][9] == 2
+        assert heatmap[6][23] == 1
+        assert sum(map(sum, heatmap)) == 3
+        assert sum(map(sum, await storage.get_activity_heatmap(100, days=7))) == 0
+
+
+class TestCleanup:
+    """Test retention cleanup."""
+
+    async def test_old_messages_removed_counters_kept(self, storage):
+        await storage.save_message(1, "Alice", "an old message for the quiz", 100, ts=ago(days=40))
+        await storage.save_message(2, "Bob", "a new message for the quiz", 100, ts=ago(minutes=5))
+
+        stats = await storage.cleanup_old_messages(days=30)
+
+        assert stats.rows_deleted == 1
+        assert stats.completed
+        assert await storage.get_message_count(100) == 1
+        for _ in range(5):
+            assert (await storage.get_random_message_for_quiz(100)).username == "Bob"
+        # Rollups are not history, they survive retention
+        assert dict(await storage.get_top_talkers(100)) == {"Alice": 1, "Bob": 1}
@@ -0,0 +1,373 @@
+"""Unit tests for summarizer module."""
+
+import pytest
+from tenacity import wait_none
+from datetime import datetime, timedelta
+from bot.summarizer import Summarizer
+from bot.messages import Messages
+from bot.models import ChatMessage, MessageBatch
+from bot.tokens import estimate_tokens
+
+
+def make_messages(count):
+    start = datetime(2025, 1, 1, 12, 0, 0)
+    return [
+        ChatMessage(
+            user_id=i % 3,
+            message_text=f"message {i}",
+            timestamp=start + timedelta(minutes=i),
+            username=f"User{i % 3}" if i % 2 else None
+        )
+        for i in range(count)
+    ]
+
+
+async def aiter_list(items):
+    for item in items:
+        yield item
+
+
+@pytest.fixture(autouse=True)
+def no_retry_wait(monkeypatch):
+    monkeypatch.setattr(Summarizer._scheduled_call.retry, "wait", wait_none())
+
+
+@pytest.fixture
+def summarizer():
+    return Summarizer()
+
+
+class TestPromptBuilding:
+    """Test prompt construction."""
+
+    def test_prompt_from_lines(self, summarizer):
+        """Test that the prompt is the system prompt followed by one line per message."""
+        messages = make_messages(25)
+        lines = [m.format_for_summary() for m in messages]
+
+        prompt, count = summarizer.build_prompt(lines, 24)
+
+        assert prompt == Messages.ai_system_prompt(24) + "\n\n" + "\n".join(lines)
+        assert count == 25
+
+    def test_batch_lines_match_messages(self, summarizer):
+        """Test that a MessageBatch gives the same prompt as the messages it holds."""
+        messages = make_messages(25)
+        batch = MessageBatch.from_messages(messages)
+
+        assert summarizer.build_prompt(batch.summary_lines(), 24) == \
+            summarizer.build_prompt((m.format_for_summary() for m in messages), 24)
+
+
+class TestSummarizeChat:
+    """Test the cached /summary pipeline."""
+
+    async def test_repeat_request_served_from_cache(self, summarizer):
+        from bot.memory_storage import MemoryStorage
+        storage = MemoryStorage()
+        for msg in make_messages(3):
+            await storage.save_message(msg.user_id, msg.username, msg.message_text, 100, ts=datetime.now())
+
+        calls = []
+
+        async def fake_openai(prompt, max_tokens=None):
+            calls.append(prompt)
+            return f"summary {len(calls)}"
+
+        summarizer._summarize_openai = fake_openai
+
+        assert await summarizer.summarize_chat(storage, 100, 24) == "summary 1"
+        assert await summarizer.summarize_chat(storage, 100, 24) == "summary 1"
+        assert len(calls) == 1
+
+        # A new message changes the key
+        await storage.save_message(1, "Alice", "news", 100, ts=datetime.now())
+        assert await summarizer.summarize_chat(storage, 100, 24) == "summary 2"
+        assert summarizer.cache.stats.hits == 1
+
+    async def test_flat_mode_reads_a_batch(self, summarizer):
+        from bot.memory_storage import MemoryStorage
+        storage = MemoryStorage()
+        for msg in make_messages(5):
+            await storage.save_message(msg.user_id, msg.username, msg.message_text, 100, ts=datetime.now())
+        expected, _ = summarizer.build_prompt(
+            (m.format_for_summary() for m in await storage.get_messages_since(100, 24)), 24
+        )
+
+        batches = []
+        read_batch = storage.get_message_batch
+
+        async def spy(chat_id, hours):
+            batches.append(await read_batch(chat_id, hours))
+            return batches[-1]
+
+        prompts = []
+
+        async def fake_openai(prompt, max_tokens=None):
+            prompts.append(prompt)
+            return "summary"
+
+        storage.get_message_batch = spy
+        summarizer._summarize_openai = fake_openai
+        await summarizer.summarize_chat(storage, 100, 24)
+
+        assert len(batches[0]) == 5
+        assert prompts == [expected]
+
+    async def test_failures_not_cached(self, summarizer):
+        from bot.memory_storage import MemoryStorage
+        storage = MemoryStorage()
+        await storage.save_message(1, "Alice", "hello", 100, ts=datetime.now())
+
+        async def failing_openai(prompt, max_tokens=None):
+            raise RuntimeError("rate limited")
+
+        summarizer._summarize_openai = failing_openai
+        assert "rate limited" in await summarizer.summarize_chat(storage, 100, 24)
+        assert summarizer.cache.stats.entries == 0
+
+    async def test_each_attempt_is_scheduled(self, summarizer):
+        from bot.memory_storage import MemoryStorage
+        storage = MemoryStorage()
+        await storage.save_message(1, "Alice", "hello", 100, ts=datetime.now())
+        attempts = []
+
+        async def flaky_openai(prompt, max_tokens=None):
+            attempts.append(summarizer.scheduler.stats.running)
+            if len(attempts) < 3:
+                raise RuntimeError("rate limited")
+            return "summary"
+
+        summarizer._summarize_openai = flaky_openai
+        assert await summarizer.summarize_chat(storage, 100, 24) == "summary"
+
+        # Each attempt got its own slot and token charge, none is held between attempts
+        assert attempts == [1, 1, 1]
+        assert summarizer.scheduler.stats.started == 3
+        assert summarizer.scheduler.stats.running == 0
+
+    async def test_empty_window(self, summarizer):
+        from bot.memory_storage import MemoryStorage
+        assert "6" in await summarizer.summarize_chat(MemoryStorage(), 100, 6)
+
+    async def test_concurrent_requests_share_one_run(self, summarizer):
+        import asyncio
+        from bot.memory_storage import MemoryStorage
+        storage = MemoryStorage()
+        await storage.save_message(1, "Alice", "hello", 100, ts=datetime.now())
+
+        calls = []
+
+        async def slow_openai(prompt, max_tokens=None):
+            calls.append(prompt)
+            await asyncio.sleep(0.05)
+            return "summary"
+
+        summarizer._summarize_openai = slow_openai
+        results = await asyncio.gather(
+            *(summarizer.summarize_chat(storage, 100, 24) for _ in range(3)),
+            summarizer.summarize_chat(storage, 100, 6)
+        )
+
+        assert results == ["summary"] * 4
+        # The 6 hour window is a different key and runs on its own
+        assert len(calls) == 2
+        assert summarizer.single_flight.stats.coalesced == 2
+        assert summarizer.single_flight.stats.in_flight == 0
+
+    async def test_busy_scheduler_rejects_before_reading(self):
+        import asyncio
+        from bot.memory_storage import MemoryStorage
+        storage = MemoryStorage()
+        await storage.save_message(1, "Alice", "hello", 100, ts=datetime.now())
+        summarizer = Summarizer()
+        summarizer.scheduler.max_concurrency = 1
+        summarizer.scheduler.max_queue = 0
+        release = asyncio.Event()
+
+        async def blocked_openai(prompt, max_tokens=None):
+            await release.wait()
+            return "summary"
+
+        summarizer._summarize_openai = blocked_openai
+        first = asyncio.ensure_future(summarizer.summarize_chat(storage, 100, 24))
+        await asyncio.sleep(0.01)
+
+        # summarizer imports llm_scheduler by bare module name, so compare class names
+        with pytest.raises(Exception) as busy:
+            await summarizer.summarize_chat(storage, 100, 6)
+        assert type(busy.value).__name__ == "SchedulerBusy"
+        assert summarizer.scheduler.stats.rejected == 1
+
+        release.set()
+        assert await first == "summary"
+
+
+class TestHierarchicalSummary:
+    """Test summaries built from stored chunk summaries."""
+
+    def test_chunk_start_alignment(self):
+        from bot.summarizer import chunk_start
+        ts = datetime(2025, 1, 1, 13, 45, 12)
+
+        assert chunk_start(ts, 1) == datetime(2025, 1, 1, 13)
+        assert chunk_start(ts, 4) == datetime(2025, 1, 1, 12)
+        assert chunk_start(ts, 24) == datetime(2025, 1, 1)
+
+    async def test_closed_chunks_summarized_once(self):
+        from bot.memory_storage import MemoryStorage
+        from bot.summarizer import chunk_start
+        storage = MemoryStorage()
+        summarizer = Summarizer(mode="hierarchical", chunk_hours=1)
+
+        open_start = chunk_start(datetime.now(), 1)
+        await storage.save_message(1, "Alice", "breakfast plans", 100, ts=open_start - timedelta(hours=3, minutes=-10))
+        await storage.save_message(2, "Bob", "lunch plans", 100, ts=open_start - timedelta(hours=1, minutes=-10))
+        await storage.save_message(1, "Alice", "right now", 100, ts=datetime.now())
+
+        prompts = []
+
+        async def fake_openai(prompt, max_tokens=None):
+            prompts.append(prompt)
+            if "breakfast" in prompt and "lunch" not in prompt:
+                return "chunk about breakfast"
+            if "lunch" in prompt and "breakfast" not in prompt:
+                return "chunk about lunch"
+            return "final summary"
+
+        summarizer._summarize_openai = fake_openai
+
+        assert await summarizer.summarize_chat(storage, 100, 4) == "final summary"
+        # Two non-empty closed chunks and the final call, empty chunks cost nothing
+        assert len(prompts) == 3
+        final_prompt = prompts[-1]
+        assert "chunk about breakfast" in final_prompt
+        assert "chunk about lunch" in final_prompt
+        assert "right now" in final_prompt
+        assert "breakfast plans" not in final_prompt
+
+        await storage.save_message(2, "Bob", "one more", 100, ts=datetime.now())
+        prompts.clear()
+        assert await summarizer.summarize_chat(storage, 100, 4) == "final summary"
+        assert len(prompts) == 1
+        assert "chunk about lunch" in prompts[0] and "one more" in prompts[0]
+
+    async def test_failed_chunk_is_retried(self):
+        from bot.memory_storage import MemoryStorage
+        from bot.summarizer import chunk_start
+        storage = MemoryStorage()
+        summarizer = Summarizer(mode="hierarchical", chunk_hours=1)
+
+        open_start = chunk_start(datetime.now(), 1)
+        await storage.save_message(1, "Alice", "first chunk", 100, ts=open_start - timedelta(hours=2, minutes=-5))
+        await storage.save_message(2, "Bob", "second chunk", 100, ts=open_start - timedelta(hours=1, minutes=-5))
+
+        calls = []
+        # Fails every retry of the first request
+        failures = [RuntimeError("rate limited")] * 3
+
+        async def flaky_openai(prompt, max_tokens=None):
+            calls.append(prompt)
+            if "second chunk" in prompt and failures:
+                raise failures.pop()
+            return "ok"
+
+        summarizer._summarize_openai = flaky_openai
+
+        assert "rate limited" in await summarizer.summarize_chat(storage, 100, 3)
+        calls.clear()
+        assert await summarizer.summarize_chat(storage, 100, 3) == "ok"
+        # Only the failed chunk and the final summary
+        assert len(calls) == 2
+        assert "second chunk" in calls[0]
+
+    def test_unknown_mode(self):
+        with pytest.raises(ValueError):
+            Summarizer(mode="sometimes")
+
+
+class TestMapReduceSummary:
+    """Test token-budgeted map-reduce summaries."""
+
+    async def test_small_history_is_one_call(self):
+        summarizer = Summarizer(mode="map_reduce", chunk_tokens=10_000)
+        messages = make_messages(10)
+
+        prompt, count = await summarizer.build_map_reduce_prompt(aiter_list(messages), 24)
+        expected, _ = summarizer.build_prompt((m.format_for_summary() for m in messages), 24)
+
+        assert prompt == expected
+        assert count == 10
+
+    async def test_parts_split_on_message_boundaries(self):
+        import asyncio
+        summarizer = Summarizer(mode="map_reduce", chunk_tokens=60)
+        messages = make_messages(20)
+        part_prompts = []
+        running = 0
+        peak = 0
+
+        async def fake_openai(prompt, max_tokens=None):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            part_prompts.append(prompt)
+            return f"part {len(part_prompts)}"
+
+        summarizer._summarize_openai = fake_openai
+        summarizer.chunk_concurrency = 2
+
+        prompt, count = await summarizer.build_map_reduce_prompt(aiter_list(messages), 24)
+
+        assert count == 20
+        assert len(part_prompts) > 1
+        assert peak == 2
+        bodies = sorted(part.rsplit("\n\n", 1)[1] for part in part_prompts)
+        # Every message lands in exactly one part, whole and in order
+        assert "\n".join(bodies).split("\n") == [m.format_for_summary() for m in messages]
+        for body in bodies:
+            assert estimate_tokens(body) <= 60
+        assert "part 1" in prompt
+
+    async def test_chunk_limit_is_per_request(self):
+        import asyncio
+        summarizer = Summarizer(mode="map_reduce", chunk_tokens=60)
+        summarizer.chunk_concurrency = 1
+        running = 0
+        peak = 0
+
+        async def fake_openai(prompt, max_tokens=None):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return "part"
+
+        summarizer._summarize_openai = fake_openai
+        await asyncio.gather(
+            summarizer.build_map_reduce_prompt(aiter_list(make_messages(20)), 24),
+            summarizer.build_map_reduce_prompt(aiter_list(make_messages(20)), 24)
+        )
+
+        # One chunk call per request at a time, the requests do not share the limit
+        assert peak == 2
+
+    async def test_reduce_until_parts_fit(self):
+        summarizer = Summarizer(mode="map_reduce", chunk_tokens=40)
+        calls = []
+
+        async def fake_openai(prompt, max_tokens=None):
+            calls.append(prompt)
+            return "a short summary of this stretch"
+
+        summarizer._summarize_openai = fake_openai
+
+        prompt, _ = await summarizer.build_map_reduce_prompt(aiter_list(make_messages(40)), 24)
+
+        summaries = prompt.split(Messages.ai_chunk_summaries_header(), 1)[1]
+        # Part summaries were combined again before the final prompt
+        assert summaries.count("a short summary") < len(calls)
+        assert estimate_tokens(summaries) <= 40
@@ -0,0 +1,45 @@
+"""Unit tests for summary_cache module."""
+
+from bot.memory_storage import MemoryStorage
+from bot.summary_cache import SummaryCache
+
+
+class TestSummaryCache:
+    """Test the summary cache and its persisted tier."""
+
+    async def test_hit_after_put(self):
+        storage = MemoryStorage()
+        cache = SummaryCache(max_entries=10, ttl=60)
+
+        assert await cache.get(storage, 100, 24, 7, "openai/gpt") is None
+        await cache.put(storage, 100, 24, 7, "openai/gpt", "summary")
+
+        assert await cache.get(storage, 100, 24, 7, "openai/gpt") == "summary"
+        # Another window, newest message or model is a different summary
+        assert await cache.get(storage, 100, 12, 7, "openai/gpt") is None
+        assert await cache.get(storage, 100, 24, 8, "openai/gpt") is None
+        assert await cache.get(storage, 100, 24, 7, "anthropic/claude") is None
+
+        stats = cache.stats
+        assert stats.hits == 1
+        assert stats.misses == 4
+        assert stats.hit_ratio == 0.2
+
+    async def test_persisted_summary_survives_restart(self):
+        storage = MemoryStorage()
+        await SummaryCache(max_entries=10, ttl=60, persist=True).put(storage, 100, 24, 7, "openai/gpt", "summary")
+
+        restarted = SummaryCache(max_entries=10, ttl=60, persist=True)
+        assert await restarted.get(storage, 100, 24, 7, "openai/gpt") == "summary"
+        assert await restarted.get(storage, 100, 24, 7, "openai/gpt") == "summary"
+
+        stats = restarted.stats
+        assert stats.hits == 2
+        assert stats.stored_hits == 1
+        assert stats.misses == 0
+
+    async def test_not_persisted_by_default(self):
+        storage = MemoryStorage()
+        await SummaryCache(max_entries=10, ttl=60).put(storage, 100, 24, 7, "openai/gpt", "summary")
+
+        assert await SummaryCache(max_entries=10, ttl=60, persist=True).get(storage, 100, 24, 7, "openai/gpt") is None
@@ -0,0 +1,17 @@
+"""Unit tests for tokens module."""
+
+from bot.tokens import estimate_tokens
+
+
+class TestEstimateTokens:
+    """Test the tokenizer-free token estimate."""
+
+    def test_empty(self):
+        assert estimate_tokens("") == 0
+
+    def test_latin_about_four_chars_per_token(self):
+        assert estimate_tokens("a" * 400) == 100
+
+    def test_cyrillic_counts_more_per_letter(self):
+        assert estimate_tokens("ж" * 400) == 200
+        assert estimate_tokens("ж") == 1
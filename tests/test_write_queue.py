@@ -0,0 +1,128 @@
+"""Unit tests for write_queue module."""
+
+import asyncio
+import pytest
+from bot.write_queue import WriteBehindQueue
+
+
+class TestWriteBehindQueue:
+    """Test WriteBehindQueue batching."""
+
+    async def test_flush_on_batch_size(self):
+        """Test that reaching batch size triggers a flush."""
+        batches = []
+
+        async def sink(items):
+            batches.append(list(items))
+
+        queue = WriteBehindQueue(sink, batch_size=3, flush_interval_ms=60_000)
+        queue.start()
+        for i in range(3):
+            queue.put(i)
+        await asyncio.sleep(0.05)
+
+        assert batches == [[0, 1, 2]]
+        assert len(queue) == 0
+        await queue.stop()
+
+    async def test_flush_on_interval(self):
+        """Test that pending items are flushed after the interval."""
+        batches = []
+
+        async def sink(items):
+            batches.append(list(items))
+
+        queue = WriteBehindQueue(sink, batch_size=100, flush_interval_ms=20)
+        queue.start()
+        queue.put("a")
+        await asyncio.sleep(0.1)
+
+        assert batches == [["a"]]
+        await queue.stop()
+
+    async def test_stop_drains_queue(self):
+        """Test that stop() flushes remaining items."""
+        batches = []
+
+        async def sink(items):
+            batches.append(list(items))
+
+        queue = WriteBehindQueue(sink, batch_size=100, flush_interval_ms=60_000)
+        queue.start()
+        queue.put(1)
+        queue.put(2)
+        await queue.stop()
+
+        assert batches == [[1, 2]]
+        assert queue.stats.flushed_rows == 2
+        assert queue.stats.flush_count == 1
+
+    async def test_failed_flush_requeues(self):
+        """Test that a failed flush keeps the batch for the next attempt."""
+        calls = []
+
+        async def sink(items):
+            calls.append(list(items))
+            if len(calls) == 1:
+                raise RuntimeError("disk full")
+
+        queue = WriteBehindQueue(sink, batch_size=100, flush_interval_ms=60_000)
+        queue.put(1)
+        with pytest.raises(RuntimeError):
+            await queue.flush()
+        queue.put(2)
+        await queue.flush()
+
+        assert calls == [[1], [1, 2]]
+        assert queue.stats.failed_flushes == 1
+        assert queue.stats.queue_depth == 0
+
+    async def test_stats_track_depth(self):
+        """Test queue depth counters."""
+        async def sink(items):
+            pass
+
+        queue = WriteBehindQueue(sink, batch_size=100, flush_interval_ms=60_000)
+        for i in range(5):
+            queue.put(i)
+        assert queue.stats.queue_depth == 5
+        await queue.flush()
+        assert queue.stats.queue_depth == 0
+        assert queue.stats.max_queue_depth == 5
+        assert queue.stats.avg_batch_size == 5
+
+    async def test_stop_during_slow_flush_keeps_batch(self):
+        """Test that stop() waits for a running flush instead of losing its batch."""
+        stored = []
+        flushing = asyncio.Event()
+
+        async def slow_sink(items):
+            flushing.set()
+            await asyncio.sleep(0.05)
+            stored.extend(items)
+
+        queue = WriteBehindQueue(slow_sink, batch_size=2, flush_interval_ms=60_000)
+        queue.start()
+        queue.put(1)
+        queue.put(2)
+        await flushing.wait()
+        queue.put(3)
+        await queue.stop()
+
+        assert stored == [1, 2, 3]
+        assert len(queue) == 0
+
+    async def test_cancelled_flush_requeues(self):
+        """Test that a flush cancelled from outside puts its batch back."""
+        async def hanging_sink(items):
+            await asyncio.sleep(60)
+
+        queue = WriteBehindQueue(hanging_sink, batch_size=100, flush_interval_ms=60_000)
+        queue.put(1)
+        flush = asyncio.ensure_future(queue.flush())
+        await asyncio.sleep(0.01)
+        flush.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await flush
+
+        assert len(queue) == 1